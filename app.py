@@ -1,16 +1,41 @@
+import os
+import click
 from flask import Flask, flash, session
+from werkzeug.security import generate_password_hash
 from routes import register_routes
-import sqlite3
 from routes import UserSession
+from python_scripts import db_pool, metrics
+from python_scripts.migrations import run_migrations
+from python_scripts.payment_proxy import rebuild_balances
+from python_scripts.conversations import rebuild_conversations
+from python_scripts.rollups import rebuild_rollups
+from python_scripts.ratings import rebuild_ratings
+from python_scripts.unread_counters import read_counters, rebuild_counters
+from python_scripts import bulk_loader
 
 app = Flask(__name__)
 app.secret_key = 'key_here' 
 
 # Database Initialization
-DATABASE = "database.db"
+DATABASE = os.environ.get("DRIVESHARE_DB", "database.db")
+app.config["DATABASE"] = DATABASE
+app.config["DATABASE_POOL_SIZE"] = int(os.environ.get("DRIVESHARE_DB_POOL_SIZE", 8))
+app.config["METRICS_ENABLED"] = os.environ.get("DRIVESHARE_METRICS", "1") != "0"
+app.config["METRICS_TOKEN"] = os.environ.get("DRIVESHARE_METRICS_TOKEN") or None
+if os.environ.get("DRIVESHARE_METRICS_ADDRS"):
+    app.config["METRICS_ALLOWED_ADDRS"] = tuple(addr.strip() for addr in os.environ["DRIVESHARE_METRICS_ADDRS"].split(","))
+# Hash parameters for new passwords; stored hashes made with other parameters
+# are upgraded on the user's next login. PASSWORD_HASH_WORKERS = 0 hashes inline.
+app.config["PASSWORD_HASH_METHOD"] = os.environ.get("DRIVESHARE_PASSWORD_HASH", "pbkdf2:sha256")
+app.config["PASSWORD_HASH_WORKERS"] = int(os.environ.get("DRIVESHARE_PASSWORD_WORKERS", os.cpu_count() or 1))
+# Live-update streams per worker; each holds a thread under the threaded server.
+if os.environ.get("DRIVESHARE_SSE_MAX_STREAMS"):
+    app.config["SSE_MAX_STREAMS"] = int(os.environ["DRIVESHARE_SSE_MAX_STREAMS"])
+db_pool.init_app(app)
+metrics.init_app(app)
 
 def init_db():
-    with sqlite3.connect(DATABASE) as conn:
+    with db_pool.pool.connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS users (
@@ -82,13 +107,13 @@ def init_db():
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS payments (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                booking_id INTEGER NOT NULL,
+                booking_id INTEGER,
                 payer_id INTEGER NOT NULL,
                 payee_id INTEGER NOT NULL,
                 amount REAL NOT NULL,
                 timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 is_confirmed BOOLEAN DEFAULT 1,
-                FOREIGN KEY(booking_id) REFERENCES bookings(id),
+                FOREIGN KEY(booking_id) REFERENCES bookings(id) ON DELETE SET NULL,
                 FOREIGN KEY(payer_id) REFERENCES users(id),
                 FOREIGN KEY(payee_id) REFERENCES users(id)
             );
@@ -96,13 +121,13 @@ def init_db():
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS reviews (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                booking_id INTEGER NOT NULL,
+                booking_id INTEGER,
                 reviewer_id INTEGER NOT NULL,
                 reviewee_id INTEGER NOT NULL,
                 rating INTEGER CHECK (rating BETWEEN 1 AND 5),
                 comment TEXT,
                 timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(booking_id) REFERENCES bookings(id),
+                FOREIGN KEY(booking_id) REFERENCES bookings(id) ON DELETE SET NULL,
                 FOREIGN KEY(reviewer_id) REFERENCES users(id),
                 FOREIGN KEY(reviewee_id) REFERENCES users(id)
             );
@@ -128,10 +153,86 @@ def init_db():
             );
         ''')
         conn.commit()
+        run_migrations(conn)
+
+@app.cli.command("init-db")
+def init_db_command():
+    init_db()
+    print("Database initialized.")
+
+@app.cli.command("rebuild-balances")
+def rebuild_balances_command():
+    with db_pool.pool.connection() as conn:
+        rebuild_balances(conn)
+    print("Balances rebuilt from the ledger.")
+
+@app.cli.command("rebuild-counters")
+def rebuild_counters_command():
+    with db_pool.pool.connection() as conn:
+        with conn:
+            rebuild_counters(conn)
+            rebuild_conversations(conn)
+    print("Unread counters and conversations rebuilt.")
+
+@app.cli.command("rebuild-rollups")
+def rebuild_rollups_command():
+    with db_pool.pool.connection() as conn:
+        with conn:
+            rebuild_rollups(conn)
+    print("Daily earnings and utilization rollups rebuilt from confirmed bookings.")
+
+@app.cli.command("rebuild-ratings")
+def rebuild_ratings_command():
+    with db_pool.pool.connection() as conn:
+        with conn:
+            rebuild_ratings(conn)
+    print("User and car rating aggregates rebuilt from reviews.")
+
+@app.cli.command("bulk-load")
+@click.option("--file", "files", multiple=True, metavar="TABLE=PATH",
+              help="Load a table from a .csv or .jsonl file. Repeatable.")
+@click.option("--generate", "generate", multiple=True, metavar="TABLE=COUNT",
+              help="Generate synthetic rows for a table. Repeatable.")
+@click.option("--seed", default=1, show_default=True, help="Random seed for generated rows.")
+@click.option("--password", default=bulk_loader.DEFAULT_PASSWORD, show_default=True,
+              help="Password given to users that have none in the source.")
+def bulk_load_command(files, generate, seed, password):
+    def pairs(options, convert):
+        parsed = {}
+        for option in options:
+            table, sep, value = option.partition("=")
+            if not sep:
+                raise click.BadParameter(f"expected TABLE=VALUE, got {option!r}")
+            parsed[table] = convert(value)
+        return parsed
+
+    sources = bulk_loader.synthetic(pairs(generate, int), seed=seed)
+    sources.update(bulk_loader.file_sources(pairs(files, str)))
+    if not sources:
+        raise click.UsageError("Nothing to load; pass --file and/or --generate.")
+    init_db()
+    # Hashed once and shared by every loaded user without a password.
+    password_hash = generate_password_hash(password)
+    with db_pool.pool.connection() as conn:
+        try:
+            counts, seconds = bulk_loader.load(conn, sources, password_hash)
+        except bulk_loader.LoadError as e:
+            raise click.ClickException(f"{e} (nothing was loaded)")
+    for table, count in counts.items():
+        print(f"{table}: {count} rows")
+    print(f"Loaded in {seconds:.1f}s.")
 
 @app.context_processor
 def inject_user_session():
-    return dict(is_authenticated=UserSession.get_instance().is_authenticated())
+    user = UserSession.get_instance()
+    unread_notifications = unread_messages = 0
+    if user.is_authenticated():
+        unread_notifications, unread_messages = read_counters(db_pool.get_db(), user.user_id)
+    return dict(
+        is_authenticated=user.is_authenticated(),
+        unread_notifications=unread_notifications,
+        unread_messages=unread_messages
+    )
 register_routes(app)
 
 if __name__ == '__main__':
@@ -0,0 +1,103 @@
+# Availability bitmap benchmark: AvailabilityBitmap.free_cars, which ANDs each
+# candidate's Python-int bitmap with the date mask, versus the same check on a
+# NumPy matrix of packed 64-bit words (one row per car) gathered and ANDed in
+# one vectorized operation.
+#
+#   python -m benchmarks.bench_bitmap --batches 84,404,10000,100000
+#
+# find_cars checks candidates in batches of 4 * (limit + 1): 84 ids for the
+# default page and 404 at most. Needs no database; the NumPy column is left
+# out when NumPy is not installed. Prints the median microseconds per call
+# as JSON.
+import argparse
+import json
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from python_scripts.availability_bitmap import AvailabilityBitmap
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+WORD = 64
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Python-int versus NumPy packed availability bitmaps.")
+    parser.add_argument("--cars", type=int, default=200000)
+    parser.add_argument("--batches", default="84,404,10000,100000", help="comma separated candidate counts")
+    parser.add_argument("--busy", type=float, default=0.3, help="share of cars with bookings in the window")
+    parser.add_argument("--days", type=int, default=3, help="length of the searched date range")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+def build_bitmap(cars, busy, rng, today):
+    bitmap = AvailabilityBitmap()
+    bitmap._base = today.toordinal()
+    for car_id in range(1, cars + 1):
+        if rng.random() < busy:
+            for _ in range(rng.randint(1, 6)):
+                start = today + timedelta(days=rng.randint(0, bitmap.horizon_days - 1))
+                bitmap.mark_busy(car_id, start.isoformat(), (start + timedelta(days=rng.randint(0, 6))).isoformat())
+    return bitmap
+
+
+def packed(bitmap, cars):
+    # Row car_id holds the car's bits as little-endian 64-bit words.
+    words = -(-bitmap.horizon_days // WORD)
+    matrix = numpy.zeros((cars + 1, words), dtype=numpy.uint64)
+    for car_id, bits in bitmap._bits.items():
+        for word in range(words):
+            matrix[car_id, word] = (bits >> (word * WORD)) & (2 ** WORD - 1)
+    return matrix
+
+
+def median_us(run, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings) * 1e6, 1)
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    today = date.today()
+    bitmap = build_bitmap(args.cars, args.busy, rng, today)
+    matrix = packed(bitmap, args.cars) if numpy is not None else None
+    start = today + timedelta(days=10)
+    start_date, end_date = start.isoformat(), (start + timedelta(days=args.days - 1)).isoformat()
+    offset = start.toordinal() - bitmap._base
+    mask = ((1 << args.days) - 1) << offset
+    if matrix is not None:
+        mask_words = numpy.array(
+            [(mask >> (word * WORD)) & (2 ** WORD - 1) for word in range(matrix.shape[1])], dtype=numpy.uint64
+        )
+
+    def numpy_free(car_ids):
+        ids = numpy.fromiter(car_ids, dtype=numpy.intp, count=len(car_ids))
+        busy = (matrix[ids] & mask_words).any(axis=1)
+        return ids[~busy].tolist()
+
+    results = []
+    for batch in (int(value) for value in args.batches.split(",")):
+        car_ids = rng.sample(range(1, args.cars + 1), batch)
+        row = {"batch": batch, "int_us": median_us(lambda: bitmap.free_cars(car_ids, start_date, end_date), args.repeat)}
+        if matrix is not None:
+            assert numpy_free(car_ids) == bitmap.free_cars(car_ids, start_date, end_date)
+            row["numpy_us"] = median_us(lambda: numpy_free(car_ids), args.repeat)
+        results.append(row)
+
+    print(json.dumps({"cars": args.cars, "days": args.days, "numpy": numpy is not None, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# Login throughput benchmark for the password hashing pool.
+#
+#   python -m benchmarks.bench_passwords --threads 16 --logins 400 --workers 0,1,2,4
+#
+# Drives POST /login through Flask's test client from a pool of threads, once
+# per hashing-worker count (0 = hash inline on the request thread), and prints
+# logins/sec, logins/sec per core used, latency percentiles and how many
+# requests were shed with 503 as JSON. Runs against a scratch database.
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.bench_routes import percentiles
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Login throughput benchmark for the password hashing pool.")
+    parser.add_argument("--threads", type=int, default=16, help="concurrent request threads")
+    parser.add_argument("--logins", type=int, default=400, help="timed logins per configuration")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--workers", default="0,1,2,4", help="comma separated hashing-worker counts to compare")
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help="hashes queued or running before /login answers 503 (default: 4 per worker)")
+    parser.add_argument("--method", default="pbkdf2:sha256", help="werkzeug hash method, e.g. pbkdf2:sha256:600000")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="driveshare-bench-")
+    os.environ["DRIVESHARE_DB"] = os.path.join(workdir, "bench.db")
+
+    # Import after DRIVESHARE_DB is set so the app points at the scratch file.
+    import app as driveshare
+    from werkzeug.security import generate_password_hash
+    from python_scripts.db_pool import pool
+    from python_scripts.password_hasher import password_hasher
+
+    app = driveshare.app
+    driveshare.init_db()
+    # Every user shares one hash: verification cost is the same either way.
+    password_hash = generate_password_hash("bench", args.method)
+    with pool.connection() as conn:
+        with conn:
+            conn.executemany(
+                "INSERT INTO users (email, password, security_q1, security_q2, security_q3, full_name) VALUES (?, ?, '', '', '', ?)",
+                [(f"user{i}@bench", password_hash, f"User {i}") for i in range(args.users)],
+            )
+
+    cores = os.cpu_count() or 1
+    local = threading.local()
+    results = {}
+    for workers in [int(value) for value in args.workers.split(",") if value.strip()]:
+        password_hasher.configure(method=args.method, workers=workers, max_pending=args.max_pending)
+        # Start the pool processes before timing.
+        password_hasher.verify(password_hash, "bench")
+        lock = threading.Lock()
+        latencies = []
+        statuses = {}
+
+        def login(n):
+            if not hasattr(local, "client"):
+                local.client = app.test_client()
+            started = time.perf_counter()
+            response = local.client.post("/login", data={"email": f"user{n % args.users}@bench", "password": "bench"})
+            elapsed = time.perf_counter() - started
+            with lock:
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                if response.status_code == 302:
+                    latencies.append(elapsed)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            list(executor.map(login, range(args.logins)))
+        wall = time.perf_counter() - started
+        # Inline hashing runs on the request threads, which share one GIL.
+        cores_used = min(max(workers, 1), cores)
+        throughput = len(latencies) / wall if wall else 0.0
+        results[str(workers)] = {
+            "logins": len(latencies),
+            "shed_503": statuses.get(503, 0),
+            "other_statuses": {str(code): count for code, count in statuses.items() if code not in (302, 503)},
+            "logins_per_sec": round(throughput, 1),
+            "cores_used": cores_used,
+            "logins_per_sec_per_core": round(throughput / cores_used, 1),
+            "latency_ms": percentiles(latencies) if latencies else None,
+        }
+        # Leave the next configuration a fresh pool.
+        password_hasher.configure(workers=0)
+
+    print(json.dumps({
+        "method": args.method,
+        "cpu_count": cores,
+        "threads": args.threads,
+        "logins_per_configuration": args.logins,
+        "workers": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
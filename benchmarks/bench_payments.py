@@ -0,0 +1,114 @@
+# Concurrent checkout benchmark for the ledger payment engine.
+#
+#   python -m benchmarks.bench_payments --threads 8 --checkouts 2000
+#
+# Runs against a scratch database (never database.db) and prints JSON.
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Concurrent checkout benchmark for the payment engine.")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--checkouts", type=int, default=2000)
+    parser.add_argument("--renters", type=int, default=200)
+    parser.add_argument("--cars", type=int, default=500)
+    parser.add_argument("--contention", type=float, default=0.0,
+                        help="fraction of checkouts that target an already requested car/date")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="driveshare-bench-")
+    os.environ["DRIVESHARE_DB"] = os.path.join(workdir, "bench.db")
+
+    # Import after DRIVESHARE_DB is set so the app points at the scratch file.
+    import app as driveshare
+    from python_scripts.db_pool import pool
+    from python_scripts.payment_proxy import PaymentProxy, PaymentError
+
+    driveshare.init_db()
+    with pool.connection() as conn:
+        with conn:
+            conn.executemany(
+                "INSERT INTO users (id, email, password, security_q1, security_q2, security_q3, full_name) VALUES (?, ?, 'x', '', '', '', ?)",
+                [(i, f"user{i}@bench", f"User {i}") for i in range(1, args.renters + 2)],
+            )
+            conn.executemany(
+                "INSERT INTO cars (id, owner_id, model, make, year, mileage, price, location) VALUES (?, 1, 'Model', 'Make', 2020, 1000, 25.0, 'Detroit')",
+                [(i,) for i in range(1, args.cars + 1)],
+            )
+        proxy = PaymentProxy()
+        for renter_id in range(2, args.renters + 2):
+            proxy.deposit(conn, renter_id, 1_000_000)
+
+    base = date.today() + timedelta(days=1)
+    jobs = []
+    for n in range(args.checkouts):
+        if jobs and n / args.checkouts < args.contention:
+            jobs.append(dict(jobs[-1], renter_id=2 + n % args.renters))
+            continue
+        day = base + timedelta(days=n // args.cars)
+        jobs.append({
+            "car_id": 1 + n % args.cars,
+            "renter_id": 2 + n % args.renters,
+            "owner_id": 1,
+            "start_date": day.isoformat(),
+            "end_date": day.isoformat(),
+            "total_cost": 25.0,
+        })
+
+    results = {"ok": 0, "rejected": 0}
+    latencies = []
+    lock = threading.Lock()
+
+    def checkout(job):
+        proxy = PaymentProxy()
+        started = time.perf_counter()
+        with pool.connection() as conn:
+            try:
+                proxy.pay(conn, job)
+                outcome = "ok"
+            except PaymentError:
+                outcome = "rejected"
+        elapsed = time.perf_counter() - started
+        with lock:
+            results[outcome] += 1
+            latencies.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        list(executor.map(checkout, jobs))
+    wall = time.perf_counter() - started
+
+    with pool.connection() as conn:
+        totals = conn.execute("SELECT SUM(amount_cents), COUNT(*) FROM ledger").fetchone()
+        drift = conn.execute('''
+            SELECT COUNT(*) FROM users
+            WHERE balance_cents != (SELECT COALESCE(SUM(amount_cents), 0) FROM ledger WHERE ledger.user_id = users.id)
+        ''').fetchone()[0]
+
+    latencies.sort()
+    pick = lambda q: round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 3)
+    print(json.dumps({
+        "threads": args.threads,
+        "checkouts": args.checkouts,
+        "confirmed": results["ok"],
+        "rejected": results["rejected"],
+        "checkouts_per_sec": round(len(jobs) / wall, 1),
+        "latency_ms": {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)},
+        "ledger_sum_cents": totals[0],
+        "ledger_entries": totals[1],
+        "balances_out_of_sync": drift,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+# Load benchmark for the hot routes: /search (by text and nearest-first by
+# coordinates), /booking/<id>, /payment/pending, /inbox and /notifications.
+#
+#   python -m benchmarks.bench_routes --users 100000 --cars 200000 --bookings 1000000 --blocks 250000
+#
+# Seeds a scratch database with deterministic synthetic data, then drives each
+# route through Flask's test client from a pool of worker threads and prints
+# throughput and latency percentiles per route as JSON. Pass --db to keep the
+# seeded database and reuse it on later runs: each run works on a fresh copy,
+# so results from different commits are measured against exactly the same data.
+import argparse
+import itertools
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+ROUTES = ("search", "search_near", "booking", "payment", "inbox", "notifications")
+OK_STATUSES = (200, 302, 304)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load benchmark for the hot Flask routes.")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--cars", type=int, default=4000)
+    parser.add_argument("--bookings", type=int, default=20000)
+    parser.add_argument("--blocks", type=int, default=5000, help="owner-blocked date ranges")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--notifications", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=500, help="timed requests per route")
+    parser.add_argument("--warmup", type=int, default=50, help="untimed requests per route")
+    parser.add_argument("--routes", default=",".join(ROUTES), help="comma separated subset of " + ", ".join(ROUTES))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", help="database file to seed, or to reuse if it already exists")
+    return parser.parse_args()
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    pick = lambda q: round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 3)
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+def main():
+    args = parse_args()
+    routes = [name.strip() for name in args.routes.split(",") if name.strip()]
+    unknown = set(routes) - set(ROUTES)
+    if unknown:
+        raise SystemExit(f"Unknown routes: {', '.join(sorted(unknown))}")
+
+    database = args.db or os.path.join(tempfile.mkdtemp(prefix="driveshare-bench-"), "bench.db")
+    reuse = os.path.exists(database)
+    os.environ["DRIVESHARE_DB"] = database
+
+    # Import after DRIVESHARE_DB is set so the app points at the scratch file.
+    import app as driveshare
+    from werkzeug.security import generate_password_hash
+    from python_scripts.db_pool import pool
+    from python_scripts.notification_queue import notification_writer
+    from python_scripts.session_store import session_store
+    from python_scripts import bulk_loader
+    from python_scripts.bulk_loader import CITIES, CITY_COORDINATES, CITY_SPREAD, MAKES
+
+    app = driveshare.app
+    driveshare.init_db()
+    today = date.today()
+    seed_seconds = 0.0
+    with pool.connection() as conn:
+        if not reuse:
+            sources = bulk_loader.synthetic({
+                "users": args.users, "cars": args.cars, "bookings": args.bookings,
+                "availability_blocks": args.blocks, "messages": args.messages,
+                "notifications": args.notifications,
+            }, seed=args.seed, today=today, balance_cents=10_000_000)
+            _, seed_seconds = bulk_loader.load(conn, sources, generate_password_hash("bench"))
+    if args.db:
+        # Checkouts write to the database; keep the seeded file untouched.
+        copy = os.path.join(tempfile.mkdtemp(prefix="driveshare-bench-"), "run.db")
+        with sqlite3.connect(database) as source, sqlite3.connect(copy) as target:
+            source.backup(target)
+        app.config["DATABASE"] = copy
+        pool.configure(copy)
+    with pool.connection() as conn:
+        counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                  for table in ("users", "cars", "bookings", "availability_blocks", "messages", "notifications")}
+        car_count = counts["cars"]
+        # Checkouts book dates past anything seeded so they never conflict.
+        first_free_day = date.fromisoformat(
+            conn.execute("SELECT COALESCE(MAX(end_date), ?) FROM bookings", (today.isoformat(),)).fetchone()[0]
+        ) + timedelta(days=1)
+
+    # One logged-in test client per worker thread, each as a different user.
+    local = threading.local()
+    user_ids = itertools.count(1)
+    lock = threading.Lock()
+
+    def client():
+        if not hasattr(local, "client"):
+            with lock:
+                user_id = next(user_ids)
+            with pool.connection() as conn:
+                sid = session_store.create(conn, user_id, f"user{user_id}@example.test", None)
+            local.client = app.test_client()
+            with local.client.session_transaction() as sess:
+                sess["sid"] = sid
+        return local.client
+
+    def search(n):
+        rng = random.Random(args.seed * 1_000_003 + n)
+        params = {"location": rng.choice(CITIES)[:rng.randint(3, 6)]}
+        if rng.random() < 0.5:
+            params["make"] = rng.choice(MAKES)
+        if rng.random() < 0.5:
+            start = today + timedelta(days=rng.randint(0, 60))
+            params["start"] = start.isoformat()
+            params["end"] = (start + timedelta(days=rng.randint(0, 6))).isoformat()
+        return [("search", lambda c: c.get("/search", query_string=params))]
+
+    def search_near(n):
+        rng = random.Random(args.seed * 1_000_003 + n)
+        lat, lng = CITY_COORDINATES[rng.choice(CITIES)]
+        params = {
+            "lat": round(lat + rng.uniform(-CITY_SPREAD, CITY_SPREAD), 5),
+            "lng": round(lng + rng.uniform(-CITY_SPREAD, CITY_SPREAD), 5),
+            "radius_km": rng.choice((5, 10, 25, 50)),
+        }
+        if rng.random() < 0.5:
+            params["make"] = rng.choice(MAKES)
+        if rng.random() < 0.5:
+            start = today + timedelta(days=rng.randint(0, 60))
+            params["start"] = start.isoformat()
+            params["end"] = (start + timedelta(days=rng.randint(0, 6))).isoformat()
+        return [("search_near", lambda c: c.get("/search", query_string=params))]
+
+    checkouts = itertools.count()
+
+    def checkout(n):
+        with lock:
+            k = next(checkouts)
+        car_id = 1 + k % car_count
+        day = (first_free_day + timedelta(days=k // car_count)).isoformat()
+        return [
+            ("booking", lambda c: c.post(f"/booking/{car_id}", data={"start_date": day, "end_date": day})),
+            ("payment", lambda c: c.post("/payment/pending")),
+        ]
+
+    def page(path):
+        return lambda n: [(path.strip("/"), lambda c: c.get(path))]
+
+    phases = [
+        ("search", search),
+        ("search_near", search_near),
+        ("booking", checkout),
+        ("inbox", page("/inbox")),
+        ("notifications", page("/notifications")),
+    ]
+
+    results = {}
+
+    def run(phase, count, timed):
+        latencies = {}
+        errors = {}
+
+        def one(n):
+            c = client()
+            for route, call in phase(n):
+                started = time.perf_counter()
+                response = call(c)
+                elapsed = time.perf_counter() - started
+                if timed:
+                    with lock:
+                        latencies.setdefault(route, []).append(elapsed)
+                        if response.status_code not in OK_STATUSES:
+                            errors[route] = errors.get(route, 0) + 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            list(executor.map(one, range(count)))
+        return time.perf_counter() - started, latencies, errors
+
+    for name, phase in phases:
+        # The booking phase also covers the payment route it hands off to.
+        wanted = [route for route in routes if route == name or (name == "booking" and route == "payment")]
+        if not wanted:
+            continue
+        run(phase, args.warmup, timed=False)
+        wall, latencies, errors = run(phase, args.requests, timed=True)
+        for route in wanted:
+            samples = latencies.get(route, [])
+            results[route] = {
+                "requests": len(samples),
+                "errors": errors.get(route, 0),
+                "throughput_rps": round(len(samples) / wall, 1) if wall else None,
+                "latency_ms": percentiles(samples) if samples else None,
+            }
+    notification_writer.flush()
+    with pool.connection() as conn:
+        confirmed = conn.execute("SELECT COUNT(*) FROM bookings").fetchone()[0] - counts["bookings"]
+
+    print(json.dumps({
+        "database": database,
+        "reused_database": reuse,
+        "seed_seconds": round(seed_seconds, 2),
+        "rows": counts,
+        "threads": args.threads,
+        "requests_per_route": args.requests,
+        "routes": results,
+        "confirmed_checkouts": confirmed,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
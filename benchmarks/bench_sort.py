@@ -0,0 +1,107 @@
+# Sorted-search benchmark: one page of sorted results taken by fully sorting
+# the candidates versus the search index's bounded-heap top-k (and, for price,
+# its walk over the sorted price index).
+#
+#   python -m benchmarks.bench_sort --candidates 10000,100000,1000000
+#
+# Fills an in-process search index with synthetic cars (no database), then for
+# each candidate count, share of the cars matching the filters and sort order
+# times the first page and a page deep into the results. Prints the median
+# milliseconds per page as JSON.
+import argparse
+import itertools
+import json
+import random
+import statistics
+import time
+
+from python_scripts.search_index import CarSearchIndex
+
+SORTS = ("price", "rating", "year", "mileage")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Full sort versus top-k for sorted search pages.")
+    parser.add_argument("--candidates", default="10000,100000,1000000", help="comma separated candidate counts")
+    parser.add_argument("--share", default="1",
+                        help="comma separated shares of the indexed cars that match, e.g. 0.1 for 'in Detroit'")
+    parser.add_argument("--sorts", default=",".join(SORTS), help="comma separated subset of " + ", ".join(SORTS))
+    parser.add_argument("--limit", type=int, default=20, help="page size")
+    parser.add_argument("--depth", type=int, default=500, help="rows before the deep page")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+def build_index(cars, rng):
+    index = CarSearchIndex()
+    # In price order, as CarSearchIndex.load reads them, so the price index is appended to.
+    prices = sorted((round(rng.uniform(20, 300), 2), car_id) for car_id in range(1, cars + 1))
+    for price, car_id in prices:
+        # Most cars have a few ratings; some have none.
+        ratings = rng.randint(1, 40) if rng.random() < 0.6 else 0
+        index.add_car(
+            car_id, "", "", "", price,
+            rating_count=ratings, rating_sum=rng.randint(ratings, 5 * ratings),
+            year=rng.randint(2000, 2025), mileage=rng.randint(0, 200000),
+        )
+    return index
+
+
+def median_ms(run, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings) * 1000, 3)
+
+
+def main():
+    args = parse_args()
+    sorts = [name.strip() for name in args.sorts.split(",") if name.strip()]
+    unknown = set(sorts) - set(SORTS)
+    if unknown:
+        raise SystemExit(f"Unknown sorts: {', '.join(sorted(unknown))}")
+    rng = random.Random(args.seed)
+    limit = args.limit + 1
+    results = []
+
+    for candidates in (int(value) for value in args.candidates.split(",")):
+        for share in (float(value) for value in args.share.split(",")):
+            # candidates cars match out of candidates / share indexed ones.
+            index = build_index(int(candidates / share), rng)
+            car_ids = set(rng.sample(range(1, len(index.price.prices) + 1), candidates))
+            for sort in sorts:
+                values = index.sort_values[sort]
+                full = sorted((values[car_id], car_id) for car_id in car_ids)
+                deep = full[min(args.depth, len(full) - 1)]
+
+                # Builds the same (value, id) pairs as the top-k, then sorts them all.
+                def full_sort(after):
+                    keys = zip(map(values.get, car_ids), car_ids)
+                    if after is not None:
+                        keys = filter(after.__lt__, keys)
+                    return sorted(keys)[:limit]
+
+                def top_k(after):
+                    return list(itertools.islice(index._top(car_ids, values, after, limit), limit))
+
+                def planned(after):
+                    return list(itertools.islice(index.ordered(car_ids, sort, after, limit), limit))
+
+                assert full_sort(deep) == top_k(deep) == planned(deep)
+                row = {"candidates": candidates, "share": share, "sort": sort}
+                for page, after in (("first", None), ("deep", deep)):
+                    row[page] = {
+                        "full_sort_ms": median_ms(lambda: full_sort(after), args.repeat),
+                        "top_k_ms": median_ms(lambda: top_k(after), args.repeat),
+                        "planned_ms": median_ms(lambda: planned(after), args.repeat),
+                    }
+                results.append(row)
+
+    print(json.dumps({"limit": args.limit, "depth": args.depth, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
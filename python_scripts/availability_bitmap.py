@@ -0,0 +1,109 @@
+import threading
+from datetime import date
+
+from python_scripts.availability_engine import to_day, from_day
+from python_scripts.search_changes import ChangeCursor
+
+DEFAULT_HORIZON_DAYS = 180
+
+
+# One bitmap per car covering the next `horizon_days` days. Bit i is set when
+# the car is booked or blocked on day (base + i). The bitmaps are plain Python
+# ints, so checking a whole date range is a single AND against a mask.
+# find_cars checks at most a few hundred candidates per call, where these ANDs
+# are as fast as gathering rows from a packed NumPy matrix (slower at the
+# default 84 ids) and only ~1.3x slower at 100k ids; see benchmarks/bench_bitmap.py.
+class AvailabilityBitmap:
+    def __init__(self, horizon_days=DEFAULT_HORIZON_DAYS):
+        self.horizon_days = horizon_days
+        self._lock = threading.RLock()
+        self._base = None
+        self._bits = {}
+        self.changes = ChangeCursor()
+
+    @property
+    def _last(self):
+        return self._base + self.horizon_days - 1
+
+    def load(self, conn, today=None):
+        with self._lock:
+            self.changes.start(conn)
+            self._base = (today or date.today()).toordinal()
+            self._bits = {}
+            self._load_window(conn, self._base, self._last)
+
+    def ensure_current(self, conn, today=None):
+        # Moves the window to start today, then catches up with the cars
+        # other workers changed.
+        today = (today or date.today()).toordinal()
+        with self._lock:
+            if self._base is None or today - self._base >= self.horizon_days or today < self._base:
+                self.load(conn, date.fromordinal(today))
+                return
+            if today != self._base:
+                # Slide the window forward: drop the days that passed and load
+                # only the days that just came into range.
+                shift = today - self._base
+                old_last = self._last
+                self._base = today
+                self._bits = {car_id: bits >> shift for car_id, bits in self._bits.items() if bits >> shift}
+                self._load_window(conn, old_last + 1, self._last)
+            changed = self.changes.pending(conn)
+            if changed is None:
+                self.load(conn, date.fromordinal(today))
+            elif changed:
+                for car_id in changed:
+                    self._bits.pop(car_id, None)
+                self._load_window(conn, self._base, self._last, changed)
+
+    def _load_window(self, conn, first, last, car_ids=None):
+        where, params = "", ()
+        if car_ids is not None:
+            params = tuple(car_ids)
+            where = f"AND car_id IN ({', '.join('?' for _ in params)})"
+        bookings = conn.execute(f'''
+            SELECT car_id, start_date, end_date FROM bookings
+            WHERE status = 'confirmed' AND start_date <= ? AND end_date >= ? {where}
+        ''', (from_day(last), from_day(first)) + params)
+        for car_id, start_date, end_date in bookings:
+            self._mark(car_id, start_date, end_date, first, last)
+        blocks = conn.execute(f'''
+            SELECT car_id, start_date, end_date FROM availability_blocks
+            WHERE start_date <= ? AND end_date >= ? {where}
+        ''', (from_day(last), from_day(first)) + params)
+        for car_id, start_date, end_date in blocks:
+            self._mark(car_id, start_date, end_date, first, last)
+
+    def _mark(self, car_id, start_date, end_date, first=None, last=None):
+        try:
+            start, end = to_day(start_date), to_day(end_date)
+        except (TypeError, ValueError):
+            return
+        start = max(start, self._base if first is None else first)
+        end = min(end, self._last if last is None else last)
+        if end < start:
+            return
+        mask = ((1 << (end - start + 1)) - 1) << (start - self._base)
+        self._bits[car_id] = self._bits.get(car_id, 0) | mask
+
+    def mark_busy(self, car_id, start_date, end_date=None):
+        with self._lock:
+            if self._base is not None:
+                self._mark(car_id, start_date, end_date or start_date)
+
+    def remove_car(self, car_id):
+        with self._lock:
+            self._bits.pop(car_id, None)
+
+    def covers(self, start_date, end_date):
+        return self._base is not None and self._base <= to_day(start_date) and to_day(end_date) <= self._last
+
+    def free_cars(self, car_ids, start_date, end_date):
+        start, end = to_day(start_date), to_day(end_date)
+        mask = ((1 << (end - start + 1)) - 1) << (start - self._base)
+        with self._lock:
+            bits = self._bits
+            return [car_id for car_id in car_ids if not bits.get(car_id, 0) & mask]
+
+
+availability_bitmap = AvailabilityBitmap()
@@ -0,0 +1,221 @@
+# Owner-blocked dates, stored as merged inclusive ranges in availability_blocks
+# (one row per run of blocked days instead of one row per day).
+import calendar
+import re
+from datetime import date
+
+from python_scripts.availability_engine import to_day, from_day
+
+# Upper bounds for a single submission, so a typo cannot expand into years of rows.
+MAX_SPAN_DAYS = 2 * 366
+MAX_RANGES = 500
+
+WEEKDAYS = {
+    "monday": 0, "mon": 0, "tuesday": 1, "tue": 1, "tues": 1, "wednesday": 2, "wed": 2,
+    "thursday": 3, "thu": 3, "thur": 3, "thurs": 3, "friday": 4, "fri": 4,
+    "saturday": 5, "sat": 5, "sunday": 6, "sun": 6,
+}
+DAY_GROUPS = {
+    "day": range(7),
+    "weekday": range(5),
+    "weekend": (5, 6),
+}
+MONTHS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): number for number, name in enumerate(calendar.month_abbr) if name})
+
+RANGE_PATTERN = re.compile(r"^(\S+)\s*(?:\.\.|\s(?:to|through|thru|-)\s)\s*(\S+)$", re.IGNORECASE)
+# The word that ends a recurring pattern's list of days.
+UNTIL_PATTERN = re.compile(r"\s(?:through|thru|until|till|to)\s", re.IGNORECASE)
+RECURRING_PATTERN = re.compile(
+    r"^every\s+(?P<days>.+?)(?:\s+from\s+(?P<start>\S+))?\s+(?:through|thru|until|till|to)\s+(?P<end>.+)$",
+    re.IGNORECASE,
+)
+
+
+def merge(ranges):
+    # Sorts (start, end) day pairs and merges the ones that overlap or touch.
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _parse_date(text):
+    try:
+        return to_day(text)
+    except ValueError:
+        raise ValueError(f"'{text}' is not a date; use YYYY-MM-DD.")
+
+
+def _parse_until(text, today):
+    # An ISO date, or a month name ("March", "March 2026") meaning the end of
+    # the next such month.
+    text = text.strip()
+    if re.match(r"^\d{4}-\d{2}-\d{2}$", text):
+        return _parse_date(text)
+    parts = text.lower().split()
+    month = MONTHS.get(parts[0]) if parts else None
+    if month is None or len(parts) > 2 or (len(parts) == 2 and not parts[1].isdigit()):
+        raise ValueError(f"'{text}' is not a date or month.")
+    if len(parts) == 2:
+        year = int(parts[1])
+    else:
+        year = today.year if month >= today.month else today.year + 1
+    return date(year, month, calendar.monthrange(year, month)[1]).toordinal()
+
+
+def _parse_weekdays(text):
+    weekdays = set()
+    for word in re.split(r"\s*(?:,|/|&|\+|\band\b)\s*|\s+", text.lower()):
+        if not word:
+            continue
+        singular = word[:-1] if word.endswith("s") and word[:-1] in WEEKDAYS.keys() | DAY_GROUPS.keys() else word
+        if singular in DAY_GROUPS:
+            weekdays.update(DAY_GROUPS[singular])
+        elif singular in WEEKDAYS:
+            weekdays.add(WEEKDAYS[singular])
+        else:
+            raise ValueError(f"'{word}' is not a day of the week.")
+    return weekdays
+
+
+def _recurring(match, today):
+    weekdays = _parse_weekdays(match.group("days"))
+    start = _parse_date(match.group("start")) if match.group("start") else today.toordinal()
+    end = _parse_until(match.group("end"), today)
+    if end < start:
+        raise ValueError(f"'{match.group(0)}' ends before it starts.")
+    if end - start > MAX_SPAN_DAYS:
+        raise ValueError(f"'{match.group(0)}' spans more than {MAX_SPAN_DAYS} days.")
+    return merge(
+        (day, day) for day in range(start, end + 1) if date.fromordinal(day).weekday() in weekdays
+    )
+
+
+def _entries(text):
+    # Splits on semicolons, new lines and commas, except the commas inside a
+    # recurring pattern's list of days ("every Mon, Wed through March").
+    entries = []
+    for line in re.split(r"[;\n]", text):
+        pending = None
+        for piece in line.split(","):
+            if pending is not None:
+                piece = pending + "," + piece
+            if piece.lower().split()[:1] == ["every"] and not UNTIL_PATTERN.search(piece):
+                pending = piece
+                continue
+            pending = None
+            entries.append(piece)
+        if pending is not None:
+            entries.append(pending)
+    return entries
+
+
+def parse_blocks(text, today=None):
+    # Accepts a list separated by commas, semicolons or new lines, where each item is
+    #   2025-04-06                          a single day
+    #   2025-04-06 to 2025-04-12            a range ("..", "through" and " - " also work)
+    #   every weekend through March         a recurring pattern; also e.g.
+    #   every Mon and Wed from 2025-05-01 until 2025-06-30
+    # and returns the merged (start, end) day ordinals.
+    today = today or date.today()
+    ranges = []
+    for item in _entries(text):
+        item = " ".join(item.split())
+        if not item:
+            continue
+        recurring = RECURRING_PATTERN.match(item)
+        if recurring:
+            ranges.extend(_recurring(recurring, today))
+            continue
+        span = RANGE_PATTERN.match(item)
+        if span:
+            start, end = _parse_date(span.group(1)), _parse_date(span.group(2))
+            if end < start:
+                raise ValueError(f"'{item}' ends before it starts.")
+            if end - start > MAX_SPAN_DAYS:
+                raise ValueError(f"'{item}' spans more than {MAX_SPAN_DAYS} days.")
+            ranges.append((start, end))
+            continue
+        day = _parse_date(item)
+        ranges.append((day, day))
+    merged = merge(ranges)
+    if len(merged) > MAX_RANGES:
+        raise ValueError(f"That is {len(merged)} separate blocks; the limit is {MAX_RANGES} per save.")
+    return merged
+
+
+def save_blocks(conn, car_id, ranges):
+    # Merges the new ranges into the car's existing blocks in one transaction
+    # and returns the ranges that were written.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        existing = conn.execute(
+            "SELECT id, start_date, end_date FROM availability_blocks WHERE car_id = ?", (car_id,)
+        ).fetchall()
+        current = {}
+        for block_id, start_date, end_date in existing:
+            current.setdefault((to_day(start_date), to_day(end_date)), []).append(block_id)
+        merged = merge(list(current) + list(ranges))
+        keep = set(merged)
+        # Rows swallowed by a larger range, plus exact duplicates, are removed.
+        stale = [ids[0] for key, ids in current.items() if key not in keep]
+        stale += [block_id for ids in current.values() for block_id in ids[1:]]
+        added = [block for block in merged if block not in current]
+        if stale:
+            conn.execute(
+                f"DELETE FROM availability_blocks WHERE id IN ({', '.join('?' for _ in stale)})", stale
+            )
+        if added:
+            conn.execute(
+                "INSERT INTO availability_blocks (car_id, start_date, end_date) VALUES "
+                + ", ".join("(?, ?, ?)" for _ in added),
+                [value for start, end in added for value in (car_id, from_day(start), from_day(end))],
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return added
+
+
+# Merges overlapping or adjacent blocks per car (gaps-and-islands over the
+# running maximum end date). Used after bulk inserts of raw blocks.
+COMPACT_BLOCKS = [
+    "DROP TABLE IF EXISTS temp.merged_blocks",
+    '''
+        CREATE TEMP TABLE merged_blocks AS
+        WITH ordered AS (
+            SELECT car_id, julianday(start_date) AS s, julianday(end_date) AS e,
+                   MAX(julianday(end_date)) OVER (
+                       PARTITION BY car_id ORDER BY julianday(start_date), julianday(end_date)
+                       ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                   ) AS previous_end
+            FROM availability_blocks
+        ),
+        grouped AS (
+            SELECT car_id, s, e,
+                   SUM(CASE WHEN previous_end IS NULL OR s > previous_end + 1 THEN 1 ELSE 0 END) OVER (
+                       PARTITION BY car_id ORDER BY s, e ROWS UNBOUNDED PRECEDING
+                   ) AS island
+            FROM ordered
+        )
+        SELECT car_id, date(MIN(s)) AS start_date, date(MAX(e)) AS end_date
+        FROM grouped GROUP BY car_id, island
+    ''',
+    "DELETE FROM availability_blocks",
+    '''
+        INSERT INTO availability_blocks (car_id, start_date, end_date)
+        SELECT car_id, start_date, end_date FROM temp.merged_blocks ORDER BY car_id, start_date
+    ''',
+    "DROP TABLE temp.merged_blocks",
+]
+
+
+def compact_blocks(conn):
+    for statement in COMPACT_BLOCKS:
+        conn.execute(statement)
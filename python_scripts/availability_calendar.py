@@ -0,0 +1,54 @@
+# Free/busy calendars for one or more cars over a date window, returned as
+# run-length-encoded spans: [["free", 5], ["booked", 3], ["blocked", 2], ...].
+# The runs start at the window's first day and add up to its length.
+from python_scripts.availability_engine import to_day
+
+FREE = "free"
+BOOKED = "booked"
+BLOCKED = "blocked"
+DEFAULT_WINDOW_DAYS = 60
+MAX_WINDOW_DAYS = 366
+MAX_CARS = 100
+
+
+def busy_spans(conn, car_ids, start_date, end_date):
+    # Confirmed bookings and owner blocks that touch the window, per car.
+    placeholders = ", ".join("?" for _ in car_ids)
+    rows = conn.execute(f'''
+        SELECT car_id, start_date, end_date, 'booked' FROM bookings
+        WHERE car_id IN ({placeholders}) AND status = 'confirmed' AND start_date <= ? AND end_date >= ?
+        UNION ALL
+        SELECT car_id, start_date, end_date, 'blocked' FROM availability_blocks
+        WHERE car_id IN ({placeholders}) AND start_date <= ? AND end_date >= ?
+    ''', [*car_ids, end_date, start_date, *car_ids, end_date, start_date])
+    spans = {car_id: [] for car_id in car_ids}
+    for car_id, span_start, span_end, kind in rows:
+        try:
+            spans[car_id].append((to_day(span_start), to_day(span_end), kind))
+        except ValueError:
+            continue
+    return spans
+
+
+def run_length(spans, first, last):
+    # A day that is both booked and blocked shows as booked.
+    days = [FREE] * (last - first + 1)
+    for kind in (BLOCKED, BOOKED):
+        for start, end, span_kind in spans:
+            if span_kind != kind:
+                continue
+            for day in range(max(start, first), min(end, last) + 1):
+                days[day - first] = kind
+    runs = []
+    for state in days:
+        if runs and runs[-1][0] == state:
+            runs[-1][1] += 1
+        else:
+            runs.append([state, 1])
+    return runs
+
+
+def calendars(conn, car_ids, start_date, end_date):
+    first, last = to_day(start_date), to_day(end_date)
+    spans = busy_spans(conn, car_ids, start_date, end_date)
+    return {car_id: run_length(car_spans, first, last) for car_id, car_spans in spans.items()}
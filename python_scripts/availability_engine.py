@@ -0,0 +1,153 @@
+import bisect
+import threading
+from datetime import date
+
+from python_scripts.search_changes import ChangeCursor
+
+BOOKED = "booked"
+BLOCKED = "blocked"
+
+
+def to_day(value):
+    return date.fromisoformat(value).toordinal()
+
+
+def from_day(day):
+    return date.fromordinal(day).isoformat()
+
+
+class IntervalSet:
+    # Sorted, disjoint, inclusive day ranges. Because the ranges never overlap,
+    # both lists are sorted and lookups are a single bisect.
+    __slots__ = ("starts", "ends")
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, start, end):
+        # Merge with every range that overlaps or touches [start, end].
+        lo = bisect.bisect_left(self.ends, start - 1)
+        hi = bisect.bisect_right(self.starts, end + 1)
+        if lo < hi:
+            start = min(start, self.starts[lo])
+            end = max(end, self.ends[hi - 1])
+        self.starts[lo:hi] = [start]
+        self.ends[lo:hi] = [end]
+
+    def overlaps(self, start, end):
+        i = bisect.bisect_left(self.ends, start)
+        return i < len(self.starts) and self.starts[i] <= end
+
+    def conflicts(self, start, end):
+        i = bisect.bisect_left(self.ends, start)
+        found = []
+        while i < len(self.starts) and self.starts[i] <= end:
+            found.append((max(start, self.starts[i]), min(end, self.ends[i])))
+            i += 1
+        return found
+
+
+# Per-car index of confirmed bookings and owner blocks, kept in memory so the
+# booking page never scans a car's full history.
+class AvailabilityEngine:
+    def __init__(self):
+        self._cars = {}
+        self._lock = threading.RLock()
+        # Held while reading from the database, so lookups are not blocked meanwhile.
+        self._sync_lock = threading.Lock()
+        self._loaded = False
+        self.changes = ChangeCursor()
+
+    @classmethod
+    def _read(cls, conn, car_ids=None):
+        # {car_id: ranges} for every car, or for car_ids only.
+        cars = {}
+        where, params = "", ()
+        if car_ids is not None:
+            params = tuple(car_ids)
+            where = f"AND car_id IN ({', '.join('?' for _ in params)})"
+        bookings = conn.execute(f'''
+            SELECT car_id, start_date, end_date FROM bookings
+            WHERE status = 'confirmed' {where}
+            ORDER BY car_id, start_date
+        ''', params)
+        for car_id, start_date, end_date in bookings:
+            cls._add(cars, car_id, BOOKED, start_date, end_date)
+        blocks = conn.execute(f'''
+            SELECT car_id, start_date, end_date FROM availability_blocks
+            WHERE 1 = 1 {where}
+            ORDER BY car_id, start_date
+        ''', params)
+        for car_id, start_date, end_date in blocks:
+            cls._add(cars, car_id, BLOCKED, start_date, end_date)
+        return cars
+
+    def load(self, conn):
+        changes = ChangeCursor()
+        changes.start(conn)
+        cars = self._read(conn)
+        with self._lock:
+            self._cars = cars
+            self.changes = changes
+            self._loaded = True
+
+    def ensure_loaded(self, conn):
+        # Loads on first use, then catches up with the cars other workers changed.
+        with self._sync_lock:
+            changed = self.changes.pending(conn) if self._loaded else None
+            if changed is None:
+                self.load(conn)
+            elif changed:
+                cars = self._read(conn, changed)
+                with self._lock:
+                    for car_id in changed:
+                        self._cars.pop(car_id, None)
+                    self._cars.update(cars)
+
+    @staticmethod
+    def _add(cars, car_id, kind, start_date, end_date):
+        try:
+            start, end = to_day(start_date), to_day(end_date)
+        except (TypeError, ValueError):
+            # Free-text dates could never match a booking range; ignore them.
+            return
+        if end < start:
+            return
+        ranges = cars.setdefault(car_id, {BOOKED: IntervalSet(), BLOCKED: IntervalSet()})
+        ranges[kind].add(start, end)
+
+    def add_booking(self, car_id, start_date, end_date):
+        with self._lock:
+            self._add(self._cars, car_id, BOOKED, start_date, end_date)
+
+    def add_block(self, car_id, start_date, end_date=None):
+        with self._lock:
+            self._add(self._cars, car_id, BLOCKED, start_date, end_date or start_date)
+
+    def remove_car(self, car_id):
+        with self._lock:
+            self._cars.pop(car_id, None)
+
+    def conflicts(self, car_id, start_date, end_date, kind):
+        start, end = to_day(start_date), to_day(end_date)
+        with self._lock:
+            ranges = self._cars.get(car_id)
+            if ranges is None:
+                return []
+            found = ranges[kind].conflicts(start, end)
+        return [(from_day(s), from_day(e)) for s, e in found]
+
+    def is_free(self, car_id, start_date, end_date):
+        start, end = to_day(start_date), to_day(end_date)
+        with self._lock:
+            ranges = self._cars.get(car_id)
+            if ranges is None:
+                return True
+            return not (ranges[BOOKED].overlaps(start, end) or ranges[BLOCKED].overlaps(start, end))
+
+
+engine = AvailabilityEngine()
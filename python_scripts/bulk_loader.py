@@ -0,0 +1,330 @@
+# Bulk import for staging and benchmark databases. Rows come from CSV/JSONL
+# files or from the synthetic generator below and are written with executemany
+# in a single transaction. The indexes and triggers on the loaded tables are
+# dropped for the duration of the load and recreated afterwards, and derived
+# tables (unread counters, conversations, opening ledger entries, cache stamps)
+# are rebuilt once at the end instead of row by row.
+import csv
+import itertools
+import json
+import logging
+import random
+import time
+from datetime import date, timedelta
+
+from python_scripts.payment_proxy import to_cents
+from python_scripts.unread_counters import rebuild_counters
+from python_scripts.conversations import rebuild_conversations
+from python_scripts.rollups import rebuild_rollups
+from python_scripts.ratings import rebuild_ratings
+from python_scripts.car_cache import bump_version
+from python_scripts.availability_blocks import compact_blocks
+
+logger = logging.getLogger(__name__)
+
+# Parents before children, so generated rows can reference what is already loaded.
+TABLES = ("users", "cars", "bookings", "availability_blocks", "messages", "reviews", "notifications")
+CHUNK = 50000
+# In KiB, as PRAGMA cache_size takes negative values.
+LOAD_CACHE_SIZE = -262144
+DEFAULT_PASSWORD = "driveshare"
+
+# Run on a loaded table before its indexes are recreated.
+POST_LOAD = {
+    # Loaded blocks may overlap; the table holds merged ranges.
+    "availability_blocks": compact_blocks,
+}
+
+CITIES = (
+    "Detroit", "Ann Arbor", "Dearborn", "Lansing", "Grand Rapids", "Flint", "Troy", "Novi",
+    "Livonia", "Southfield", "Kalamazoo", "Toledo", "Chicago", "Cleveland", "Columbus", "Windsor",
+)
+# City centers; generated cars are scattered up to CITY_SPREAD degrees around them.
+CITY_COORDINATES = {
+    "Detroit": (42.3314, -83.0458), "Ann Arbor": (42.2808, -83.7430), "Dearborn": (42.3223, -83.1763),
+    "Lansing": (42.7325, -84.5555), "Grand Rapids": (42.9634, -85.6681), "Flint": (43.0125, -83.6875),
+    "Troy": (42.6064, -83.1498), "Novi": (42.4806, -83.4755), "Livonia": (42.3684, -83.3527),
+    "Southfield": (42.4734, -83.2219), "Kalamazoo": (42.2917, -85.5872), "Toledo": (41.6528, -83.5379),
+    "Chicago": (41.8781, -87.6298), "Cleveland": (41.4993, -81.6944), "Columbus": (39.9612, -82.9988),
+    "Windsor": (42.3149, -83.0364),
+}
+CITY_SPREAD = 0.15
+MAKES = ("Toyota", "Honda", "Ford", "Chevrolet", "Tesla", "BMW", "Subaru", "Kia", "Hyundai", "Mazda")
+COLORS = ("black", "white", "silver", "red", "blue", "gray", "green")
+
+
+class LoadError(Exception):
+    pass
+
+
+def read_file(path):
+    # Returns (columns, rows); rows are read lazily.
+    if path.endswith(".csv"):
+        handle = open(path, newline="")
+        reader = csv.reader(handle)
+        columns = next(reader, None) or []
+
+        def rows():
+            with handle:
+                for row in reader:
+                    yield tuple(value if value != "" else None for value in row)
+        return columns, rows()
+
+    if path.endswith((".jsonl", ".ndjson")):
+        handle = open(path)
+        lines = (line for line in handle if line.strip())
+        first = next(lines, None)
+        if first is None:
+            handle.close()
+            return [], iter(())
+        first = json.loads(first)
+        columns = list(first)
+
+        def rows():
+            with handle:
+                for record in itertools.chain([first], map(json.loads, lines)):
+                    yield tuple(record.get(column) for column in columns)
+        return columns, rows()
+
+    raise LoadError(f"Unsupported file type: {path} (expected .csv or .jsonl)")
+
+
+def _prepare_users(columns, rows, password_hash):
+    # Synthetic users share one precomputed hash, and the two balance columns
+    # are kept consistent with each other.
+    columns = list(columns)
+    fill_password = "password" not in columns
+    balance = columns.index("balance") if "balance" in columns else None
+    cents = columns.index("balance_cents") if "balance_cents" in columns else None
+    if fill_password:
+        columns.append("password")
+    if balance is not None and cents is None:
+        columns.append("balance_cents")
+    elif cents is not None and balance is None:
+        columns.append("balance")
+
+    def prepared():
+        for row in rows:
+            row = list(row)
+            if fill_password:
+                row.append(password_hash)
+            if balance is not None and cents is None:
+                row[balance] = float(row[balance] or 0)
+                row.append(to_cents(row[balance]))
+            elif cents is not None and balance is None:
+                row[cents] = int(row[cents] or 0)
+                row.append(row[cents] / 100.0)
+            yield row
+    return columns, prepared()
+
+
+def _chunks(rows):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, CHUNK))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _schema_objects(conn, tables):
+    placeholders = ", ".join("?" for _ in tables)
+    return conn.execute(f'''
+        SELECT type, name, sql FROM sqlite_master
+        WHERE type IN ('index', 'trigger') AND sql IS NOT NULL AND tbl_name IN ({placeholders})
+    ''', tuple(tables)).fetchall()
+
+
+def load(conn, sources, password_hash):
+    # sources maps a table name to a callable taking the connection and
+    # returning (columns, rows). Callables run in TABLES order, after the
+    # tables before them have been loaded.
+    unknown = set(sources) - set(TABLES)
+    if unknown:
+        raise LoadError(f"Unknown tables: {', '.join(sorted(unknown))}")
+    tables = [table for table in TABLES if table in sources]
+    started = time.perf_counter()
+    counts = {}
+
+    # Constraints are checked once at the end; the pragma cannot change inside a transaction.
+    conn.execute("PRAGMA foreign_keys = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    # The whole load is one transaction; a large page cache keeps the final
+    # constraint check from re-reading the tables it just wrote.
+    cache_size = conn.execute("PRAGMA cache_size").fetchone()[0]
+    conn.execute(f"PRAGMA cache_size = {LOAD_CACHE_SIZE}")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        objects = _schema_objects(conn, tables)
+        for kind, name, _ in objects:
+            conn.execute(f'DROP {kind.upper()} "{name}"')
+
+        for table in tables:
+            allowed = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+            columns, rows = sources[table](conn)
+            bad = [column for column in columns if column not in allowed]
+            if bad:
+                raise LoadError(f"{table}: unknown columns {', '.join(bad)}")
+            if table == "users":
+                columns, rows = _prepare_users(columns, rows, password_hash)
+            sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+            counts[table] = 0
+            for chunk in _chunks(rows):
+                conn.executemany(sql, chunk)
+                counts[table] += len(chunk)
+            logger.info("Loaded %d rows into %s", counts[table], table)
+
+        for table in tables:
+            if table in POST_LOAD:
+                POST_LOAD[table](conn)
+        # Indexes first, so triggers are not created against a table that is still being indexed.
+        for kind, _, sql in sorted(objects, key=lambda obj: obj[0] != "index"):
+            conn.execute(sql)
+
+        violations = [row for table in tables for row in conn.execute(f"PRAGMA foreign_key_check({table})").fetchmany(5)]
+        if violations:
+            raise LoadError("Foreign key violations, e.g. " + ", ".join(
+                f"{row[0]} rowid {row[1]} -> {row[2]}" for row in violations[:5]
+            ))
+
+        rebuild_derived(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute(f"PRAGMA cache_size = {int(cache_size)}")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute("ANALYZE")
+    return counts, time.perf_counter() - started
+
+
+def rebuild_derived(conn):
+    # What the dropped triggers and the payment engine would otherwise maintain.
+    rebuild_counters(conn)
+    rebuild_conversations(conn)
+    rebuild_rollups(conn)
+    rebuild_ratings(conn)
+    conn.execute('''
+        INSERT INTO ledger (user_id, amount_cents, entry_type)
+        SELECT u.id, u.balance_cents, 'opening_balance' FROM users u
+        WHERE u.balance_cents != 0 AND NOT EXISTS (SELECT 1 FROM ledger l WHERE l.user_id = u.id)
+    ''')
+    bump_version(conn, "cars")
+    conn.execute('''
+        UPDATE cache_versions
+        SET version = version + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER)
+        WHERE name = 'search'
+    ''')
+    # Every worker reloads its in-process search structures.
+    conn.execute("INSERT INTO search_changes (car_id) VALUES (NULL)")
+
+
+def synthetic(counts, seed=1, today=None, balance_cents=0):
+    # Deterministic rows for the tables named in counts. Each generator reads
+    # the ids it references when it starts, i.e. after its parents are loaded.
+    rng = random.Random(seed)
+    # random() is several times cheaper than randint()/choice(), which matters
+    # at millions of rows.
+    uniform = rng.random
+    pick = lambda seq: seq[int(uniform() * len(seq))]
+    between = lambda low, high: low + int(uniform() * (high - low + 1))
+    today = today or date.today()
+    first_day = today - timedelta(days=365)
+    # ISO strings for every day a generated row can use (bookings drift past the year).
+    days = [(first_day + timedelta(days=i)).isoformat() for i in range(4 * 366)]
+
+    def ids(conn, table):
+        return [row[0] for row in conn.execute(f"SELECT id FROM {table} ORDER BY id")]
+
+    def users(conn):
+        start = conn.execute("SELECT COALESCE(MAX(id), 0) FROM users").fetchone()[0] + 1
+        rows = (
+            (i, f"user{i}@example.test", "a", "b", "c", f"User {i}", balance_cents)
+            for i in range(start, start + counts["users"])
+        )
+        return ["id", "email", "security_q1", "security_q2", "security_q3", "full_name", "balance_cents"], rows
+
+    def cars(conn):
+        owners = ids(conn, "users")
+
+        def rows():
+            for i in range(counts["cars"]):
+                city = pick(CITIES)
+                lat, lng = CITY_COORDINATES[city]
+                yield (pick(owners), f"Model {i % 50}", pick(MAKES), between(2005, 2024),
+                       between(1000, 200000), pick(COLORS), float(between(20, 300)), city,
+                       round(lat + (2 * uniform() - 1) * CITY_SPREAD, 6), round(lng + (2 * uniform() - 1) * CITY_SPREAD, 6))
+        return ["owner_id", "model", "make", "year", "mileage", "color", "price", "location", "latitude", "longitude"], rows()
+
+    def bookings(conn):
+        car_ids = ids(conn, "cars")
+        renters = ids(conn, "users")
+        # Per-car cursor (an offset into days) so a car's bookings never overlap.
+        next_free = {}
+
+        def rows():
+            last = len(days) - 8
+            for _ in range(counts["bookings"]):
+                car_id = pick(car_ids)
+                start = next_free.get(car_id, between(0, 30)) + between(0, 10)
+                if start > last:
+                    start = between(0, last)
+                end = start + between(0, 6)
+                next_free[car_id] = end + 1
+                yield (car_id, pick(renters), days[start], days[end], float(between(20, 2000)), "confirmed")
+        return ["car_id", "renter_id", "start_date", "end_date", "total_cost", "status"], rows()
+
+    def availability_blocks(conn):
+        car_ids = ids(conn, "cars")
+
+        def rows():
+            for _ in range(counts["availability_blocks"]):
+                start = 365 + between(0, 365)
+                yield (pick(car_ids), days[start], days[start + between(0, 13)])
+        return ["car_id", "start_date", "end_date"], rows()
+
+    def messages(conn):
+        people = ids(conn, "users")
+
+        def rows():
+            # Receivers are drawn from everyone but the sender.
+            if len(people) < 2:
+                return
+            for _ in range(counts["messages"]):
+                sender = int(uniform() * len(people))
+                receiver = (sender + 1 + int(uniform() * (len(people) - 1))) % len(people)
+                yield people[sender], people[receiver], "Is the car still available?", int(uniform() < 0.5)
+        return ["sender_id", "receiver_id", "content", "is_read"], rows()
+
+    def reviews(conn):
+        # Renters review the owner of a car they booked.
+        booked = conn.execute('''
+            SELECT b.id, b.renter_id, c.owner_id FROM bookings b JOIN cars c ON c.id = b.car_id
+            ORDER BY b.id LIMIT ?
+        ''', (counts["reviews"],)).fetchall()
+        rows = (
+            (booking_id, renter_id, owner_id, between(1, 5), "Great car.")
+            for booking_id, renter_id, owner_id in booked
+        )
+        return ["booking_id", "reviewer_id", "reviewee_id", "rating", "comment"], rows
+
+    def notifications(conn):
+        people = ids(conn, "users")
+        rows = (
+            (pick(people), "Your booking has been confirmed!", int(uniform() < 0.5))
+            for _ in range(counts["notifications"])
+        )
+        return ["user_id", "message", "is_read"], rows
+
+    generators = {
+        "users": users, "cars": cars, "bookings": bookings, "availability_blocks": availability_blocks,
+        "messages": messages, "reviews": reviews, "notifications": notifications,
+    }
+    return {table: generators[table] for table in TABLES if counts.get(table)}
+
+
+def file_sources(files):
+    # files maps a table name to a CSV/JSONL path.
+    return {table: (lambda conn, path=path: read_file(path)) for table, path in files.items()}
@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_CAPACITY = 5000
+DEFAULT_TTL = 300
+# How often a shared cache compares its version with the database.
+DEFAULT_STAMP_INTERVAL = 1.0
+
+
+class CarRecord:
+    # Compact, read-only copy of a cars row and its rating columns (None when
+    # the car has no ratings). Supports the same car["make"], car[3] and
+    # car.make access the templates already use on sqlite3.Row.
+    FIELDS = (
+        "id", "owner_id", "model", "make", "year", "mileage", "color", "price",
+        "location", "precise_location", "is_available", "image_url", "created_at",
+        "latitude", "longitude",
+        "rating_count", "rating_sum", "stars_1", "stars_2", "stars_3", "stars_4", "stars_5",
+    )
+    __slots__ = FIELDS
+
+    @classmethod
+    def from_row(cls, row):
+        record = cls.__new__(cls)
+        keys = row.keys()
+        for field in cls.FIELDS:
+            object.__setattr__(record, field, row[field] if field in keys else None)
+        return record
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CarRecord is read-only")
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return getattr(self, self.FIELDS[key])
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def keys(self):
+        return list(self.FIELDS)
+
+
+def read_version(conn, name):
+    row = conn.execute("SELECT version FROM cache_versions WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else 0
+
+
+def bump_version(conn, name):
+    conn.execute('''
+        INSERT INTO cache_versions (name, version) VALUES (?, 1)
+        ON CONFLICT(name) DO UPDATE SET version = version + 1
+    ''', (name,))
+
+
+# Read-through LRU/TTL cache for car rows.
+class CarCache:
+    VERSION_NAME = "cars"
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, ttl=DEFAULT_TTL, shared=False, stamp_interval=DEFAULT_STAMP_INTERVAL):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.shared = shared
+        self.stamp_interval = stamp_interval
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        # Bumped by every invalidation so a row read before a write is not cached after it.
+        self._generation = 0
+
+    def configure(self, capacity=None, ttl=None, shared=None):
+        with self._lock:
+            if capacity is not None:
+                self.capacity = capacity
+            if ttl is not None:
+                self.ttl = ttl
+            if shared is not None:
+                self.shared = shared
+            self._entries.clear()
+            self._generation += 1
+
+    def _check_version(self, connect):
+        # With several workers, a write in one of them bumps the version row
+        # and the others drop their entries within stamp_interval seconds.
+        now = time.monotonic()
+        if now - self._checked_at < self.stamp_interval:
+            return
+        version = read_version(connect(), self.VERSION_NAME)
+        with self._lock:
+            self._checked_at = now
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+                self._generation += 1
+
+    def get(self, connect, car_id):
+        if self.shared:
+            self._check_version(connect)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(car_id)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._entries.move_to_end(car_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self._generation
+        row = connect().execute('''
+            SELECT c.*, s.rating_count, s.rating_sum, s.stars_1, s.stars_2, s.stars_3, s.stars_4, s.stars_5
+            FROM cars c
+            LEFT JOIN car_rating_stats s ON s.car_id = c.id
+            WHERE c.id = ?
+        ''', (car_id,)).fetchone()
+        if row is None:
+            return None
+        record = CarRecord.from_row(row)
+        with self._lock:
+            if generation != self._generation:
+                return record
+            self._entries[car_id] = (record, now)
+            self._entries.move_to_end(car_id)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+        return record
+
+    def invalidate(self, conn, car_id):
+        # Call inside the transaction that changed the car, then discard()
+        # once it has committed.
+        bump_version(conn, self.VERSION_NAME)
+        self.discard(car_id)
+
+    def discard(self, car_id):
+        with self._lock:
+            self._entries.pop(car_id, None)
+            self._generation += 1
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+car_cache = CarCache()
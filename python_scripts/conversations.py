@@ -0,0 +1,66 @@
+# One row per pair of users who have exchanged messages, keyed by the pair in
+# (user_low, user_high) order. Triggers on messages (see migrations.py) keep the
+# last message and each side's unread count current, so the inbox reads
+# conversations instead of scanning messages.
+
+
+def pair(user_a, user_b):
+    return (user_a, user_b) if user_a <= user_b else (user_b, user_a)
+
+
+def find_conversation(conn, user_a, user_b):
+    row = conn.execute(
+        "SELECT * FROM conversations WHERE user_low = ? AND user_high = ?", pair(user_a, user_b)
+    ).fetchone()
+    return row
+
+
+def send_message(conn, sender_id, receiver_id, content):
+    # The conversation row and the message are written in one transaction.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("INSERT OR IGNORE INTO conversations (user_low, user_high) VALUES (?, ?)", pair(sender_id, receiver_id))
+        conversation_id = find_conversation(conn, sender_id, receiver_id)["id"]
+        message_id = conn.execute(
+            "INSERT INTO messages (sender_id, receiver_id, content, conversation_id) VALUES (?, ?, ?, ?)",
+            (sender_id, receiver_id, content, conversation_id)
+        ).lastrowid
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return message_id
+
+
+def rebuild_conversations(conn):
+    # Assigns messages written without a conversation (older rows, bulk loads)
+    # and recomputes every conversation's summary from its messages.
+    conn.execute('''
+        INSERT OR IGNORE INTO conversations (user_low, user_high)
+        SELECT DISTINCT MIN(sender_id, receiver_id), MAX(sender_id, receiver_id)
+        FROM messages WHERE conversation_id IS NULL
+    ''')
+    conn.execute('''
+        UPDATE messages SET conversation_id = (
+            SELECT c.id FROM conversations c
+            WHERE c.user_low = MIN(messages.sender_id, messages.receiver_id)
+              AND c.user_high = MAX(messages.sender_id, messages.receiver_id)
+        )
+        WHERE conversation_id IS NULL
+    ''')
+    conn.execute('''
+        UPDATE conversations SET
+            (last_message_id, last_sender_id, last_message, last_timestamp) = (
+                SELECT m.id, m.sender_id, m.content, m.timestamp FROM messages m
+                WHERE m.conversation_id = conversations.id
+                ORDER BY m.timestamp DESC, m.id DESC LIMIT 1
+            ),
+            unread_low = (
+                SELECT COUNT(*) FROM messages m
+                WHERE m.conversation_id = conversations.id AND m.receiver_id = conversations.user_low AND NOT m.is_read
+            ),
+            unread_high = (
+                SELECT COUNT(*) FROM messages m
+                WHERE m.conversation_id = conversations.id AND m.receiver_id = conversations.user_high AND NOT m.is_read
+            )
+    ''')
@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_app_context
+
+from python_scripts.metrics import InstrumentedConnection, record_connect
+
+DEFAULT_DATABASE = "database.db"
+
+# Pragmas applied once per physical connection; pooled connections keep their
+# page cache warm between requests.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA cache_size = -16000",      # 16 MB page cache per connection
+    "PRAGMA mmap_size = 268435456",    # 256 MB memory-mapped I/O
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+# Object Pool Pattern for Database Connections
+class ConnectionPool:
+    def __init__(self, path=None, max_idle=8, cached_statements=256, timeout=30.0):
+        self.path = path or os.environ.get("DRIVESHARE_DB", DEFAULT_DATABASE)
+        self.max_idle = max_idle
+        self.cached_statements = cached_statements
+        self.timeout = timeout
+        # sqlite3 connection class; InstrumentedConnection times every query for /metrics.
+        self.factory = InstrumentedConnection
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def configure(self, path=None, max_idle=None):
+        self.close_all()
+        if path:
+            self.path = path
+        if max_idle is not None:
+            self.max_idle = max_idle
+
+    def _open(self):
+        # Connections move between request threads, but only one thread
+        # holds a connection at a time, so the same-thread check is not needed.
+        started = time.perf_counter()
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+            factory=self.factory,
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        record_connect(time.perf_counter() - started)
+        return conn
+
+    def acquire(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked worker: never share the parent's file handles.
+                self._idle = []
+                self._pid = os.getpid()
+            if self._idle:
+                return self._idle.pop()
+        return self._open()
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if self._pid == os.getpid() and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+pool = ConnectionPool()
+
+
+def get_db():
+    # One pooled connection per request, returned to the pool on teardown.
+    if not has_app_context():
+        raise RuntimeError("get_db() needs an app context; use pool.connection() instead.")
+    if "db" not in g:
+        g.db = pool.acquire()
+    return g.db
+
+
+def close_db(exception=None):
+    conn = g.pop("db", None)
+    if conn is not None:
+        pool.release(conn)
+
+
+def init_app(app):
+    app.config.setdefault("DATABASE", pool.path)
+    app.config.setdefault("DATABASE_POOL_SIZE", pool.max_idle)
+    app.config.setdefault("METRICS_ENABLED", True)
+    pool.factory = InstrumentedConnection if app.config["METRICS_ENABLED"] else sqlite3.Connection
+    pool.configure(app.config["DATABASE"], app.config["DATABASE_POOL_SIZE"])
+    app.teardown_appcontext(close_db)
@@ -0,0 +1,85 @@
+# In-process pub/sub behind the live-update streams. Publishers signal a
+# channel such as ("user", 7); subscribers are woken and read what is new
+# themselves with an indexed id > since query. A burst of events therefore
+# costs each subscriber one query, and a wakeup that arrives while a
+# subscriber is busy is folded into its next read instead of queued.
+#
+# Waiting is a threading.Event, so under a gevent worker (monkey-patched
+# threading) an idle stream parks a greenlet rather than an OS thread.
+import threading
+
+# Under the default threaded server every open stream holds a thread until it
+# ends, so a worker takes only a few; past the limit /events answers 503 and
+# clients poll. Raise it (SSE_MAX_STREAMS) for an async worker.
+DEFAULT_MAX_SUBSCRIBERS = 32
+
+
+class Subscription:
+    def __init__(self, hub, channels):
+        self.hub = hub
+        self.channels = channels
+        self.closed = False
+        self._event = threading.Event()
+
+    def wait(self, timeout):
+        # True if the subscription was signalled, False on timeout. Cleared
+        # before the caller reads, so a publish during the read is not lost.
+        signalled = self._event.wait(timeout)
+        self._event.clear()
+        return signalled
+
+    def close(self):
+        self.hub._unsubscribe(self)
+
+
+class EventHub:
+    def __init__(self, max_subscribers=DEFAULT_MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._subscribers = 0
+        self.published = 0
+        self.rejected = 0
+
+    def configure(self, max_subscribers=None):
+        if max_subscribers is not None:
+            self.max_subscribers = max_subscribers
+
+    def subscribe(self, *channels):
+        # Returns None when the worker already holds max_subscribers streams.
+        with self._lock:
+            if self._subscribers >= self.max_subscribers:
+                self.rejected += 1
+                return None
+            subscription = Subscription(self, channels)
+            for channel in channels:
+                self._channels.setdefault(channel, set()).add(subscription)
+            self._subscribers += 1
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            if subscription.closed:
+                return
+            subscription.closed = True
+            self._subscribers -= 1
+            for channel in subscription.channels:
+                subscribers = self._channels.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._channels[channel]
+
+    def publish(self, *channels):
+        with self._lock:
+            self.published += 1
+            woken = {subscription for channel in channels for subscription in self._channels.get(channel, ())}
+        for subscription in woken:
+            subscription._event.set()
+
+    def stats(self):
+        with self._lock:
+            return {"subscribers": self._subscribers, "published": self.published, "rejected": self.rejected}
+
+
+event_hub = EventHub()
@@ -0,0 +1,219 @@
+# Car coordinates and the uniform grid used for "cars near here" searches.
+# Points are bucketed into square cells of CELL_DEGREES; a radius or bounding
+# box query visits only the cells its bounds overlap and checks the exact
+# distance on the cars in them.
+import math
+from collections import defaultdict
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = math.pi * EARTH_RADIUS_KM / 180
+# About 2.2 km north-south: the nearest page of a dense city touches a few
+# cells, and a 25 km radius spans a few hundred.
+CELL_DEGREES = 0.02
+DEFAULT_RADIUS_KM = 25
+MAX_RADIUS_KM = 500
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def parse_point(lat, lng):
+    # Form/query values to a (lat, lng) pair; both blank means no point.
+    lat, lng = (lat or "").strip(), (lng or "").strip()
+    if not lat and not lng:
+        return None
+    try:
+        point = (float(lat), float(lng))
+    except ValueError:
+        raise ValueError("Latitude and longitude must be numbers.")
+    if not (-90 <= point[0] <= 90 and -180 <= point[1] <= 180):
+        raise ValueError("Latitude must be within ±90 and longitude within ±180.")
+    return point
+
+
+def parse_bbox(text):
+    # "min_lat,min_lng,max_lat,max_lng"; min_lng > max_lng crosses the antimeridian.
+    if not text:
+        return None
+    try:
+        min_lat, min_lng, max_lat, max_lng = (float(value) for value in text.split(","))
+    except ValueError:
+        raise ValueError("bbox must be min_lat,min_lng,max_lat,max_lng.")
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lng <= 180 and -180 <= max_lng <= 180):
+        raise ValueError("bbox is outside the valid latitude/longitude range.")
+    return (min_lat, min_lng, max_lat, max_lng)
+
+
+class GeoArea:
+    # A radius around center, a bounding box, or both (their intersection).
+    # Results are ordered by distance from center when there is one.
+    def __init__(self, center=None, radius_km=None, bbox=None):
+        if radius_km is not None and center is None:
+            raise ValueError("A radius needs a latitude and longitude.")
+        if radius_km is not None and not 0 < radius_km <= MAX_RADIUS_KM:
+            raise ValueError(f"Radius must be between 0 and {MAX_RADIUS_KM} km.")
+        self.center = center
+        self.radius_km = radius_km
+        self.bbox = bbox
+        self._boxes = self.boxes()
+
+    def key(self):
+        return (self.center, self.radius_km, self.bbox)
+
+    def boxes(self):
+        # Bounding boxes as (min_lat, min_lng, max_lat, max_lng), split at the
+        # antimeridian so every box has min_lng <= max_lng.
+        if self.radius_km is not None:
+            lat, lng = self.center
+            dlat = self.radius_km / KM_PER_DEGREE_LAT
+            min_lat, max_lat = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+            cos_lat = min(math.cos(math.radians(min_lat)), math.cos(math.radians(max_lat)))
+            dlng = 180.0 if cos_lat <= 1e-9 else min(180.0, self.radius_km / (KM_PER_DEGREE_LAT * cos_lat))
+            boxes = _split_lng(min_lat, lng - dlng, max_lat, lng + dlng)
+            if self.bbox is not None:
+                boxes = [
+                    both for box in boxes for other in _split_lng(*self.bbox)
+                    for both in [_intersect(box, other)] if both
+                ]
+            return boxes
+        if self.bbox is not None:
+            return _split_lng(*self.bbox)
+        return [(-90.0, -180.0, 90.0, 180.0)]
+
+    def contains(self, lat, lng):
+        # Returns the distance from center (None without one), or False when outside.
+        # The boxes cover the radius as well, so most far points skip the haversine.
+        for min_lat, min_lng, max_lat, max_lng in self._boxes:
+            if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng:
+                break
+        else:
+            return False
+        if self.center is None:
+            return None
+        distance = haversine_km(self.center[0], self.center[1], lat, lng)
+        if self.radius_km is not None and distance > self.radius_km:
+            return False
+        return distance
+
+
+def _split_lng(min_lat, min_lng, max_lat, max_lng):
+    if min_lng > max_lng:
+        return [(min_lat, min_lng, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lng)]
+    boxes = []
+    if min_lng < -180:
+        boxes.append((min_lat, min_lng + 360, max_lat, 180.0))
+        min_lng = -180.0
+    if max_lng > 180:
+        boxes.append((min_lat, -180.0, max_lat, max_lng - 360))
+        max_lng = 180.0
+    boxes.append((min_lat, min_lng, max_lat, max_lng))
+    return boxes
+
+
+def _intersect(a, b):
+    box = (max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3]))
+    return box if box[0] <= box[2] and box[1] <= box[3] else None
+
+
+def _cell(lat, lng):
+    return (math.floor(lat / CELL_DEGREES), math.floor(lng / CELL_DEGREES))
+
+
+def _cell_bound_km(cell, lat, lng):
+    # Lower bound on the distance from (lat, lng) to any point of the cell: the
+    # larger of the latitude gap and the distance to the nearest edge meridian.
+    row, col = cell
+    min_lat, min_lng = row * CELL_DEGREES, col * CELL_DEGREES
+    lat_gap = max(min_lat - lat, lat - (min_lat + CELL_DEGREES), 0.0) * KM_PER_DEGREE_LAT
+    if min_lng <= lng <= min_lng + CELL_DEGREES:
+        return lat_gap
+    dlng = min(abs((edge - lng + 180) % 360 - 180) for edge in (min_lng, min_lng + CELL_DEGREES))
+    cross = math.asin(min(1.0, math.cos(math.radians(lat)) * math.sin(math.radians(dlng))))
+    return max(lat_gap, EARTH_RADIUS_KM * cross)
+
+
+def _cell_reach_km(cell, lat, lng):
+    # Upper bound on the same distance: to the cell's middle plus the middle's
+    # distance to its farthest (equator-side) corner, with a little slack.
+    row, col = cell
+    min_lat, min_lng = row * CELL_DEGREES, col * CELL_DEGREES
+    mid_lat, mid_lng = min_lat + CELL_DEGREES / 2, min_lng + CELL_DEGREES / 2
+    edge_lat = min_lat if abs(min_lat) < abs(min_lat + CELL_DEGREES) else min_lat + CELL_DEGREES
+    half = haversine_km(mid_lat, mid_lng, edge_lat, min_lng)
+    return (haversine_km(lat, lng, mid_lat, mid_lng) + half) * 1.001
+
+
+class GeoGrid:
+    def __init__(self):
+        self.cells = defaultdict(set)
+        self.points = {}
+
+    def add(self, doc_id, lat, lng):
+        if lat is None or lng is None:
+            return
+        self.points[doc_id] = (lat, lng)
+        self.cells[_cell(lat, lng)].add(doc_id)
+
+    def remove(self, doc_id):
+        point = self.points.pop(doc_id, None)
+        if point is None:
+            return
+        cell = _cell(*point)
+        ids = self.cells.get(cell)
+        if ids is not None:
+            ids.discard(doc_id)
+            if not ids:
+                del self.cells[cell]
+
+    def _occupied(self, area):
+        # Occupied cells overlapping area's bounding boxes, each with whether it
+        # lies wholly inside a box.
+        found = {}
+        for min_lat, min_lng, max_lat, max_lng in area.boxes():
+            (row_lo, col_lo), (row_hi, col_hi) = _cell(min_lat, min_lng), _cell(max_lat, max_lng)
+            span = (row_hi - row_lo + 1) * (col_hi - col_lo + 1)
+            if span > len(self.cells):
+                # A wide box: walking the occupied cells is cheaper than the empty ones.
+                cells = [cell for cell in self.cells if row_lo <= cell[0] <= row_hi and col_lo <= cell[1] <= col_hi]
+            else:
+                cells = [
+                    (row, col) for row in range(row_lo, row_hi + 1) for col in range(col_lo, col_hi + 1)
+                    if (row, col) in self.cells
+                ]
+            for row, col in cells:
+                inside = row_lo < row < row_hi and col_lo < col < col_hi
+                found[(row, col)] = found.get((row, col), False) or inside
+        return found
+
+    def query(self, area):
+        # {car_id: distance_km or None} for the cars inside area.
+        found = {}
+        for cell, inside in self._occupied(area).items():
+            if inside and area.center is None:
+                # Nothing to measure and every point passes the box test.
+                found.update(dict.fromkeys(self.cells[cell]))
+                continue
+            for doc_id in self.cells[cell]:
+                lat, lng = self.points[doc_id]
+                distance = area.contains(lat, lng)
+                if distance is not False:
+                    found[doc_id] = distance
+        return found
+
+    def reach(self, cell, area):
+        return _cell_reach_km(cell, *area.center)
+
+    def cells_by_distance(self, area):
+        # Occupied cells as (lower bound in km, cell), nearest first, dropping
+        # those wholly outside the radius. area must have a center.
+        lat, lng = area.center
+        ranked = []
+        for cell in self._occupied(area):
+            bound = _cell_bound_km(cell, lat, lng)
+            if area.radius_km is None or bound <= area.radius_km:
+                ranked.append((bound, cell))
+        ranked.sort()
+        return ranked
@@ -0,0 +1,309 @@
+# Request and SQL instrumentation, exported in the Prometheus text format at
+# /metrics. Queries are timed by the connection/cursor classes below, which the
+# connection pool uses as its sqlite3 factory; the per-request totals live in a
+# context variable, so the cost per statement is two clock reads and a lookup.
+import bisect
+import contextvars
+import hmac
+import logging
+import sqlite3
+import threading
+import time
+
+from flask import Response, current_app, g, request
+from jinja2 import Template
+
+slow_query_logger = logging.getLogger("driveshare.slow_query")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+DEFAULT_SLOW_QUERY_MS = 100
+MAX_LOGGED_PARAMS = 200
+# Clients that may read /metrics without METRICS_TOKEN.
+DEFAULT_METRICS_ADDRS = ("127.0.0.1", "::1")
+
+_current = contextvars.ContextVar("driveshare_request_stats", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class RequestStats:
+    __slots__ = ("started", "queries", "db_seconds", "render_seconds")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+
+
+class Registry:
+    def __init__(self):
+        self.slow_query_seconds = DEFAULT_SLOW_QUERY_MS / 1000
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._collectors = {}
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name, labels=(), amount=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def register_stats(self, name, stats, counters=()):
+        # stats() returns a dict of numbers; keys listed in counters are
+        # exported as driveshare_<name>_<key>_total, the rest as gauges.
+        self._collectors[name] = (stats, frozenset(counters))
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self):
+        with self._lock:
+            histograms = [(key, list(h.counts), h.total, h.count, h.buckets) for key, h in self._histograms.items()]
+            counters = list(self._counters.items())
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), counts, total, count, buckets in sorted(histograms):
+            header(name, "histogram")
+            cumulative = 0
+            for bound, n in zip(buckets + ("+Inf",), counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+        for (name, labels), value in sorted(counters):
+            header(name, "counter")
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for name, (stats, counter_keys) in sorted(self._collectors.items()):
+            for key, value in sorted(stats().items()):
+                if key in counter_keys:
+                    metric = f"driveshare_{name}_{key}_total"
+                    header(metric, "counter")
+                else:
+                    metric = f"driveshare_{name}_{key}"
+                    header(metric, "gauge")
+                lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+registry = Registry()
+
+
+def _describe(parameters):
+    # Values can be passwords, emails or message text; the log gets only their
+    # number and types, e.g. "3 (int, str, NoneType)".
+    if isinstance(parameters, str):
+        return parameters
+    if isinstance(parameters, dict):
+        types = (f"{name}: {type(value).__name__}" for name, value in parameters.items())
+    else:
+        types = (type(value).__name__ for value in parameters)
+    return f"{len(parameters)} ({', '.join(types)})"
+
+
+def _record_query(sql, parameters, elapsed):
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+    if elapsed >= registry.slow_query_seconds:
+        registry.inc("driveshare_slow_queries_total")
+        params = _describe(parameters)
+        if len(params) > MAX_LOGGED_PARAMS:
+            params = params[:MAX_LOGGED_PARAMS] + "..."
+        slow_query_logger.warning(
+            "%.1f ms [%s] %s params=%s",
+            elapsed * 1000, _route() if stats is not None else "background", " ".join(sql.split()), params,
+        )
+
+
+def _record_fetch(elapsed):
+    stats = _current.get()
+    if stats is not None:
+        stats.db_seconds += elapsed
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # Query time is execute() plus the fetch calls that step through the result.
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record_query(sql, parameters, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record_query(sql, "<many>", time.perf_counter() - started)
+
+    def executescript(self, sql_script):
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            _record_query(sql_script, "<script>", time.perf_counter() - started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            _record_fetch(time.perf_counter() - started)
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            _record_fetch(time.perf_counter() - started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            _record_fetch(time.perf_counter() - started)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    # Connection.execute() and friends create plain cursors internally, so
+    # they are routed through cursor() here.
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            _record_fetch(time.perf_counter() - started)
+
+
+def record_connect(elapsed):
+    registry.inc("driveshare_db_connections_opened_total")
+    registry.observe("driveshare_db_connect_seconds", (), elapsed)
+
+
+class TimedTemplate(Template):
+    def render(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            stats = _current.get()
+            if stats is not None:
+                stats.render_seconds += time.perf_counter() - started
+
+
+def _route():
+    return request.url_rule.endpoint if request.url_rule is not None else "unmatched"
+
+
+def _before_request():
+    g.request_stats_token = _current.set(RequestStats())
+
+
+def _after_request(response):
+    stats = _current.get()
+    if stats is None or request.endpoint == "metrics":
+        return response
+    elapsed = time.perf_counter() - stats.started
+    labels = (("route", _route()), ("method", request.method))
+    registry.observe("driveshare_request_duration_seconds", labels, elapsed)
+    registry.observe("driveshare_request_db_seconds", labels, stats.db_seconds)
+    registry.observe("driveshare_request_render_seconds", labels, stats.render_seconds)
+    registry.observe("driveshare_request_queries", labels, stats.queries, QUERY_COUNT_BUCKETS)
+    registry.inc("driveshare_requests_total", labels + (("status", response.status_code),))
+    response.headers["Server-Timing"] = (
+        f"db;dur={stats.db_seconds * 1000:.2f}, render;dur={stats.render_seconds * 1000:.2f}, "
+        f"total;dur={elapsed * 1000:.2f}"
+    )
+    return response
+
+
+def _teardown_request(exception=None):
+    token = g.pop("request_stats_token", None)
+    if token is not None:
+        _current.reset(token)
+
+
+def _authorized():
+    # A bearer token, when one is configured, works from anywhere; otherwise
+    # only the listed client addresses (loopback by default) may scrape.
+    token = current_app.config["METRICS_TOKEN"]
+    if token:
+        supplied = request.headers.get("Authorization", "").encode()
+        if hmac.compare_digest(supplied, f"Bearer {token}".encode()):
+            return True
+    return request.remote_addr in current_app.config["METRICS_ALLOWED_ADDRS"]
+
+
+def metrics_view():
+    if not _authorized():
+        return Response("Forbidden\n", status=403, mimetype="text/plain")
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app):
+    app.config.setdefault("METRICS_ENABLED", True)
+    app.config.setdefault("SLOW_QUERY_MS", DEFAULT_SLOW_QUERY_MS)
+    app.config.setdefault("METRICS_TOKEN", None)
+    app.config.setdefault("METRICS_ALLOWED_ADDRS", DEFAULT_METRICS_ADDRS)
+    registry.slow_query_seconds = app.config["SLOW_QUERY_MS"] / 1000
+    if not app.config["METRICS_ENABLED"]:
+        return
+    app.jinja_env.template_class = TimedTemplate
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
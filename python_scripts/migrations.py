@@ -0,0 +1,500 @@
+# Schema migrations, applied in order on top of the tables created by app.init_db.
+# The number of the last applied migration is kept in PRAGMA user_version, so an
+# existing database.db is upgraded in place the next time init_db runs.
+#
+# A step is an SQL string, a callable taking the connection, or a Rebuild.
+
+from python_scripts.unread_counters import rebuild_counters
+from python_scripts.conversations import rebuild_conversations
+from python_scripts.rollups import rebuild_rollups
+from python_scripts.ratings import rebuild_ratings
+from python_scripts.search_changes import KEEP_CHANGES
+
+
+class Rebuild:
+    # Recomputes a derived table from its source rows. The live rebuild
+    # function is written against the latest schema, so it runs once, after
+    # the last pending migration, rather than at the point it is listed.
+    def __init__(self, rebuild):
+        self.rebuild = rebuild
+
+
+def _search_version_triggers(*tables):
+    # Any write that can change search results bumps the 'search' stamp in the same transaction.
+    return [
+        f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_search_version
+            AFTER {event} ON {table}
+            BEGIN
+                UPDATE cache_versions
+                SET version = version + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER)
+                WHERE name = 'search';
+            END
+        '''
+        for table in tables
+        for event in ("INSERT", "UPDATE", "DELETE")
+    ]
+
+
+def _search_change_triggers(table, column):
+    # Logs the car each write touches, next to the 'search' stamp bump (see search_changes.py).
+    return [
+        f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_search_change
+            AFTER {event} ON {table}
+            BEGIN
+                INSERT INTO search_changes (car_id) VALUES ({row}.{column});
+            END
+        '''
+        for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD"))
+    ]
+
+
+def _counter_triggers(table, owner, column):
+    # Keeps user_counters.<column> equal to the number of unread rows in <table>.
+    # Only the paths that add unread rows create the counters row; a delete may
+    # be cascading from the user itself.
+    increment = f'''
+        INSERT OR IGNORE INTO user_counters (user_id) VALUES (NEW.{owner});
+        UPDATE user_counters SET {column} = {column} + 1 WHERE user_id = NEW.{owner};
+    '''
+    decrement = f"UPDATE user_counters SET {column} = {column} - 1 WHERE user_id = {{row}}.{owner};"
+    return [
+        f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_insert_unread
+            AFTER INSERT ON {table} WHEN NOT NEW.is_read
+            BEGIN {increment} END
+        ''',
+        f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_delete_unread
+            AFTER DELETE ON {table} WHEN NOT OLD.is_read
+            BEGIN {decrement.format(row="OLD")} END
+        ''',
+        f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_mark_read
+            AFTER UPDATE OF is_read ON {table} WHEN NOT OLD.is_read AND NEW.is_read
+            BEGIN {decrement.format(row="NEW")} END
+        ''',
+        f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_mark_unread
+            AFTER UPDATE OF is_read ON {table} WHEN OLD.is_read AND NOT NEW.is_read
+            BEGIN {increment} END
+        ''',
+    ]
+
+
+def _conversation_triggers():
+    # Keeps each conversation's last message and per-side unread counts in step
+    # with its messages. (NEW.receiver_id = user_low) is 1 or 0, so one UPDATE
+    # covers whichever side received the message.
+    unread = "unread_{side} = unread_{side} + {delta} * ({row}.receiver_id = user_{side})"
+    return [
+        f'''
+            CREATE TRIGGER IF NOT EXISTS trg_messages_insert_conversation
+            AFTER INSERT ON messages WHEN NEW.conversation_id IS NOT NULL
+            BEGIN
+                UPDATE conversations SET
+                    last_message_id = NEW.id, last_sender_id = NEW.sender_id,
+                    last_message = NEW.content, last_timestamp = NEW.timestamp,
+                    {unread.format(side="low", delta="(NOT NEW.is_read)", row="NEW")},
+                    {unread.format(side="high", delta="(NOT NEW.is_read)", row="NEW")}
+                WHERE id = NEW.conversation_id;
+            END
+        ''',
+        f'''
+            CREATE TRIGGER IF NOT EXISTS trg_messages_read_conversation
+            AFTER UPDATE OF is_read ON messages
+            WHEN NEW.conversation_id IS NOT NULL AND (NOT OLD.is_read) != (NOT NEW.is_read)
+            BEGIN
+                UPDATE conversations SET
+                    {unread.format(side="low", delta="(CASE WHEN NEW.is_read THEN -1 ELSE 1 END)", row="NEW")},
+                    {unread.format(side="high", delta="(CASE WHEN NEW.is_read THEN -1 ELSE 1 END)", row="NEW")}
+                WHERE id = NEW.conversation_id;
+            END
+        ''',
+        f'''
+            CREATE TRIGGER IF NOT EXISTS trg_messages_delete_conversation
+            AFTER DELETE ON messages WHEN OLD.conversation_id IS NOT NULL
+            BEGIN
+                UPDATE conversations SET
+                    {unread.format(side="low", delta="-(NOT OLD.is_read)", row="OLD")},
+                    {unread.format(side="high", delta="-(NOT OLD.is_read)", row="OLD")}
+                WHERE id = OLD.conversation_id;
+                -- Deleting the latest message falls back to the one before it.
+                UPDATE conversations SET
+                    (last_message_id, last_sender_id, last_message, last_timestamp) = (
+                        SELECT m.id, m.sender_id, m.content, m.timestamp FROM messages m
+                        WHERE m.conversation_id = OLD.conversation_id
+                        ORDER BY m.timestamp DESC, m.id DESC LIMIT 1
+                    )
+                WHERE id = OLD.conversation_id AND last_message_id = OLD.id;
+            END
+        ''',
+    ]
+
+
+def _rebuild_table(table, create_sql):
+    # SQLite cannot change a foreign key in place: create the table again under
+    # a temporary name, copy the rows, swap it in and restore its indexes and
+    # AUTOINCREMENT counter. No table references these ones, so dropping the
+    # old copy with foreign keys on removes nothing else.
+    def rebuild(conn):
+        indexes = [sql for (sql,) in conn.execute(
+            "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+            (table,)
+        )]
+        seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+        conn.execute(create_sql.format(table=f"{table}_rebuilt"))
+        columns = ", ".join(row[1] for row in conn.execute(f"PRAGMA table_info({table}_rebuilt)"))
+        conn.execute(f"INSERT INTO {table}_rebuilt ({columns}) SELECT {columns} FROM {table}")
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {table}_rebuilt RENAME TO {table}")
+        for sql in indexes:
+            conn.execute(sql)
+        if seq:
+            conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (seq[0], table))
+    return rebuild
+
+
+MIGRATIONS = [
+    (1, "hot-path indexes and unique availability dates", [
+        # Older databases may hold several rows for the same car/date; keep the newest.
+        '''
+            DELETE FROM availability
+            WHERE id NOT IN (SELECT MAX(id) FROM availability GROUP BY car_id, date)
+        ''',
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_availability_car_date ON availability(car_id, date)",
+        "CREATE INDEX IF NOT EXISTS idx_availability_date ON availability(date, is_available)",
+        "CREATE INDEX IF NOT EXISTS idx_bookings_car_status ON bookings(car_id, status, start_date, end_date)",
+        "CREATE INDEX IF NOT EXISTS idx_bookings_status_start ON bookings(status, start_date)",
+        "CREATE INDEX IF NOT EXISTS idx_bookings_renter ON bookings(renter_id, start_date)",
+        "CREATE INDEX IF NOT EXISTS idx_cars_owner ON cars(owner_id)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_receiver ON messages(receiver_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_sender ON messages(sender_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications(user_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_reviews_reviewee ON reviews(reviewee_id, timestamp)",
+        # Child-side indexes so cascading deletes of bookings do not scan these tables.
+        "CREATE INDEX IF NOT EXISTS idx_reviews_booking ON reviews(booking_id)",
+        "CREATE INDEX IF NOT EXISTS idx_payments_booking ON payments(booking_id)",
+    ]),
+    (2, "shared session store", [
+        '''
+            CREATE TABLE IF NOT EXISTS sessions (
+                sid TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                email TEXT NOT NULL,
+                role TEXT,
+                expires_at INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+            )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions(user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at)",
+    ]),
+    (3, "integer-cents ledger and cached balances", [
+        "ALTER TABLE users ADD COLUMN balance_cents INTEGER NOT NULL DEFAULT 0",
+        "UPDATE users SET balance_cents = CAST(ROUND(COALESCE(balance, 0) * 100) AS INTEGER)",
+        '''
+            CREATE TABLE IF NOT EXISTS ledger (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                booking_id INTEGER,
+                amount_cents INTEGER NOT NULL,
+                entry_type TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY(user_id) REFERENCES users(id),
+                FOREIGN KEY(booking_id) REFERENCES bookings(id)
+            )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_ledger_user ON ledger(user_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_ledger_booking ON ledger(booking_id)",
+        # Existing balances become opening entries so the ledger sums to them.
+        '''
+            INSERT INTO ledger (user_id, amount_cents, entry_type)
+            SELECT id, balance_cents, 'opening_balance' FROM users WHERE balance_cents != 0
+        ''',
+    ]),
+    (4, "cache version stamps", [
+        '''
+            CREATE TABLE IF NOT EXISTS cache_versions (
+                name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        ''',
+    ]),
+    (5, "search generation stamp maintained by triggers", [
+        "ALTER TABLE cache_versions ADD COLUMN updated_at INTEGER NOT NULL DEFAULT 0",
+        "INSERT OR IGNORE INTO cache_versions (name, version, updated_at) VALUES ('search', 0, CAST(strftime('%s', 'now') AS INTEGER))",
+    ] + _search_version_triggers("cars", "bookings", "availability")),
+    (6, "materialized unread counters", [
+        '''
+            CREATE TABLE IF NOT EXISTS user_counters (
+                user_id INTEGER PRIMARY KEY,
+                unread_notifications INTEGER NOT NULL DEFAULT 0,
+                unread_messages INTEGER NOT NULL DEFAULT 0,
+                FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+            )
+        ''',
+        Rebuild(rebuild_counters),
+    ] + _counter_triggers("notifications", "user_id", "unread_notifications")
+      + _counter_triggers("messages", "receiver_id", "unread_messages")),
+    (7, "owner blocks stored as merged date ranges", [
+        '''
+            CREATE TABLE IF NOT EXISTS availability_blocks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                car_id INTEGER NOT NULL,
+                start_date TEXT NOT NULL,
+                end_date TEXT NOT NULL,
+                FOREIGN KEY(car_id) REFERENCES cars(id) ON DELETE CASCADE
+            )
+        ''',
+        # Each run of consecutive blocked days becomes one block (days minus
+        # their rank are constant along a run). Rows whose date is not a valid
+        # YYYY-MM-DD never matched a booking and stay behind.
+        '''
+            INSERT INTO availability_blocks (car_id, start_date, end_date)
+            SELECT car_id, date(MIN(day)), date(MAX(day))
+            FROM (
+                SELECT car_id, julianday(date) AS day,
+                       julianday(date) - ROW_NUMBER() OVER (PARTITION BY car_id ORDER BY date) AS run
+                FROM (
+                    SELECT DISTINCT car_id, date FROM availability
+                    WHERE is_available = 0 AND date(date) IS date
+                )
+            )
+            GROUP BY car_id, run
+            ORDER BY car_id, MIN(day)
+        ''',
+        "DELETE FROM availability WHERE is_available = 0 AND date(date) IS date",
+        "CREATE INDEX IF NOT EXISTS idx_availability_blocks_car ON availability_blocks(car_id, start_date)",
+        "CREATE INDEX IF NOT EXISTS idx_availability_blocks_start ON availability_blocks(start_date, end_date)",
+    ] + _search_version_triggers("availability_blocks")),
+    (8, "conversations with denormalized last message", [
+        '''
+            CREATE TABLE IF NOT EXISTS conversations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_low INTEGER NOT NULL,
+                user_high INTEGER NOT NULL,
+                last_message_id INTEGER,
+                last_sender_id INTEGER,
+                last_message TEXT,
+                last_timestamp TIMESTAMP,
+                unread_low INTEGER NOT NULL DEFAULT 0,
+                unread_high INTEGER NOT NULL DEFAULT 0,
+                UNIQUE(user_low, user_high),
+                FOREIGN KEY(user_low) REFERENCES users(id) ON DELETE CASCADE,
+                FOREIGN KEY(user_high) REFERENCES users(id) ON DELETE CASCADE
+            )
+        ''',
+        "ALTER TABLE messages ADD COLUMN conversation_id INTEGER REFERENCES conversations(id) ON DELETE CASCADE",
+        "CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages(conversation_id, timestamp, id)",
+        Rebuild(rebuild_conversations),
+        "CREATE INDEX IF NOT EXISTS idx_conversations_high ON conversations(user_high, last_timestamp, id)",
+    ] + _conversation_triggers()),
+    (9, "since-id lookups for live updates", [
+        "CREATE INDEX IF NOT EXISTS idx_notifications_user_id ON notifications(user_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages(conversation_id, id)",
+    ]),
+    (10, "case-insensitive name index for recipient lookup", [
+        "CREATE INDEX IF NOT EXISTS idx_users_full_name ON users(full_name COLLATE NOCASE)",
+    ]),
+    (11, "car coordinates", [
+        "ALTER TABLE cars ADD COLUMN latitude REAL",
+        "ALTER TABLE cars ADD COLUMN longitude REAL",
+        # For the SQL search path; the in-process grid answers the common case.
+        "CREATE INDEX IF NOT EXISTS idx_cars_lat_lng ON cars(latitude, longitude)",
+    ]),
+    # WITHOUT ROWID: the primary key is the only index, so a car's or an
+    # owner's days are one contiguous range of the table itself.
+    (12, "daily earnings and utilization rollups", [
+        '''
+            CREATE TABLE IF NOT EXISTS car_daily_stats (
+                car_id INTEGER NOT NULL,
+                day TEXT NOT NULL,
+                booked_days INTEGER NOT NULL DEFAULT 0,
+                revenue_cents INTEGER NOT NULL DEFAULT 0,
+                bookings INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (car_id, day),
+                FOREIGN KEY(car_id) REFERENCES cars(id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS owner_daily_stats (
+                owner_id INTEGER NOT NULL,
+                day TEXT NOT NULL,
+                booked_days INTEGER NOT NULL DEFAULT 0,
+                revenue_cents INTEGER NOT NULL DEFAULT 0,
+                bookings INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (owner_id, day),
+                FOREIGN KEY(owner_id) REFERENCES users(id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+        ''',
+        Rebuild(rebuild_rollups),
+        # Deleting a car cascades to its bookings; its days leave the owner's totals too.
+        '''
+            CREATE TRIGGER IF NOT EXISTS trg_cars_delete_rollups
+            BEFORE DELETE ON cars
+            BEGIN
+                UPDATE owner_daily_stats SET
+                    booked_days = booked_days - (SELECT s.booked_days FROM car_daily_stats s WHERE s.car_id = OLD.id AND s.day = owner_daily_stats.day),
+                    revenue_cents = revenue_cents - (SELECT s.revenue_cents FROM car_daily_stats s WHERE s.car_id = OLD.id AND s.day = owner_daily_stats.day),
+                    bookings = bookings - (SELECT s.bookings FROM car_daily_stats s WHERE s.car_id = OLD.id AND s.day = owner_daily_stats.day)
+                WHERE owner_id = OLD.owner_id
+                  AND day IN (SELECT day FROM car_daily_stats WHERE car_id = OLD.id);
+            END
+        ''',
+    ]),
+    # Search results show each car's rating, so its changes bump the search stamp.
+    (13, "rating aggregates for users and cars", [
+        '''
+            CREATE TABLE IF NOT EXISTS user_rating_stats (
+                user_id INTEGER PRIMARY KEY,
+                rating_count INTEGER NOT NULL DEFAULT 0,
+                rating_sum INTEGER NOT NULL DEFAULT 0,
+                stars_1 INTEGER NOT NULL DEFAULT 0,
+                stars_2 INTEGER NOT NULL DEFAULT 0,
+                stars_3 INTEGER NOT NULL DEFAULT 0,
+                stars_4 INTEGER NOT NULL DEFAULT 0,
+                stars_5 INTEGER NOT NULL DEFAULT 0,
+                FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS car_rating_stats (
+                car_id INTEGER PRIMARY KEY,
+                rating_count INTEGER NOT NULL DEFAULT 0,
+                rating_sum INTEGER NOT NULL DEFAULT 0,
+                stars_1 INTEGER NOT NULL DEFAULT 0,
+                stars_2 INTEGER NOT NULL DEFAULT 0,
+                stars_3 INTEGER NOT NULL DEFAULT 0,
+                stars_4 INTEGER NOT NULL DEFAULT 0,
+                stars_5 INTEGER NOT NULL DEFAULT 0,
+                FOREIGN KEY(car_id) REFERENCES cars(id) ON DELETE CASCADE
+            )
+        ''',
+        Rebuild(rebuild_ratings),
+    ] + _search_version_triggers("car_rating_stats")),
+    # For the SQL search path's sort orders (see SORT_SQL in search_index.py):
+    # the ORDER BY expression and the id rowid are the index key, so a sorted
+    # page is read in index order and stops at its LIMIT.
+    (14, "search sort indexes", [
+        "CREATE INDEX IF NOT EXISTS idx_cars_price ON cars(price)",
+        "CREATE INDEX IF NOT EXISTS idx_cars_year ON cars(-year)",
+        "CREATE INDEX IF NOT EXISTS idx_cars_mileage ON cars(mileage)",
+    ]),
+    # Deleting a car cascades to its bookings. Payments, reviews and ledger
+    # entries outlive the booking with booking_id set to NULL, so the money
+    # trail and users' ratings stay intact.
+    (15, "keep payments, reviews and ledger entries when their booking is deleted", [
+        _rebuild_table("payments", '''
+            CREATE TABLE {table} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                booking_id INTEGER,
+                payer_id INTEGER NOT NULL,
+                payee_id INTEGER NOT NULL,
+                amount REAL NOT NULL,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                is_confirmed BOOLEAN DEFAULT 1,
+                FOREIGN KEY(booking_id) REFERENCES bookings(id) ON DELETE SET NULL,
+                FOREIGN KEY(payer_id) REFERENCES users(id),
+                FOREIGN KEY(payee_id) REFERENCES users(id)
+            )
+        '''),
+        _rebuild_table("reviews", '''
+            CREATE TABLE {table} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                booking_id INTEGER,
+                reviewer_id INTEGER NOT NULL,
+                reviewee_id INTEGER NOT NULL,
+                rating INTEGER CHECK (rating BETWEEN 1 AND 5),
+                comment TEXT,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY(booking_id) REFERENCES bookings(id) ON DELETE SET NULL,
+                FOREIGN KEY(reviewer_id) REFERENCES users(id),
+                FOREIGN KEY(reviewee_id) REFERENCES users(id)
+            )
+        '''),
+        _rebuild_table("ledger", '''
+            CREATE TABLE {table} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                booking_id INTEGER,
+                amount_cents INTEGER NOT NULL,
+                entry_type TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY(user_id) REFERENCES users(id),
+                FOREIGN KEY(booking_id) REFERENCES bookings(id) ON DELETE SET NULL
+            )
+        '''),
+    ]),
+    # Lets each worker's search index and availability structures pick up
+    # writes made by the other workers (see search_changes.py).
+    (16, "search change log", [
+        '''
+            CREATE TABLE IF NOT EXISTS search_changes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                car_id INTEGER
+            )
+        ''',
+        f'''
+            CREATE TRIGGER IF NOT EXISTS trg_search_changes_prune
+            AFTER INSERT ON search_changes
+            BEGIN
+                DELETE FROM search_changes WHERE id <= NEW.id - {KEEP_CHANGES};
+            END
+        ''',
+    ] + _search_change_triggers("cars", "id")
+      + _search_change_triggers("bookings", "car_id")
+      + _search_change_triggers("availability", "car_id")
+      + _search_change_triggers("availability_blocks", "car_id")
+      + _search_change_triggers("car_rating_stats", "car_id")),
+    # Ratings that are not a whole number of stars (e.g. 4.5) no longer count.
+    (17, "rating aggregates count whole-star ratings only", [
+        Rebuild(rebuild_ratings),
+    ]),
+    # A message to oneself counted as unread for both sides of the conversation
+    # and in the sender's badge. The send routes now refuse them; the
+    # triggers take existing ones out of the counts as they are marked read.
+    (18, "self-messages are read", [
+        "UPDATE messages SET is_read = 1 WHERE sender_id = receiver_id AND NOT is_read",
+    ]),
+    # The inbox reads the user's low and high sides separately, each in
+    # (last_timestamp, id) order from its own index.
+    (19, "inbox index for the low side of a conversation", [
+        "CREATE INDEX IF NOT EXISTS idx_conversations_low ON conversations(user_low, last_timestamp, id)",
+    ]),
+]
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(conn):
+    version = current_version(conn)
+    pending = [migration for migration in MIGRATIONS if migration[0] > version]
+    if not pending:
+        return []
+    rebuilds = []
+    # The pending migrations, the version bump and the rebuilds they ask for
+    # commit together or not at all.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for number, description, steps in pending:
+            for step in steps:
+                if isinstance(step, Rebuild):
+                    if step.rebuild not in rebuilds:
+                        rebuilds.append(step.rebuild)
+                elif callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+        conn.execute(f"PRAGMA user_version = {int(pending[-1][0])}")
+        for rebuild in rebuilds:
+            rebuild(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return [(number, description) for number, description, _ in pending]
@@ -0,0 +1,134 @@
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from python_scripts.db_pool import pool
+from python_scripts.event_hub import event_hub
+
+logger = logging.getLogger(__name__)
+
+INSERT_NOTIFICATION = '''
+    INSERT INTO notifications (user_id, message, timestamp, is_read)
+    VALUES (?, ?, ?, 0)
+'''
+
+_STOP = object()
+
+
+def utc_timestamp():
+    # Same format SQLite's datetime('now') produces.
+    return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+
+# Background writer that group-commits queued notifications. A batch is
+# written when it reaches `batch_size` rows or `flush_interval` seconds after
+# its first row arrived, whichever comes first.
+class NotificationWriter:
+    def __init__(self, batch_size=200, flush_interval=0.05):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._registered = False
+        self.batches = 0
+        self.written = 0
+        self.dropped = 0
+        self.write_seconds = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="notification-writer", daemon=True)
+                self._thread.start()
+                if not self._registered:
+                    # Drain whatever is still queued when the worker shuts down.
+                    atexit.register(self.stop)
+                    self._registered = True
+
+    def enqueue(self, user_id, message):
+        self.start()
+        self._queue.put((user_id, message, utc_timestamp()))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+            batch = [item]
+            stopping = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                self.write(batch)
+            except Exception:
+                logger.exception("Failed to write %d notifications", len(batch))
+            for _ in range(len(batch) + stopping):
+                self._queue.task_done()
+            if stopping:
+                return
+
+    def write(self, batch):
+        started = time.perf_counter()
+        dropped = 0
+        recipients = {row[0] for row in batch}
+        with pool.connection() as conn:
+            try:
+                with conn:
+                    conn.executemany(INSERT_NOTIFICATION, batch)
+            except sqlite3.IntegrityError:
+                # One bad row (e.g. a deleted user) should not drop the whole batch.
+                for row in batch:
+                    try:
+                        with conn:
+                            conn.execute(INSERT_NOTIFICATION, row)
+                    except sqlite3.IntegrityError:
+                        logger.warning("Dropping notification for user %s", row[0])
+                        recipients.discard(row[0])
+                        dropped += 1
+        # Open notification streams read the new rows once they are committed.
+        event_hub.publish(*(("user", user_id) for user_id in recipients))
+        self.batches += 1
+        self.written += len(batch) - dropped
+        self.dropped += dropped
+        self.write_seconds += time.perf_counter() - started
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "batches": self.batches,
+            "written": self.written,
+            "dropped": self.dropped,
+            "write_seconds": round(self.write_seconds, 6),
+        }
+
+    def flush(self):
+        # Blocks until everything queued so far has been written.
+        self._queue.join()
+
+    def stop(self):
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join()
+
+
+notification_writer = NotificationWriter()
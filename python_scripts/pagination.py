@@ -0,0 +1,71 @@
+import base64
+import binascii
+import json
+
+from flask import current_app, jsonify, request, url_for
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+# Cursors are the sort key of the last row on a page, e.g. [timestamp, id],
+# wrapped in URL-safe base64 so clients treat them as opaque.
+def encode_cursor(*values):
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token, size=2):
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (binascii.Error, ValueError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+def page_size():
+    default = current_app.config.get("PAGE_SIZE", DEFAULT_PAGE_SIZE)
+    try:
+        size = int(request.args.get("limit", default))
+    except ValueError:
+        size = default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def paginate(rows, limit, key):
+    # Queries fetch limit + 1 rows; the extra row only tells us another page exists.
+    rows = list(rows)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(*key(rows[-1]))
+    return rows, next_cursor
+
+
+def wants_json():
+    return request.args.get("format") == "json"
+
+
+def page_json(items, next_cursor, **extra):
+    return jsonify(items=[dict(item) for item in items], next_cursor=next_cursor, **extra)
+
+
+def next_page_url(param, cursor):
+    args = request.args.to_dict()
+    args[param] = cursor
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+
+def keyset_query(query, params, columns, cursor, limit):
+    # Newest-first keyset page: rows strictly after the cursor in (columns) DESC order.
+    params = list(params)
+    if cursor:
+        query += f" AND ({', '.join(columns)}) < ({', '.join('?' * len(columns))})"
+        params.extend(cursor)
+    query += " ORDER BY " + ", ".join(f"{column} DESC" for column in columns) + " LIMIT ?"
+    params.append(limit + 1)
+    return query, params
@@ -0,0 +1,118 @@
+# Password hashing off the request thread. Hashes and checks run in a small
+# process pool, so a login spike no longer holds one request worker per hash
+# and scales with cores instead of the GIL. At most `max_pending` hashes may be
+# queued or running; past that, callers get HasherBusy straight away and the
+# route answers 503 instead of letting requests pile up behind the pool.
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = "pbkdf2:sha256"
+DEFAULT_TIMEOUT = 10
+
+
+class HasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    def __init__(self, method=DEFAULT_METHOD, workers=None, max_pending=None, timeout=DEFAULT_TIMEOUT):
+        self._lock = threading.Lock()
+        self._executor = None
+        self.method = method
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.hashed = 0
+        self.verified = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.configure()
+
+    def configure(self, method=None, workers=None, max_pending=None, timeout=None):
+        # workers=0 hashes inline on the calling thread (tests, one-off scripts).
+        # max_pending defaults to four queued hashes per worker.
+        with self._lock:
+            if method is not None:
+                self.method = method
+            if workers is not None:
+                self.workers = workers
+            if max_pending is not None:
+                self.max_pending = max_pending
+            if timeout is not None:
+                self.timeout = timeout
+            self._prefix = None
+            self._slots = threading.BoundedSemaphore(self.max_pending or max(1, self.workers) * 4)
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: the web worker is multi-threaded.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            self._count("rejected")
+            raise HasherBusy("Too many password checks in progress.")
+        try:
+            future = self._pool().submit(fn, *args)
+        except Exception:
+            slots.release()
+            raise
+        # The slot is held until the hash finishes, even if the caller times out.
+        future.add_done_callback(lambda _: slots.release())
+        return future.result(timeout=self.timeout)
+
+    def hash(self, password):
+        hashed = self._run(generate_password_hash, password, self.method)
+        self._count("hashed")
+        return hashed
+
+    def verify(self, stored_hash, password):
+        valid = self._run(check_password_hash, stored_hash, password)
+        self._count("verified")
+        return valid
+
+    def record_rehash(self):
+        # Called once an upgraded hash has been stored.
+        self._count("rehashed")
+
+    def _count(self, name):
+        # Request threads update the counters concurrently.
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def needs_rehash(self, stored_hash):
+        # True when the stored hash was made with other parameters than the
+        # configured method (e.g. fewer PBKDF2 iterations).
+        if self._prefix is None:
+            # werkzeug fills in defaults such as the iteration count, so the
+            # prefix is taken from a real hash rather than from the setting.
+            self._prefix = generate_password_hash("", self.method).split("$", 1)[0]
+        return stored_hash.split("$", 1)[0] != self._prefix
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending or max(1, self.workers) * 4,
+                "hashed": self.hashed,
+                "verified": self.verified,
+                "rejected": self.rejected,
+                "rehashed": self.rehashed,
+            }
+
+
+password_hasher = PasswordHasher()
@@ -1,24 +1,133 @@
+import logging
+from decimal import Decimal, ROUND_HALF_UP
+
+from python_scripts.rollups import record_booking
+
+logger = logging.getLogger(__name__)
+
+
+class PaymentError(Exception):
+    pass
+
+
+class InsufficientFundsError(PaymentError):
+    pass
+
+
+class BookingConflictError(PaymentError):
+    pass
+
+
+def to_cents(amount):
+    return int(Decimal(str(amount)).scaleb(2).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    return cents / 100
+
+
+def _adjust_balance(conn, user_id, delta_cents):
+    # users.balance mirrors balance_cents for anything still reading the REAL column.
+    return conn.execute('''
+        UPDATE users
+        SET balance_cents = balance_cents + ?, balance = (balance_cents + ?) / 100.0
+        WHERE id = ? AND balance_cents + ? >= 0
+    ''', (delta_cents, delta_cents, user_id, delta_cents)).rowcount
+
+
 class RealPaymentProcessor:
-    def process_payment(self, payer_id, receiver_id, amount):
-        # Logic to update balances in the database
-        import sqlite3
-        with sqlite3.connect("database.db") as conn:
-            cursor = conn.cursor()
+    # Debit, credit, booking, payment record, ledger entries and the daily
+    # rollups commit together in one BEGIN IMMEDIATE transaction, or not at all.
+    def process_payment(self, conn, booking):
+        amount = to_cents(booking["total_cost"])
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-check availability under the write lock so two workers cannot
+            # both confirm the same dates.
+            conflict = conn.execute('''
+                SELECT 1 FROM bookings
+                WHERE car_id = ? AND status = 'confirmed' AND start_date <= ? AND end_date >= ?
+                UNION ALL
+                SELECT 1 FROM availability_blocks
+                WHERE car_id = ? AND start_date <= ? AND end_date >= ?
+                LIMIT 1
+            ''', (
+                booking["car_id"], booking["end_date"], booking["start_date"],
+                booking["car_id"], booking["end_date"], booking["start_date"]
+            )).fetchone()
+            if conflict:
+                raise BookingConflictError("Car is already booked for the selected dates.")
 
-            # Deduct from renter
-            cursor.execute("UPDATE users SET balance = balance - ? WHERE id = ?", (amount, payer_id))
+            if not _adjust_balance(conn, booking["renter_id"], -amount):
+                raise InsufficientFundsError("Insufficient balance. Please add funds in your profile.")
+            _adjust_balance(conn, booking["owner_id"], amount)
 
-            # Add to owner
-            cursor.execute("UPDATE users SET balance = balance + ? WHERE id = ?", (amount, receiver_id))
+            booking_id = conn.execute('''
+                INSERT INTO bookings (car_id, renter_id, start_date, end_date, total_cost, status)
+                VALUES (?, ?, ?, ?, ?, 'confirmed')
+            ''', (
+                booking["car_id"], booking["renter_id"], booking["start_date"], booking["end_date"],
+                from_cents(amount)
+            )).lastrowid
+            conn.execute('''
+                INSERT INTO payments (booking_id, payer_id, payee_id, amount)
+                VALUES (?, ?, ?, ?)
+            ''', (booking_id, booking["renter_id"], booking["owner_id"], from_cents(amount)))
+            conn.executemany('''
+                INSERT INTO ledger (user_id, booking_id, amount_cents, entry_type)
+                VALUES (?, ?, ?, ?)
+            ''', [
+                (booking["renter_id"], booking_id, -amount, "booking_debit"),
+                (booking["owner_id"], booking_id, amount, "booking_credit"),
+            ])
+            record_booking(
+                conn, booking["car_id"], booking["owner_id"], booking["start_date"], booking["end_date"], amount
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info("$%.2f transferred from User %s to User %s.", from_cents(amount), booking["renter_id"], booking["owner_id"])
+        return booking_id
 
-            # Simulate notification
-            print(f"NotifyObserver: ${amount} transferred from User {payer_id} to User {receiver_id}.")
+    def deposit(self, conn, user_id, amount):
+        cents = to_cents(amount)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not _adjust_balance(conn, user_id, cents):
+                raise PaymentError("User not found.")
+            conn.execute(
+                "INSERT INTO ledger (user_id, amount_cents, entry_type) VALUES (?, ?, 'deposit')",
+                (user_id, cents)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
 
 
+# Proxy Pattern for Payments
 class PaymentProxy:
     def __init__(self):
         self.processor = RealPaymentProcessor()
 
-    def pay(self, payer_id, receiver_id, amount):
-        print(f"Proxy: Initiating payment of ${amount} from {payer_id} to {receiver_id}")
-        self.processor.process_payment(payer_id, receiver_id, amount)
+    def pay(self, conn, booking):
+        if booking["total_cost"] < 0:
+            raise PaymentError("Invalid payment amount.")
+        logger.info("Proxy: Initiating payment of $%.2f from %s to %s", booking["total_cost"], booking["renter_id"], booking["owner_id"])
+        return self.processor.process_payment(conn, booking)
+
+    def deposit(self, conn, user_id, amount):
+        if amount <= 0:
+            raise ValueError("Amount must be positive.")
+        self.processor.deposit(conn, user_id, amount)
+
+
+def rebuild_balances(conn):
+    # The ledger is the source of truth; cached balances can always be recomputed from it.
+    with conn:
+        conn.execute('''
+            UPDATE users
+            SET balance_cents = (SELECT COALESCE(SUM(amount_cents), 0) FROM ledger WHERE ledger.user_id = users.id)
+        ''')
+        conn.execute("UPDATE users SET balance = balance_cents / 100.0")
@@ -0,0 +1,77 @@
+# Rating aggregates: per user (every review they received) and per car (the
+# reviews renters left for a booking of it), each with the number of ratings,
+# their sum and how many of each star. An average is rating_sum / rating_count.
+#
+# review() and review_renter() call record_review in the transaction that
+# inserts the review; rebuild_ratings recomputes both tables from reviews.
+STARS = range(1, 6)
+STAR_COLUMNS = ", ".join(f"stars_{star}" for star in STARS)
+STAR_SUMS = ", ".join(f"SUM(r.rating = {star})" for star in STARS)
+STAR_FLAGS = ", ".join(f"r.rating = {star}" for star in STARS)
+STAR_UPDATES = ", ".join(f"stars_{star} = stars_{star} + excluded.stars_{star}" for star in STARS)
+
+# Only whole-star ratings count, so rating_count always equals the sum of the
+# stars_N columns. The review routes reject anything else (parse_rating), but
+# the reviews column would accept e.g. 4.5.
+RATED = f"r.rating IN ({', '.join(str(star) for star in STARS)})"
+
+# A car's reviews are the ones written by the renter of the booking.
+CAR_REVIEWS = f'''
+    FROM reviews r
+    JOIN bookings b ON b.id = r.booking_id AND b.renter_id = r.reviewer_id
+    WHERE {RATED}
+'''
+
+
+def parse_rating(value):
+    try:
+        rating = int(value.strip())
+    except (AttributeError, ValueError):
+        rating = None
+    if rating not in STARS:
+        raise ValueError("Rating must be a whole number from 1 to 5.")
+    return rating
+
+
+def average_rating(count, total):
+    return total / count if count else None
+
+
+def record_review(conn, review_id):
+    # Runs inside the caller's transaction, after the review row is inserted.
+    conn.execute(f'''
+        INSERT INTO user_rating_stats (user_id, rating_count, rating_sum, {STAR_COLUMNS})
+        SELECT r.reviewee_id, 1, r.rating, {STAR_FLAGS}
+        FROM reviews r WHERE r.id = ? AND {RATED}
+        ON CONFLICT(user_id) DO UPDATE SET
+            rating_count = rating_count + 1,
+            rating_sum = rating_sum + excluded.rating_sum,
+            {STAR_UPDATES}
+    ''', (review_id,))
+    conn.execute(f'''
+        INSERT INTO car_rating_stats (car_id, rating_count, rating_sum, {STAR_COLUMNS})
+        SELECT b.car_id, 1, r.rating, {STAR_FLAGS}
+        {CAR_REVIEWS} AND r.id = ?
+        ON CONFLICT(car_id) DO UPDATE SET
+            rating_count = rating_count + 1,
+            rating_sum = rating_sum + excluded.rating_sum,
+            {STAR_UPDATES}
+    ''', (review_id,))
+
+
+def rebuild_ratings(conn):
+    conn.execute("DELETE FROM user_rating_stats")
+    conn.execute("DELETE FROM car_rating_stats")
+    conn.execute(f'''
+        INSERT INTO user_rating_stats (user_id, rating_count, rating_sum, {STAR_COLUMNS})
+        SELECT r.reviewee_id, COUNT(*), SUM(r.rating), {STAR_SUMS}
+        FROM reviews r
+        WHERE {RATED}
+        GROUP BY r.reviewee_id
+    ''')
+    conn.execute(f'''
+        INSERT INTO car_rating_stats (car_id, rating_count, rating_sum, {STAR_COLUMNS})
+        SELECT b.car_id, COUNT(*), SUM(r.rating), {STAR_SUMS}
+        {CAR_REVIEWS}
+        GROUP BY b.car_id
+    ''')
@@ -0,0 +1,117 @@
+# Daily earnings and utilization rollups: one row per car per booked day
+# (car_daily_stats) and one per owner per day (owner_daily_stats), each with
+# the days booked, the revenue earned on that day and the bookings that start
+# on it. A booking's revenue is spread evenly over its days, leftover cents
+# going to the first ones.
+#
+# The payment transaction adds each confirmed booking (record_booking), a
+# trigger on cars takes a deleted car's days back out of its owner's rows
+# (see migrations.py), and rebuild_rollups recomputes both tables from the
+# confirmed bookings. The rebuild expands bookings into days with NumPy when
+# it is installed, and in SQL otherwise.
+from datetime import date, timedelta
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def booking_days(start_date, end_date, amount_cents):
+    # (day, revenue_cents, bookings) for each day from start_date to end_date.
+    start = date.fromisoformat(start_date)
+    count = (date.fromisoformat(end_date) - start).days + 1
+    base, extra = divmod(amount_cents, count)
+    return [((start + timedelta(days=i)).isoformat(), base + (i < extra), int(i == 0)) for i in range(count)]
+
+
+def record_booking(conn, car_id, owner_id, start_date, end_date, amount_cents):
+    # Runs inside the caller's transaction.
+    days = booking_days(start_date, end_date, amount_cents)
+    conn.executemany('''
+        INSERT INTO car_daily_stats (car_id, day, booked_days, revenue_cents, bookings) VALUES (?, ?, 1, ?, ?)
+        ON CONFLICT(car_id, day) DO UPDATE SET
+            booked_days = booked_days + 1,
+            revenue_cents = revenue_cents + excluded.revenue_cents,
+            bookings = bookings + excluded.bookings
+    ''', [(car_id, day, revenue, bookings) for day, revenue, bookings in days])
+    conn.executemany('''
+        INSERT INTO owner_daily_stats (owner_id, day, booked_days, revenue_cents, bookings) VALUES (?, ?, 1, ?, ?)
+        ON CONFLICT(owner_id, day) DO UPDATE SET
+            booked_days = booked_days + 1,
+            revenue_cents = revenue_cents + excluded.revenue_cents,
+            bookings = bookings + excluded.bookings
+    ''', [(owner_id, day, revenue, bookings) for day, revenue, bookings in days])
+
+
+def _expand_sql(conn):
+    conn.execute('''
+        WITH RECURSIVE spans(car_id, day, last_day, offset, days, cents) AS (
+            SELECT car_id, start_date, end_date, 0,
+                   CAST(julianday(end_date) - julianday(start_date) AS INTEGER) + 1,
+                   CAST(ROUND(COALESCE(total_cost, 0) * 100) AS INTEGER)
+            FROM bookings
+            WHERE status = 'confirmed' AND end_date >= start_date
+            UNION ALL
+            SELECT car_id, date(day, '+1 day'), last_day, offset + 1, days, cents
+            FROM spans WHERE day < last_day
+        )
+        INSERT INTO car_daily_stats (car_id, day, booked_days, revenue_cents, bookings)
+        SELECT car_id, day, COUNT(*), SUM(cents / days + (offset < cents % days)), SUM(offset = 0)
+        FROM spans
+        GROUP BY car_id, day
+    ''')
+
+
+def _expand_numpy(conn):
+    rows = conn.execute('''
+        SELECT car_id, start_date, end_date, COALESCE(total_cost, 0) FROM bookings
+        WHERE status = 'confirmed' AND end_date >= start_date
+    ''').fetchall()
+    if not rows:
+        return
+    car_ids, starts, ends, costs = zip(*rows)
+    car_ids = numpy.array(car_ids, dtype=numpy.int64)
+    starts = numpy.array(starts, dtype="datetime64[D]").astype(numpy.int64)
+    ends = numpy.array(ends, dtype="datetime64[D]").astype(numpy.int64)
+    cents = numpy.rint(numpy.array(costs, dtype=numpy.float64) * 100).astype(numpy.int64)
+    lengths = ends - starts + 1
+
+    # One element per booked day: which booking it belongs to and its offset in it.
+    booking = numpy.repeat(numpy.arange(len(rows)), lengths)
+    offset = numpy.arange(booking.size) - numpy.repeat(numpy.cumsum(lengths) - lengths, lengths)
+    cars = car_ids[booking]
+    days = starts[booking] + offset
+    revenue = cents[booking] // lengths[booking] + (offset < cents[booking] % lengths[booking])
+    started = (offset == 0).astype(numpy.int64)
+
+    # Sum days that fall on the same (car, day).
+    order = numpy.lexsort((days, cars))
+    cars, days, revenue, started = cars[order], days[order], revenue[order], started[order]
+    first = numpy.flatnonzero(numpy.r_[True, (cars[1:] != cars[:-1]) | (days[1:] != days[:-1])])
+    conn.executemany(
+        "INSERT INTO car_daily_stats (car_id, day, booked_days, revenue_cents, bookings) VALUES (?, ?, ?, ?, ?)",
+        zip(
+            cars[first].tolist(),
+            days[first].astype("datetime64[D]").astype(str).tolist(),
+            numpy.diff(numpy.r_[first, cars.size]).tolist(),
+            numpy.add.reduceat(revenue, first).tolist(),
+            numpy.add.reduceat(started, first).tolist(),
+        ),
+    )
+
+
+def rebuild_rollups(conn):
+    conn.execute("DELETE FROM car_daily_stats")
+    conn.execute("DELETE FROM owner_daily_stats")
+    if numpy is not None:
+        _expand_numpy(conn)
+    else:
+        _expand_sql(conn)
+    conn.execute('''
+        INSERT INTO owner_daily_stats (owner_id, day, booked_days, revenue_cents, bookings)
+        SELECT c.owner_id, s.day, SUM(s.booked_days), SUM(s.revenue_cents), SUM(s.bookings)
+        FROM car_daily_stats s
+        JOIN cars c ON c.id = s.car_id
+        GROUP BY c.owner_id, s.day
+    ''')
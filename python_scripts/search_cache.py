@@ -0,0 +1,66 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+DEFAULT_CAPACITY = 2000
+
+
+def read_search_version(conn):
+    row = conn.execute("SELECT version, updated_at FROM cache_versions WHERE name = 'search'").fetchone()
+    return (row["version"], row["updated_at"]) if row else (0, 0)
+
+
+# Caches search results under the normalized query. Entries belong to one
+# generation of the 'search' stamp, which triggers bump whenever cars,
+# bookings or availability change, so a new generation makes every older
+# entry unreachable.
+class SearchCache:
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._generation = None
+        self._lock = threading.Lock()
+
+    def get(self, generation, key):
+        with self._lock:
+            if generation != self._generation:
+                self._entries.clear()
+                self._generation = generation
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, generation, key, value):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        # The stamp moves at commit, but the in-process indexes are refreshed
+        # just after it; drop anything computed in between.
+        with self._lock:
+            self._entries.clear()
+            self._generation = None
+
+    @staticmethod
+    def etag(generation, key, *variant):
+        # variant carries whatever else changes the rendered page (user, format, ...).
+        raw = repr((generation, key) + variant).encode()
+        return hashlib.sha1(raw).hexdigest()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+search_cache = SearchCache()
@@ -0,0 +1,44 @@
+# Keeps a worker's in-process search structures (the search index, the
+# availability engine and bitmap) in step with writes made by other workers.
+#
+# The triggers that bump the 'search' stamp also append the id of the car each
+# write touched to search_changes, in the same transaction (see migrations.py).
+# Each structure remembers the stamp and log position it has caught up to;
+# when the stamp moves it refreshes just the cars logged since, and reloads
+# everything after a bulk load (a NULL car id), a long backlog or a gap left
+# by pruning.
+from python_scripts.search_cache import read_search_version
+
+MAX_REPLAY = 500
+# Rows kept in search_changes; a worker further behind than this reloads.
+KEEP_CHANGES = 20000
+
+
+class ChangeCursor:
+    def __init__(self):
+        self.generation = None
+        self.position = 0
+
+    def start(self, conn):
+        # Call before (re)loading; anything committed while loading is
+        # refreshed again on the next pending() call.
+        self.generation = read_search_version(conn)[0]
+        self.position = conn.execute("SELECT COALESCE(MAX(id), 0) FROM search_changes").fetchone()[0]
+
+    def pending(self, conn):
+        # Returns the ids of the cars changed since the last call, or None
+        # when the caller has to reload everything.
+        generation = read_search_version(conn)[0]
+        if generation == self.generation:
+            return set()
+        rows = conn.execute(
+            "SELECT id, car_id FROM search_changes WHERE id > ? ORDER BY id LIMIT ?",
+            (self.position, MAX_REPLAY + 1)
+        ).fetchall()
+        if rows and (rows[0][0] != self.position + 1 or len(rows) > MAX_REPLAY
+                     or any(car_id is None for _, car_id in rows)):
+            return None
+        self.generation = generation
+        if rows:
+            self.position = rows[-1][0]
+        return {car_id for _, car_id in rows}
@@ -0,0 +1,413 @@
+import bisect
+import heapq
+import itertools
+import string
+import threading
+from collections import defaultdict
+
+from python_scripts.geo import GeoGrid
+from python_scripts.ratings import average_rating
+from python_scripts.search_changes import ChangeCursor
+
+# Longest substring stored in the postings. Shorter queries are answered
+# straight from the postings; longer ones intersect their grams and then
+# confirm the substring on the few remaining candidates.
+GRAM = 3
+FETCH_CHUNK = 500
+# A car row as the index and the search results read it: the cars columns plus
+# the car's rating count and sum.
+CAR_ROWS = '''
+    SELECT c.*, COALESCE(s.rating_count, 0) AS rating_count, COALESCE(s.rating_sum, 0) AS rating_sum
+    FROM cars c
+    LEFT JOIN car_rating_stats s ON s.car_id = c.id
+'''
+
+# Sort orders besides id and distance. Results are in ascending (value, id)
+# order, where value is the expression below (negated for "highest first"
+# orders); the pair is also the keyset cursor. Unrated cars sort after rated ones.
+UNRATED = 1
+SORT_SQL = {
+    "price": "c.price",
+    "year": "-c.year",
+    "mileage": "c.mileage",
+    "rating": f"CASE WHEN s.rating_count > 0 THEN -(s.rating_sum * 1.0 / s.rating_count) ELSE {UNRATED} END",
+    "newest": "-c.id",
+}
+SORTS = tuple(SORT_SQL)
+
+
+def row_sort_value(sort, car):
+    # SORT_SQL[sort] evaluated on a CAR_ROWS row.
+    if sort == "rating":
+        return -average_rating(car["rating_count"], car["rating_sum"]) if car["rating_count"] else UNRATED
+    if sort in ("year", "newest"):
+        return -car["year" if sort == "year" else "id"]
+    return car[sort]
+
+# SQLite's LOWER() and LIKE only fold ASCII letters, so the index does the same.
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def fold(text):
+    return text.translate(ASCII_LOWER)
+
+
+def grams(text):
+    found = set()
+    for size in range(1, GRAM + 1):
+        for i in range(len(text) - size + 1):
+            found.add(text[i:i + size])
+    return found
+
+
+class SubstringIndex:
+    # Answers LOWER(field) LIKE LOWER('%query%') for one text column.
+    def __init__(self):
+        self.postings = defaultdict(set)
+        self.values = {}
+
+    def add(self, doc_id, text):
+        if text is None:
+            return
+        text = fold(text)
+        self.values[doc_id] = text
+        for gram in grams(text):
+            self.postings[gram].add(doc_id)
+
+    def remove(self, doc_id):
+        text = self.values.pop(doc_id, None)
+        if text is None:
+            return
+        for gram in grams(text):
+            ids = self.postings.get(gram)
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del self.postings[gram]
+
+    def estimate(self, query):
+        # Upper bound on len(search(query)): the postings of its rarest gram.
+        query = fold(query)
+        if not query:
+            return len(self.values)
+        return min(len(self.postings.get(query[i:i + GRAM], ())) for i in range(max(1, len(query) - GRAM + 1)))
+
+    def search(self, query):
+        query = fold(query)
+        if not query:
+            # LIKE '%%' matches every non-NULL value.
+            return set(self.values)
+        if len(query) <= GRAM:
+            return set(self.postings.get(query, ()))
+        parts = sorted(
+            (self.postings.get(query[i:i + GRAM], ()) for i in range(len(query) - GRAM + 1)),
+            key=len,
+        )
+        candidates = set(parts[0])
+        for ids in parts[1:]:
+            candidates &= ids
+            if not candidates:
+                return candidates
+        return {doc_id for doc_id in candidates if query in self.values[doc_id]}
+
+
+class PriceIndex:
+    # Sorted (price, id) pairs; a price range is two bisects.
+    def __init__(self):
+        self.keys = []
+        self.prices = {}
+
+    def add(self, doc_id, price):
+        self.prices[doc_id] = price
+        bisect.insort(self.keys, (price, doc_id))
+
+    def remove(self, doc_id):
+        price = self.prices.pop(doc_id, None)
+        if price is None:
+            return
+        i = bisect.bisect_left(self.keys, (price, doc_id))
+        if i < len(self.keys) and self.keys[i] == (price, doc_id):
+            del self.keys[i]
+
+    def span(self, min_price=None, max_price=None):
+        # Slice bounds of a price range within keys.
+        lo = 0 if min_price is None else bisect.bisect_left(self.keys, (min_price, float("-inf")))
+        hi = len(self.keys) if max_price is None else bisect.bisect_right(self.keys, (max_price, float("inf")))
+        return lo, hi
+
+    def between(self, min_price=None, max_price=None):
+        lo, hi = self.span(min_price, max_price)
+        return {doc_id for _, doc_id in self.keys[lo:hi]}
+
+
+class CarSearchIndex:
+    TEXT_FIELDS = ("location", "make", "color")
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self.changes = ChangeCursor()
+        self._reset()
+
+    def _reset(self):
+        self.text = {field: SubstringIndex() for field in self.TEXT_FIELDS}
+        self.price = PriceIndex()
+        self.geo = GeoGrid()
+        self.available = set()
+        # {car_id: (average rating, rating count)} for rated cars.
+        self.ratings = {}
+        # {sort: {car_id: value}}, the value being what SORT_SQL[sort] gives the car.
+        self.sort_values = {sort: {} for sort in SORTS}
+        self.sort_values["price"] = self.price.prices
+
+    def load(self, conn):
+        with self._lock:
+            self.changes.start(conn)
+            self._reset()
+            for row in conn.execute(CAR_ROWS + " ORDER BY c.price, c.id"):
+                self._add_row(row)
+            self._loaded = True
+
+    def ensure_loaded(self, conn):
+        # Loads on first use, then catches up with the cars other workers changed.
+        with self._lock:
+            changed = self.changes.pending(conn) if self._loaded else None
+            if changed is None:
+                self.load(conn)
+            elif changed:
+                rows = fetch_cars(conn, sorted(changed))
+                for car_id in changed:
+                    self._remove(car_id)
+                for row in rows:
+                    self._add_row(row)
+
+    def _add(self, car_id, location, make, color, price, is_available, latitude=None, longitude=None,
+             rating_count=0, rating_sum=0, year=None, mileage=None):
+        self.text["location"].add(car_id, location)
+        self.text["make"].add(car_id, make)
+        self.text["color"].add(car_id, color)
+        self.price.add(car_id, price)
+        self.geo.add(car_id, latitude, longitude)
+        if is_available == 1:
+            self.available.add(car_id)
+        if rating_count:
+            self.ratings[car_id] = (average_rating(rating_count, rating_sum), rating_count)
+        values = self.sort_values
+        values["rating"][car_id] = -self.ratings[car_id][0] if rating_count else UNRATED
+        values["newest"][car_id] = -car_id
+        if year is not None:
+            values["year"][car_id] = -year
+        if mileage is not None:
+            values["mileage"][car_id] = mileage
+
+    def _add_row(self, row):
+        self._add(
+            row["id"], row["location"], row["make"], row["color"], row["price"], row["is_available"],
+            row["latitude"], row["longitude"], row["rating_count"], row["rating_sum"], row["year"], row["mileage"],
+        )
+
+    def _remove(self, car_id):
+        for index in self.text.values():
+            index.remove(car_id)
+        self.price.remove(car_id)
+        self.geo.remove(car_id)
+        self.available.discard(car_id)
+        self.ratings.pop(car_id, None)
+        for values in self.sort_values.values():
+            values.pop(car_id, None)
+
+    def add_car(self, car_id, location, make, color, price, is_available=1, latitude=None, longitude=None,
+                rating_count=0, rating_sum=0, year=None, mileage=None):
+        with self._lock:
+            self._remove(car_id)
+            self._add(
+                car_id, location, make, color, price, is_available, latitude, longitude,
+                rating_count, rating_sum, year, mileage,
+            )
+
+    def remove_car(self, car_id):
+        with self._lock:
+            self._remove(car_id)
+
+    def refresh_car(self, conn, car_id):
+        if not self._loaded:
+            return
+        row = conn.execute(CAR_ROWS + " WHERE c.id = ?", (car_id,)).fetchone()
+        with self._lock:
+            self._remove(car_id)
+            if row is not None:
+                self._add_row(row)
+
+    @staticmethod
+    def supports(*queries):
+        # '%' and '_' are LIKE wildcards; those queries go to SQL unchanged.
+        return not any("%" in q or "_" in q for q in queries)
+
+    def near(self, area):
+        # {car_id: distance_km or None} for cars with coordinates inside area.
+        with self._lock:
+            return self.geo.query(area)
+
+    def nearest(self, area, after=None, location="", make="", color="", min_price=None, max_price=None, wanted=20):
+        # Matching cars inside area (which has a center) as (distance_km, car_id),
+        # nearest first, rounded to 0.1 m so the pair can be used as a keyset
+        # cursor; only pairs after `after` are produced. `wanted` is roughly how
+        # many the caller will read and only steers the plan.
+        filters = [(self.text[field], fold(query)) for field, query in (("location", location), ("make", make), ("color", color)) if query]
+        with self._lock:
+            cells = self.geo.cells_by_distance(area)
+            in_area = sum(len(self.geo.cells[cell]) for _, cell in cells)
+            lo, hi = self.price.span(min_price, max_price)
+            estimates = sorted((index.estimate(query), n) for n, (index, query) in enumerate(filters))
+            total = max(1, len(self.geo.points))
+        low = float("-inf") if min_price is None else min_price
+        high = float("inf") if max_price is None else max_price
+        prices = self.price.prices
+        available = self.available
+        checks = [(index.values, query) for index, query in filters]
+
+        def accept(car_id):
+            if car_id not in available or not low <= prices.get(car_id, low) <= high:
+                return False
+            for values, query in checks:
+                value = values.get(car_id)
+                if value is None or query not in value:
+                    return False
+            return True
+
+        # The walk reads about wanted / selectivity cars (the whole area at
+        # worst) before it has enough; ranking reads every match of its filter.
+        selectivity = (hi - lo) / total
+        for estimate, _ in estimates:
+            selectivity *= estimate / total
+        walk_cost = min(in_area, wanted / selectivity if selectivity else in_area)
+        if estimates and estimates[0][0] < min(walk_cost, hi - lo):
+            index, query = filters[estimates[0][1]]
+            with self._lock:
+                candidates = index.search(query)
+            return self._rank(area, candidates, accept, after)
+        if hi - lo < walk_cost:
+            with self._lock:
+                candidates = [car_id for _, car_id in self.price.keys[lo:hi]]
+            return self._rank(area, candidates, accept, after)
+        return self._walk(area, cells, accept, after)
+
+    def _rank(self, area, candidates, accept, after):
+        ranked = []
+        points = self.geo.points
+        for car_id in candidates:
+            point = points.get(car_id)
+            if point is None or not accept(car_id):
+                continue
+            distance = area.contains(*point)
+            if distance is not False and (after is None or (round(distance, 4), car_id) > after):
+                ranked.append((round(distance, 4), car_id))
+        ranked.sort()
+        return iter(ranked)
+
+    def _walk(self, area, cells, accept, after):
+        # Reads grid cells in order of their distance bound and yields a car
+        # once no unread cell can hold a nearer one, so a page only reads the
+        # cells it needs.
+        heap = []
+        for bound, cell in cells:
+            bound = round(bound, 4)
+            while heap and heap[0][0] < bound:
+                yield heapq.heappop(heap)
+            # On later pages, cells wholly nearer than the cursor hold nothing new.
+            if after is not None and self.geo.reach(cell, area) + 1e-4 < after[0]:
+                continue
+            with self._lock:
+                members = [(car_id, self.geo.points[car_id]) for car_id in self.geo.cells.get(cell, ())]
+            for car_id, (lat, lng) in members:
+                if not accept(car_id):
+                    continue
+                distance = area.contains(lat, lng)
+                if distance is False:
+                    continue
+                key = (round(distance, 4), car_id)
+                if after is None or key > after:
+                    heapq.heappush(heap, key)
+        while heap:
+            yield heapq.heappop(heap)
+
+    def matches(self, location="", make="", color="", min_price=None, max_price=None, within=None):
+        # Set of matching available car ids. within: optional ids (e.g. from
+        # near()) the result must also be in.
+        with self._lock:
+            sets = [self.available]
+            # location is NOT NULL, so an empty query matches every car.
+            if location:
+                sets.append(self.text["location"].search(location))
+            if within is not None:
+                sets.append(within)
+            if make:
+                sets.append(self.text["make"].search(make))
+            if color:
+                sets.append(self.text["color"].search(color))
+            if min_price is not None or max_price is not None:
+                sets.append(self.price.between(min_price, max_price))
+            sets.sort(key=len)
+            result = set(sets[0])
+            for ids in sets[1:]:
+                result &= ids
+        return result
+
+    def search(self, location="", make="", color="", min_price=None, max_price=None, within=None):
+        return sorted(self.matches(location, make, color, min_price, max_price, within))
+
+    def ordered(self, car_ids, sort, after=None, wanted=20):
+        # car_ids (a set) as (value, car_id) in ascending order, only pairs
+        # after `after`. Nothing sorts the whole set: each round keeps the next
+        # `wanted` in a bounded heap (heapq.nsmallest), and a caller that reads
+        # past a round gets another, twice as large, from where it stopped.
+        # Cheapest-first over a large share of the cars walks the price index
+        # instead, which is already in that order.
+        values = self.sort_values[sort]
+        if sort == "price" and car_ids and wanted * len(values) < len(car_ids) ** 2:
+            return self._walk_prices(car_ids, after)
+        return self._top(car_ids, values, after, wanted)
+
+    def _walk_prices(self, car_ids, after):
+        keys = self.price.keys
+        last = (float("-inf"),) if after is None else tuple(after)
+        while True:
+            # Re-find the position each chunk; cars may be added or removed meanwhile.
+            with self._lock:
+                i = bisect.bisect_right(keys, last)
+                chunk = keys[i:i + FETCH_CHUNK]
+            if not chunk:
+                return
+            last = chunk[-1]
+            for key in chunk:
+                if key[1] in car_ids:
+                    yield key
+
+    @staticmethod
+    def _top(car_ids, values, after, wanted):
+        # The (value, car_id) pairs are built and filtered by map/zip/filter,
+        # so a round costs one comparison per candidate in Python. A car removed
+        # meanwhile has no value; it sorts last and fetch_cars will not find it.
+        size = max(1, wanted)
+        missing = itertools.repeat(float("inf"))
+        while True:
+            keys = zip(map(values.get, car_ids, missing), car_ids)
+            if after is not None:
+                keys = filter(tuple(after).__lt__, keys)
+            page = heapq.nsmallest(size, keys)
+            yield from page
+            if len(page) < size:
+                return
+            after = page[-1]
+            size *= 2
+
+def fetch_cars(conn, car_ids):
+    cars = []
+    for i in range(0, len(car_ids), FETCH_CHUNK):
+        chunk = car_ids[i:i + FETCH_CHUNK]
+        placeholders = ",".join("?" * len(chunk))
+        cars.extend(conn.execute(CAR_ROWS + f" WHERE c.id IN ({placeholders}) ORDER BY c.id", chunk))
+    return cars
+
+
+search_index = CarSearchIndex()
@@ -0,0 +1,99 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_CACHE_SIZE = 10000
+# Entries are re-read from the table after this many seconds so a logout in
+# another worker takes effect there too.
+DEFAULT_CACHE_TTL = 30
+DEFAULT_LIFETIME = 14 * 24 * 3600
+
+
+class SessionRecord:
+    __slots__ = ("sid", "user_id", "email", "role", "expires_at", "cached_at")
+
+    def __init__(self, sid, user_id, email, role, expires_at, cached_at):
+        self.sid = sid
+        self.user_id = user_id
+        self.email = email
+        self.role = role
+        self.expires_at = expires_at
+        self.cached_at = cached_at
+
+
+# LRU of live sessions in front of the shared sessions table. Any worker can
+# resolve any session id; cache hits never touch the database.
+class SessionStore:
+    def __init__(self, capacity=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL, lifetime=DEFAULT_LIFETIME):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.lifetime = lifetime
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, capacity=None, ttl=None, lifetime=None):
+        if capacity is not None:
+            self.capacity = capacity
+        if ttl is not None:
+            self.ttl = ttl
+        if lifetime is not None:
+            self.lifetime = lifetime
+
+    def _remember(self, record):
+        with self._lock:
+            self._cache[record.sid] = record
+            self._cache.move_to_end(record.sid)
+            while len(self._cache) > self.capacity:
+                self._cache.popitem(last=False)
+
+    def _forget(self, sid):
+        with self._lock:
+            self._cache.pop(sid, None)
+
+    def create(self, conn, user_id, email, role):
+        sid = secrets.token_urlsafe(32)
+        now = time.time()
+        expires_at = int(now + self.lifetime)
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE expires_at < ?", (int(now),))
+            conn.execute(
+                "INSERT INTO sessions (sid, user_id, email, role, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (sid, user_id, email, role, expires_at),
+            )
+        self._remember(SessionRecord(sid, user_id, email, role, expires_at, now))
+        return sid
+
+    def get(self, sid, connect):
+        now = time.time()
+        with self._lock:
+            record = self._cache.get(sid)
+            if record is not None:
+                if now - record.cached_at < self.ttl and record.expires_at > now:
+                    self._cache.move_to_end(sid)
+                    self.hits += 1
+                    return record
+                del self._cache[sid]
+            self.misses += 1
+        row = connect().execute(
+            "SELECT user_id, email, role, expires_at FROM sessions WHERE sid = ?", (sid,)
+        ).fetchone()
+        if row is None or row["expires_at"] <= now:
+            return None
+        record = SessionRecord(sid, row["user_id"], row["email"], row["role"], row["expires_at"], now)
+        self._remember(record)
+        return record
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._cache)}
+
+    def delete(self, conn, sid):
+        self._forget(sid)
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+
+session_store = SessionStore()
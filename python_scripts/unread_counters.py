@@ -0,0 +1,22 @@
+# Per-user unread counts for the navbar badges. The counters are kept in
+# step with notifications and messages by triggers (see migrations.py), so
+# reading them is a single primary-key lookup.
+
+
+def read_counters(conn, user_id):
+    row = conn.execute(
+        "SELECT unread_notifications, unread_messages FROM user_counters WHERE user_id = ?",
+        (user_id,)
+    ).fetchone()
+    return (row[0], row[1]) if row else (0, 0)
+
+
+def rebuild_counters(conn):
+    conn.execute("DELETE FROM user_counters")
+    conn.execute('''
+        INSERT INTO user_counters (user_id, unread_notifications, unread_messages)
+        SELECT u.id,
+               (SELECT COUNT(*) FROM notifications n WHERE n.user_id = u.id AND n.is_read = 0),
+               (SELECT COUNT(*) FROM messages m WHERE m.receiver_id = u.id AND m.is_read = 0)
+        FROM users u
+    ''')
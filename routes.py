@@ -1,37 +1,75 @@
-from flask import render_template, request, redirect, url_for, flash, session
+import bisect
+import itertools
+import json
+import time
+from flask import render_template, request, redirect, url_for, flash, session, g, current_app
 import sqlite3
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.http import is_resource_modified
+from calendar import monthrange
 from datetime import datetime, timedelta
-from python_scripts.payment_proxy import PaymentProxy
+from python_scripts.payment_proxy import PaymentProxy, InsufficientFundsError, BookingConflictError, from_cents
+from python_scripts.db_pool import get_db, pool
+from python_scripts.session_store import session_store
+from python_scripts.notification_queue import notification_writer
+from python_scripts.availability_engine import engine as availability_engine, BOOKED, BLOCKED, to_day, from_day
+from python_scripts.availability_blocks import parse_blocks, save_blocks
+from python_scripts import availability_calendar
+from python_scripts.search_index import search_index, fetch_cars, fold, row_sort_value, CAR_ROWS, SORTS, SORT_SQL
+from python_scripts.geo import GeoArea, DEFAULT_RADIUS_KM, parse_point, parse_bbox
+from python_scripts.car_cache import car_cache
+from python_scripts.search_cache import search_cache, read_search_version
+from python_scripts.ratings import parse_rating, record_review
+from python_scripts.unread_counters import read_counters
+from python_scripts.conversations import find_conversation, pair as conversation_pair, send_message as send_message_in_conversation
+from python_scripts.event_hub import event_hub
+from python_scripts.password_hasher import password_hasher, HasherBusy
+from python_scripts import metrics
+from python_scripts.availability_bitmap import availability_bitmap
+from python_scripts.pagination import (
+    decode_cursor, keyset_query, next_page_url, page_json, page_size, paginate, wants_json
+)
 
 #import scripts to use for design patterns
 from python_scripts.forgot_pass_cor import PasswordRecoveryManager
 
 
-# Singleton Pattern for Session
+# Request-scoped Session backed by the shared session store
 class UserSession:
-    _instance = None
-
-    def __init__(self):
-        if UserSession._instance is not None:
-            raise Exception("Singleton already exists!")
-        self.user_id = None
-        self.email = None
-        self.role = None
-        UserSession._instance = self
+    def __init__(self, sid=None, user_id=None, email=None, role=None):
+        self.sid = sid
+        self.user_id = user_id
+        self.email = email
+        self.role = role
 
     @staticmethod
     def get_instance():
-        if UserSession._instance is None:
-            UserSession()
-        return UserSession._instance
+        # Resolved once per request from the signed session cookie.
+        if "user_session" not in g:
+            g.user_session = UserSession._from_cookie()
+        return g.user_session
+
+    @staticmethod
+    def _from_cookie():
+        sid = session.get("sid")
+        record = session_store.get(sid, get_db) if sid else None
+        if record is None:
+            return UserSession()
+        return UserSession(record.sid, record.user_id, record.email, record.role)
 
     def login(self, user_id, email, role):
+        if self.sid:
+            session_store.delete(get_db(), self.sid)
+        self.sid = session_store.create(get_db(), user_id, email, role)
+        session["sid"] = self.sid
         self.user_id = user_id
         self.email = email
         self.role = role
 
     def logout(self):
+        if self.sid:
+            session_store.delete(get_db(), self.sid)
+        session.pop("sid", None)
+        self.sid = None
         self.user_id = None
         self.email = None
         self.role = None
@@ -42,7 +80,8 @@ class UserSession:
 
 # Builder Pattern for Car Creation
 class Car:
-    def __init__(self, owner_id, make, model, year, mileage, color, price, location, precise_location):
+    def __init__(self, owner_id, make, model, year, mileage, color, price, location, precise_location,
+                 latitude=None, longitude=None):
         self.owner_id = owner_id
         self.make = make
         self.model = model
@@ -52,6 +91,8 @@ class Car:
         self.price = price
         self.location = location
         self.precise_location = precise_location
+        self.latitude = latitude
+        self.longitude = longitude
 
 class CarBuilder:
     def __init__(self):
@@ -93,6 +134,11 @@ class CarBuilder:
         self._car_data["precise_location"] = precise_location
         return self
 
+    def set_coordinates(self, point):
+        # point is (latitude, longitude) or None.
+        self._car_data["latitude"], self._car_data["longitude"] = point or (None, None)
+        return self
+
     def build(self):
         return Car(**self._car_data)
 
@@ -119,18 +165,95 @@ class Observer:
     
 class InAppNotification(Observer):
     def update(self, message, user_id):
-        with sqlite3.connect("database.db") as conn:
+        with get_db() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO notifications (user_id, message, timestamp, is_read)
                 VALUES (?, ?, datetime('now'), 0)
             ''', (user_id, message))
             conn.commit()
+        event_hub.publish(("user", user_id))
+
+class AsyncInAppNotification(InAppNotification):
+    # Hands notifications to the background writer so requests do not wait on the INSERT.
+    # Set NOTIFICATIONS_ASYNC = False (e.g. in tests) to write synchronously instead.
+    def __init__(self, writer):
+        self.writer = writer
+
+    def update(self, message, user_id):
+        if current_app.config.get("NOTIFICATIONS_ASYNC", True):
+            self.writer.enqueue(user_id, message)
+        else:
+            super().update(message, user_id)
+
+
+# Rows per delta read for /events and /events/poll.
+LIVE_BATCH = 100
+AUTOCOMPLETE_LIMIT = 8
+AUTOCOMPLETE_MAX_LIMIT = 20
+# Dashboard earnings cover this many calendar months (plus any booked ahead);
+# manage_cars reports occupancy over the last OCCUPANCY_DAYS days.
+EARNINGS_MONTHS = 12
+OCCUPANCY_DAYS = 30
+
+
+def is_iso_date(value):
+    if not value:
+        return True
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+        return True
+    except ValueError:
+        return False
+
+
+def conditional_response(response, etag, last_modified, private=True):
+    # Pages depend on who is logged in, so caches may store them only per
+    # cookie and must revalidate before reuse.
+    response.set_etag(etag)
+    # Werkzeug turns a None Last-Modified into the current time.
+    if last_modified is not None:
+        response.last_modified = last_modified
+    if private:
+        response.headers["Cache-Control"] = "private, no-cache"
+        response.vary.add("Cookie")
+    else:
+        response.headers["Cache-Control"] = "public, no-cache"
+    return response
 
 
 def register_routes(app):
+    availability_bitmap.horizon_days = app.config.get("AVAILABILITY_HORIZON_DAYS", availability_bitmap.horizon_days)
+    app.jinja_env.globals["next_page_url"] = next_page_url
+    session_store.configure(
+        capacity=app.config.get("SESSION_CACHE_SIZE"),
+        ttl=app.config.get("SESSION_CACHE_TTL"),
+        lifetime=app.config.get("SESSION_LIFETIME"),
+    )
+    car_cache.configure(
+        capacity=app.config.get("CAR_CACHE_SIZE"),
+        ttl=app.config.get("CAR_CACHE_TTL"),
+        shared=app.config.get("CAR_CACHE_SHARED"),
+    )
+    metrics.registry.register_stats("car_cache", car_cache.stats, counters=("hits", "misses"))
+    metrics.registry.register_stats("search_cache", search_cache.stats, counters=("hits", "misses"))
+    metrics.registry.register_stats("session_cache", session_store.stats, counters=("hits", "misses"))
+    metrics.registry.register_stats(
+        "notifications", notification_writer.stats,
+        counters=("batches", "written", "dropped", "write_seconds"),
+    )
+    password_hasher.configure(
+        method=app.config.get("PASSWORD_HASH_METHOD"),
+        workers=app.config.get("PASSWORD_HASH_WORKERS"),
+        max_pending=app.config.get("PASSWORD_HASH_MAX_PENDING"),
+    )
+    metrics.registry.register_stats(
+        "password_hasher", password_hasher.stats, counters=("hashed", "verified", "rejected", "rehashed"),
+    )
+    event_hub.configure(max_subscribers=app.config.get("SSE_MAX_STREAMS"))
+    metrics.registry.register_stats("live_updates", event_hub.stats, counters=("published", "rejected"))
     booking_subject = BookingSubject()
-    booking_subject.attach(InAppNotification())
+    booking_subject.attach(AsyncInAppNotification(notification_writer))
 
     @app.route("/")
     def home():
@@ -145,14 +268,10 @@ def register_routes(app):
 
         car = None
         try:
-            with sqlite3.connect("database.db") as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                cursor.execute("SELECT * FROM cars WHERE id = ?", (car_id,))
-                car = cursor.fetchone()
-                if not car:
-                    flash("Car not found.")
-                    return redirect(url_for("search"))
+            car = car_cache.get(get_db, car_id)
+            if not car:
+                flash("Car not found.")
+                return redirect(url_for("search"))
         except Exception as e:
             flash(f"Error retrieving car: {str(e)}")
             return redirect(url_for("search"))
@@ -166,59 +285,39 @@ def register_routes(app):
                 start_dt = datetime.strptime(start_date, "%Y-%m-%d")
                 end_dt = datetime.strptime(end_date, "%Y-%m-%d")
 
-                with sqlite3.connect("database.db") as conn:
-                    conn.row_factory = sqlite3.Row
-                    cursor = conn.cursor()
-
-                    # Check for conflicting bookings
-                    cursor.execute('''
-                        SELECT COUNT(*) FROM bookings
-                        WHERE car_id = ?
-                        AND (
-                            (? BETWEEN start_date AND end_date) OR
-                            (? BETWEEN start_date AND end_date) OR
-                            (start_date BETWEEN ? AND ?) OR
-                            (end_date BETWEEN ? AND ?)
-                        ) AND status = 'confirmed'
-                    ''', (car_id, start_date, end_date, start_date, end_date, start_date, end_date))
-                    overlap = cursor.fetchone()[0]
-
-                    if overlap > 0:
-                        flash("Car is already booked for the selected dates.")
-                        return render_template("booking.html", car=car)
-
-                    # Fetch blocked (unavailable) dates for this car
-                    cursor.execute('''
-                        SELECT date FROM availability
-                        WHERE car_id = ? AND is_available = 0
-                    ''', (car_id,))
-                    unavailable_rows = cursor.fetchall()
-                    unavailable_dates = {row['date'] for row in unavailable_rows}
-
-                    # Build list of all dates in this booking range
-                    selected_dates = [(start_dt + timedelta(days=i)).strftime("%Y-%m-%d") for i in range((end_dt - start_dt).days + 1)]
-
-                    # Check if any are blocked
-                    blocked = [d for d in selected_dates if d in unavailable_dates]
-                    if blocked:
-                        flash(f"Car is not available on these dates: {', '.join(blocked)}")
-                        return render_template("booking.html", car=car)
-
-                    # Price and total cost
-                    days = len(selected_dates)
-                    total_cost = round(days * car["price"], 2)
-
-                    # Save to session and redirect to payment
-                    session["pending_booking"] = {
-                        "car_id": car_id,
-                        "renter_id": renter_id,
-                        "owner_id": car["owner_id"],
-                        "start_date": start_date,
-                        "end_date": end_date,
-                        "total_cost": total_cost
-                    }
-
-                    return redirect(url_for("payment", booking_id="pending"))
+                with get_db() as conn:
+                    availability_engine.ensure_loaded(conn)
+
+                # Check for conflicting bookings
+                if availability_engine.conflicts(car_id, start_date, end_date, BOOKED):
+                    flash("Car is already booked for the selected dates.")
+                    return render_template("booking.html", car=car)
+
+                # Check if any of the selected dates are blocked by the owner
+                blocked = []
+                for block_start, block_end in availability_engine.conflicts(car_id, start_date, end_date, BLOCKED):
+                    block_start_dt = datetime.strptime(block_start, "%Y-%m-%d")
+                    block_days = (datetime.strptime(block_end, "%Y-%m-%d") - block_start_dt).days + 1
+                    blocked.extend((block_start_dt + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(block_days))
+                if blocked:
+                    flash(f"Car is not available on these dates: {', '.join(blocked)}")
+                    return render_template("booking.html", car=car)
+
+                # Price and total cost
+                days = max((end_dt - start_dt).days + 1, 0)
+                total_cost = round(days * car["price"], 2)
+
+                # Save to session and redirect to payment
+                session["pending_booking"] = {
+                    "car_id": car_id,
+                    "renter_id": renter_id,
+                    "owner_id": car["owner_id"],
+                    "start_date": start_date,
+                    "end_date": end_date,
+                    "total_cost": total_cost
+                }
+
+                return redirect(url_for("payment", booking_id="pending"))
 
             except Exception as e:
                 flash(f"Error during booking: {str(e)}")
@@ -229,11 +328,7 @@ def register_routes(app):
     def car_detail(car_id):
         car = None
         try:
-            with sqlite3.connect("database.db") as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                cursor.execute("SELECT * FROM cars WHERE id = ?", (car_id,))
-                car = cursor.fetchone()
+            car = car_cache.get(get_db, car_id)
         except Exception as e:
             flash(f"Error retrieving car details: {str(e)}")
         return render_template("car_detail.html", car=car)
@@ -243,7 +338,33 @@ def register_routes(app):
         if not UserSession.get_instance().is_authenticated():
             flash("Please log in to access the dashboard.")
             return redirect(url_for("login"))
-        return render_template("dashboard.html")
+
+        user_id = UserSession.get_instance().user_id
+        today = datetime.now().date()
+        year, month = divmod(today.year * 12 + today.month - EARNINGS_MONTHS, 12)
+        # A deleted car leaves its owner's days at zero; months left with nothing are skipped.
+        with get_db() as conn:
+            rows = conn.execute('''
+                SELECT substr(day, 1, 7) AS month, SUM(booked_days) AS booked_days,
+                       SUM(revenue_cents) AS revenue_cents, SUM(bookings) AS bookings,
+                       (SELECT COUNT(*) FROM cars WHERE owner_id = ?) AS fleet
+                FROM owner_daily_stats
+                WHERE owner_id = ? AND day >= ?
+                GROUP BY month
+                HAVING SUM(booked_days) OR SUM(revenue_cents) OR SUM(bookings)
+                ORDER BY month
+            ''', (user_id, user_id, f"{year:04d}-{month + 1:02d}-01")).fetchall()
+
+        earnings = []
+        for row in rows:
+            # Occupancy against the current fleet: the share of car-days booked that month.
+            days = monthrange(int(row["month"][:4]), int(row["month"][5:]))[1]
+            earnings.append(dict(
+                row,
+                revenue=from_cents(row["revenue_cents"]),
+                occupancy=row["booked_days"] / (row["fleet"] * days) if row["fleet"] else None,
+            ))
+        return render_template("dashboard.html", earnings=earnings)
     
     @app.route("/edit_car/<int:car_id>", methods=["GET", "POST"])
     def edit_car(car_id):
@@ -252,11 +373,18 @@ def register_routes(app):
             return redirect(url_for("login"))
 
         if request.method == "POST":
-            with sqlite3.connect("database.db") as conn:
+            try:
+                point = parse_point(request.form.get("latitude"), request.form.get("longitude"))
+            except ValueError as e:
+                flash(str(e))
+                return redirect(url_for("edit_car", car_id=car_id))
+            latitude, longitude = point or (None, None)
+            with get_db() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     UPDATE cars
-                    SET make = ?, model = ?, year = ?, mileage = ?, color = ?, price = ?, location = ?, precise_location = ?
+                    SET make = ?, model = ?, year = ?, mileage = ?, color = ?, price = ?, location = ?, precise_location = ?,
+                        latitude = ?, longitude = ?
                     WHERE id = ? AND owner_id = ?
                 ''', (
                     request.form["make"],
@@ -267,39 +395,33 @@ def register_routes(app):
                     float(request.form["price"]),
                     request.form["location"],
                     request.form.get("precise_location", ""),
+                    latitude,
+                    longitude,
                     car_id,
                     UserSession.get_instance().user_id
                 ))
+                car_cache.invalidate(conn, car_id)
                 conn.commit()
+                car_cache.discard(car_id)
+                search_index.refresh_car(conn, car_id)
+                search_cache.clear()
             flash("Car updated successfully.")
             return redirect(url_for("manage_cars"))
 
-        with sqlite3.connect("database.db") as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM cars WHERE id = ? AND owner_id = ?", (car_id, UserSession.get_instance().user_id))
-            car_data = cursor.fetchone()
+        car = car_cache.get(get_db, car_id)
 
-        if not car_data:
+        if not car or car.owner_id != UserSession.get_instance().user_id:
             flash("Car not found or you do not have permission to edit it.")
             return redirect(url_for("manage_cars"))
 
-        car = {
-            "id": car_data[0],
-            "owner_id": car_data[1],
-            "model": car_data[2],
-            "make": car_data[3],
-            "year": car_data[4],
-            "mileage": car_data[5],
-            "color": car_data[6],
-            "price": car_data[7],
-            "location": car_data[8],
-            "precise_location": car_data[9]  
-        }
-
         today = datetime.now().date()
         upcoming_dates = [(today + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(7)]
+        blocks = get_db().execute(
+            "SELECT start_date, end_date FROM availability_blocks WHERE car_id = ? AND end_date >= ? ORDER BY start_date",
+            (car_id, today.isoformat())
+        ).fetchall()
         
-        return render_template("edit_car.html", car=car, upcoming_dates=upcoming_dates)
+        return render_template("edit_car.html", car=car, upcoming_dates=upcoming_dates, blocks=blocks)
     
     @app.route("/forgot_password", methods=["GET", "POST"])
     def forgot_password():
@@ -313,7 +435,7 @@ def register_routes(app):
             ]
 
             try:
-                with sqlite3.connect("database.db") as conn:
+                with get_db() as conn:
                     cursor = conn.cursor()
                     cursor.execute("SELECT security_q1, security_q2, security_q3 FROM users WHERE email = ?", (email,))
                     user = cursor.fetchone()
@@ -321,7 +443,7 @@ def register_routes(app):
                     if user:
                         recovery_manager = PasswordRecoveryManager()
                         if recovery_manager.recover_password(input_answers, list(user)):
-                            hashed_password = generate_password_hash(new_password)
+                            hashed_password = password_hasher.hash(new_password)
                             cursor.execute("UPDATE users SET password = ? WHERE email = ?", (hashed_password, email))
                             conn.commit()
                             flash("Password reset successful. Please log in.")
@@ -331,6 +453,8 @@ def register_routes(app):
                     else:
                         flash("No user found with that email.")
 
+            except HasherBusy:
+                return hasher_busy("forgot_password.html")
             except Exception as e:
                 flash(f"Error: {str(e)}")
 
@@ -342,38 +466,49 @@ def register_routes(app):
             flash("Please log in to access your inbox.")
             return redirect(url_for("login"))
         user_id = UserSession.get_instance().user_id
-        messages = []
+        limit = page_size()
 
         try: 
-            with sqlite3.connect("database.db") as conn:
-                conn.row_factory = sqlite3.Row
+            with get_db() as conn:
                 cursor = conn.cursor()
 
-                # Received messages
-                cursor.execute('''
-                    SELECT m.id, m.sender_id, m.receiver_id, m.content, m.timestamp, u.full_name AS sender_name
-                    FROM messages m 
-                    JOIN users u ON m.sender_id = u.id
-                    WHERE m.receiver_id = ?
-                    ORDER BY m.timestamp DESC                               
-                ''', (user_id,))
-                inbox_messages = cursor.fetchall()
-                
-                # Sent messages
-                cursor.execute('''
-                    SELECT m.id, m.sender_id, m.receiver_id, m.content, m.timestamp, u.full_name AS receiver_name
-                    FROM messages m
-                    JOIN users u ON m.receiver_id = u.id
-                    WHERE m.sender_id = ?
-                    ORDER BY m.timestamp DESC 
-                    ''', (user_id,))
-                sent_messages = cursor.fetchall()
-                
-            return render_template("inbox.html", inbox_messages=inbox_messages, sent_messages=sent_messages)
+                # One row per conversation, newest first. The user is on the
+                # low side of some pairs and the high side of others; each side
+                # is a page read in order from its own index, and the two
+                # short pages are merged. A conversation with oneself is on both.
+                after = decode_cursor(request.args.get("cursor"))
+                sides = []
+                params = []
+                for mine, other, unread, exclude in (
+                    ("user_low", "user_high", "unread_low", ""),
+                    ("user_high", "user_low", "unread_high", " AND user_low != user_high"),
+                ):
+                    side, side_params = keyset_query(f'''
+                        SELECT id, last_message_id, last_sender_id, last_message, last_timestamp,
+                               {other} AS other_id, {unread} AS unread
+                        FROM conversations
+                        WHERE {mine} = ? AND last_message_id IS NOT NULL{exclude}
+                    ''', [user_id], ("last_timestamp", "id"), after, limit)
+                    sides.append(f"SELECT * FROM ({side})")
+                    params.extend(side_params)
+                query = f'''
+                    SELECT c.id, c.last_message_id, c.last_sender_id, c.last_message AS content,
+                           c.last_timestamp AS timestamp, c.other_id, u.full_name AS other_name, c.unread
+                    FROM ({" UNION ALL ".join(sides)}) c
+                    JOIN users u ON u.id = c.other_id
+                    ORDER BY c.last_timestamp DESC, c.id DESC LIMIT ?
+                '''
+                params.append(limit + 1)
+                cursor.execute(query, params)
+                conversations, next_cursor = paginate(cursor.fetchall(), limit, lambda c: (c["timestamp"], c["id"]))
+
+            if wants_json():
+                return page_json(conversations, next_cursor)
+            return render_template("inbox.html", conversations=conversations, next_cursor=next_cursor)
         except Exception as e:
             flash(f"Error retrieving messages: {str(e)}")
                 
-        return render_template("inbox.html", messages=messages)
+        return render_template("inbox.html", conversations=[])
 
     @app.route("/list_car", methods=["GET", "POST"])
     def list_car():
@@ -388,6 +523,12 @@ def register_routes(app):
                     flash(f"Field '{field}' is required.")
                     return redirect(url_for("list_car"))
 
+            try:
+                point = parse_point(request.form.get("latitude"), request.form.get("longitude"))
+            except ValueError as e:
+                flash(str(e))
+                return redirect(url_for("list_car"))
+
             builder = CarBuilder()
             car = builder.set_owner_id(UserSession.get_instance().user_id) \
                         .set_make(request.form["make"]) \
@@ -398,16 +539,18 @@ def register_routes(app):
                         .set_price(float(request.form["price"])) \
                         .set_location(request.form["location"]) \
                         .set_precise_location(request.form["precise_location"]) \
+                        .set_coordinates(point) \
                         .build()
 
             precise_location = request.form.get("precise_location", "")
 
             try:
-                with sqlite3.connect("database.db") as conn:
+                with get_db() as conn:
                     cursor = conn.cursor()
                     cursor.execute('''
-                        INSERT INTO cars (owner_id, make, model, year, mileage, color, price, location, precise_location, image_url)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        INSERT INTO cars (owner_id, make, model, year, mileage, color, price, location, precise_location,
+                                          latitude, longitude, image_url)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                     ''', (
                         car.owner_id,
                         car.make,
@@ -418,9 +561,14 @@ def register_routes(app):
                         car.price,
                         car.location,
                         car.precise_location,
+                        car.latitude,
+                        car.longitude,
                         None
                     ))
+                    car_cache.invalidate(conn, cursor.lastrowid)
                     conn.commit()
+                    search_index.refresh_car(conn, cursor.lastrowid)
+                    search_cache.clear()
 
                 flash("Car listed successfully.")
                 return redirect(url_for("dashboard"))
@@ -435,21 +583,91 @@ def register_routes(app):
 
     @app.route("/availability/<int:car_id>")
     def view_availability(car_id):
+        # One entry per day: the car's remaining availability rows plus every
+        # day of its blocks. /availability/<car_id>/blocks lists the ranges.
+        try:
+            with get_db() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT date, is_available FROM availability WHERE car_id = ?", (car_id,))
+                days = {row[0]: bool(row[1]) for row in cursor.fetchall()}
+                cursor.execute("SELECT start_date, end_date FROM availability_blocks WHERE car_id = ?", (car_id,))
+                for start_date, end_date in cursor.fetchall():
+                    for day in range(to_day(start_date), to_day(end_date) + 1):
+                        days[from_day(day)] = False
+                data = [{"date": day, "is_available": is_available} for day, is_available in sorted(days.items())]
+            return jsonify(data)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    @app.route("/availability/<int:car_id>/blocks")
+    def view_blocks(car_id):
         try:
-            with sqlite3.connect("database.db") as conn:
+            with get_db() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
-                    SELECT date, is_available
-                    FROM availability
+                    SELECT start_date, end_date
+                    FROM availability_blocks
                     WHERE car_id = ?
-                    ORDER BY date
+                    ORDER BY start_date
                 """, (car_id,))
                 availability = cursor.fetchall()
-                data = [{"date": row[0], "is_available": bool(row[1])} for row in availability]
+                data = [{"start_date": row[0], "end_date": row[1], "is_available": False} for row in availability]
             return jsonify(data)
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
+    @app.route("/calendar")
+    @app.route("/calendar/<int:car_id>")
+    def calendar(car_id=None):
+        # Free/booked/blocked runs over [start, end] for one car, or for up to
+        # MAX_CARS cars with ?car_ids=1,2,3. Defaults to the next DEFAULT_WINDOW_DAYS days.
+        try:
+            if car_id is not None:
+                car_ids = [car_id]
+            else:
+                car_ids = sorted({int(value) for value in request.args.get("car_ids", "").split(",") if value.strip()})
+            today = datetime.now().date()
+            start = datetime.strptime(request.args["start"], "%Y-%m-%d").date() if request.args.get("start") else today
+            end = (
+                datetime.strptime(request.args["end"], "%Y-%m-%d").date() if request.args.get("end")
+                else start + timedelta(days=availability_calendar.DEFAULT_WINDOW_DAYS - 1)
+            )
+        except ValueError:
+            return jsonify({"error": "car_ids must be integers and dates YYYY-MM-DD."}), 400
+        if not car_ids:
+            return jsonify({"error": "car_ids is required."}), 400
+        if len(car_ids) > availability_calendar.MAX_CARS:
+            return jsonify({"error": f"At most {availability_calendar.MAX_CARS} cars per request."}), 400
+        if end < start:
+            return jsonify({"error": "End date must be on or after the start date."}), 400
+        if (end - start).days >= availability_calendar.MAX_WINDOW_DAYS:
+            return jsonify({"error": f"The window is limited to {availability_calendar.MAX_WINDOW_DAYS} days."}), 400
+        start, end = start.isoformat(), end.isoformat()
+
+        with get_db() as conn:
+            # Bookings, blocks and cars all bump the search stamp, so it versions the calendar too.
+            generation, updated_at = read_search_version(conn)
+            etag = search_cache.etag(generation, ("calendar", tuple(car_ids), start, end))
+            last_modified = datetime.utcfromtimestamp(updated_at)
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                return conditional_response(app.response_class(status=304), etag, last_modified, private=False)
+            placeholders = ", ".join("?" for _ in car_ids)
+            known = [row[0] for row in conn.execute(f"SELECT id FROM cars WHERE id IN ({placeholders}) ORDER BY id", car_ids)]
+            runs = availability_calendar.calendars(conn, known, start, end) if known else {}
+
+        if car_id is not None:
+            if not known:
+                return jsonify({"error": "Car not found."}), 404
+            body = {"car_id": car_id, "start": start, "end": end, "runs": runs[car_id]}
+        else:
+            body = {
+                "start": start,
+                "end": end,
+                "cars": {str(known_id): runs[known_id] for known_id in known},
+                "missing": [missing_id for missing_id in car_ids if missing_id not in runs],
+            }
+        return conditional_response(jsonify(body), etag, last_modified, private=False)
+
     @app.route("/set_availability/<int:car_id>", methods=["POST"])
     def set_availability(car_id):
         if not UserSession.get_instance().is_authenticated():
@@ -458,30 +676,30 @@ def register_routes(app):
 
         user_id = UserSession.get_instance().user_id
 
-        # Get dates from the new text input
+        # Dates, ranges and recurring patterns, e.g. "2025-04-06, 2025-05-01 to 2025-05-04, every weekend through March"
         unavailable_raw = request.form.get("unavailable_dates", "")
-        unavailable_dates = [d.strip() for d in unavailable_raw.split(",") if d.strip()]
 
         try:
-            with sqlite3.connect("database.db") as conn:
-                cursor = conn.cursor()
+            ranges = parse_blocks(unavailable_raw)
+            if not ranges:
+                flash("Enter at least one date.")
+                return redirect(url_for("edit_car", car_id=car_id))
 
+            with get_db() as conn:
                 # Verify ownership
-                cursor.execute("SELECT owner_id FROM cars WHERE id = ?", (car_id,))
-                result = cursor.fetchone()
-                if not result or result[0] != user_id:
+                car = car_cache.get(get_db, car_id)
+                if not car or car.owner_id != user_id:
                     flash("Unauthorized.")
                     return redirect(url_for("dashboard"))
 
-                # Delete only the specific dates being updated (clean slate approach optional)
-                for date in unavailable_dates:
-                    cursor.execute(
-                        "REPLACE INTO availability (car_id, date, is_available) VALUES (?, ?, 0)",
-                        (car_id, date)
-                    )
-
-                conn.commit()
+                added = save_blocks(conn, car_id, ranges)
+                for start, end in added:
+                    availability_engine.add_block(car_id, from_day(start), from_day(end))
+                    availability_bitmap.mark_busy(car_id, from_day(start), from_day(end))
+                search_cache.clear()
                 flash("Unavailable dates saved.")
+        except ValueError as e:
+            flash(str(e))
         except Exception as e:
             flash(f"Error: {str(e)}")
 
@@ -494,16 +712,43 @@ def register_routes(app):
             return redirect(url_for("login"))
 
         try:
-            with sqlite3.connect("database.db") as conn:
+            with get_db() as conn:
                 cursor = conn.cursor()
                 cursor.execute("DELETE FROM cars WHERE id = ?", (car_id,))
+                car_cache.invalidate(conn, car_id)
                 conn.commit()
+            car_cache.discard(car_id)
+            availability_engine.remove_car(car_id)
+            search_index.remove_car(car_id)
+            availability_bitmap.remove_car(car_id)
+            search_cache.clear()
             flash("Car deleted successfully.")
         except Exception as e:
             flash(f"Error deleting car: {str(e)}")
         
         return redirect(url_for("manage_cars"))
 
+    def hasher_busy(template):
+        # Overloaded: answer now rather than queue behind the hashing pool.
+        flash("We're handling a lot of sign-ins right now. Please try again in a moment.")
+        return render_template(template), 503, {"Retry-After": "2"}
+
+    def rehash_password(user_id, old_hash, password):
+        # The hash parameters changed since this password was stored; the
+        # plaintext is only available at login, so upgrade it now. Skipped
+        # (until the next login) if the pool is busy.
+        try:
+            new_hash = password_hasher.hash(password)
+        except HasherBusy:
+            return
+        with get_db() as conn:
+            updated = conn.execute(
+                "UPDATE users SET password = ? WHERE id = ? AND password = ?", (new_hash, user_id, old_hash)
+            ).rowcount
+            conn.commit()
+        if updated:
+            password_hasher.record_rehash()
+
     @app.route("/login", methods=["GET", "POST"])
     def login():
         if request.method == "POST":
@@ -511,17 +756,21 @@ def register_routes(app):
             password = request.form["password"]
             
             try:
-                with sqlite3.connect("database.db") as conn:
+                with get_db() as conn:
                     cursor = conn.cursor()
                     cursor.execute("SELECT id, password, role FROM users WHERE email = ?", (email,))
                     user = cursor.fetchone()
                 
-                if user and check_password_hash(user[1], password):
+                if user and password_hasher.verify(user[1], password):
+                    if password_hasher.needs_rehash(user[1]):
+                        rehash_password(user[0], user[1], password)
                     session = UserSession.get_instance()
                     session.login(user_id=user[0], email=email, role=user[2])
                     return redirect(url_for("dashboard"))
                 else:
                     flash("Invalid email or password.")
+            except HasherBusy:
+                return hasher_busy("login.html")
             except Exception as e:
                 flash(f"Login error: {str(e)}")
                 
@@ -534,11 +783,22 @@ def register_routes(app):
             return redirect(url_for("login"))
 
         user_id = UserSession.get_instance().user_id
-        with sqlite3.connect("database.db") as conn:
-            conn.row_factory = sqlite3.Row
-            cars = conn.execute("SELECT * FROM cars WHERE owner_id = ?", (user_id,)).fetchall()
-
-        return render_template("manage_cars.html", cars=cars)
+        today = datetime.now().date()
+        with get_db() as conn:
+            cars = conn.execute('''
+                SELECT c.*,
+                       COALESCE(SUM(s.revenue_cents), 0) AS revenue_cents,
+                       COALESCE(SUM(s.bookings), 0) AS bookings,
+                       COALESCE(SUM(CASE WHEN s.day BETWEEN ? AND ? THEN s.booked_days END), 0) AS recent_booked_days,
+                       COALESCE(r.rating_count, 0) AS rating_count, COALESCE(r.rating_sum, 0) AS rating_sum
+                FROM cars c
+                LEFT JOIN car_daily_stats s ON s.car_id = c.id
+                LEFT JOIN car_rating_stats r ON r.car_id = c.id
+                WHERE c.owner_id = ?
+                GROUP BY c.id
+            ''', ((today - timedelta(days=OCCUPANCY_DAYS - 1)).isoformat(), today.isoformat(), user_id)).fetchall()
+
+        return render_template("manage_cars.html", cars=cars, occupancy_days=OCCUPANCY_DAYS)
 
     @app.route("/messages/<int:user_id>")
     def message_thread(user_id):
@@ -546,20 +806,30 @@ def register_routes(app):
             flash("Please log in to view messages.")
             return redirect(url_for("login"))
         current_user_id = UserSession.get_instance().user_id
+        messages = []
         try:
-            with sqlite3.connect("database.db") as conn:
-                conn.row_factory = sqlite3.Row
+            with get_db() as conn:
                 cursor = conn.cursor()
 
-                cursor.execute('''
-                    SELECT m.id, m.sender_id, m.receiver_id, m.content, m.timestamp, u.full_name AS sender_name
-                    FROM messages m
-                    JOIN users u ON m.sender_id = u.id
-                    WHERE (m.sender_id = ? AND m.receiver_id = ?)
-                    OR (m.sender_id = ? AND m.receiver_id = ?)
-                    ORDER BY m.timestamp ASC
-                ''', (current_user_id, user_id, user_id, current_user_id))
-                messages= cursor.fetchall()
+                conversation = find_conversation(conn, current_user_id, user_id)
+                if conversation is not None:
+                    cursor.execute('''
+                        SELECT m.id, m.sender_id, m.receiver_id, m.content, m.timestamp, u.full_name AS sender_name
+                        FROM messages m
+                        JOIN users u ON m.sender_id = u.id
+                        WHERE m.conversation_id = ?
+                        ORDER BY m.timestamp ASC, m.id ASC
+                    ''', (conversation["id"],))
+                    messages = cursor.fetchall()
+
+                    # The conversation row says whether there is anything to mark.
+                    side = "unread_low" if conversation["user_low"] == current_user_id else "unread_high"
+                    if conversation[side]:
+                        cursor.execute(
+                            "UPDATE messages SET is_read = 1 WHERE conversation_id = ? AND receiver_id = ? AND is_read = 0",
+                            (conversation["id"], current_user_id)
+                        )
+                        conn.commit()
 
             return render_template("message_thread.html", user_id=user_id, messages=messages)
         except Exception as e:
@@ -577,15 +847,14 @@ def register_routes(app):
         if not content:
             flash("Message content cannot be empty.")
             return redirect(url_for("inbox"))
+        if receiver_id == sender_id:
+            flash("You cannot send a message to yourself.")
+            return redirect(url_for("inbox"))
         
         try:
-            with sqlite3.connect("database.db") as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO messages (sender_id, receiver_id, content)
-                    VALUES (?, ?, ?)
-                ''', (sender_id, receiver_id, content))
-                conn.commit()
+            with get_db() as conn:
+                send_message_in_conversation(conn, sender_id, receiver_id, content)
+            event_hub.publish(("conversation",) + conversation_pair(sender_id, receiver_id))
             
             flash("Message sent successfully!")
         except Exception as e:
@@ -609,15 +878,14 @@ def register_routes(app):
         if not content:
             flash("Message content cannot be empty.")
             return redirect(url_for("message_thread", user_id=receiver_id))
+        if receiver_id == sender_id:
+            flash("You cannot send a message to yourself.")
+            return redirect(url_for("message_thread", user_id=receiver_id))
     
         try: 
-            with sqlite3.connect("database.db") as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO messages (sender_id, receiver_id, content)
-                    VALUES (?, ?, ?)
-                ''',(sender_id, receiver_id, content))
-                conn.commit()
+            with get_db() as conn:
+                send_message_in_conversation(conn, sender_id, receiver_id, content)
+            event_hub.publish(("conversation",) + conversation_pair(sender_id, receiver_id))
             flash("Reply sent!")
         except Exception as e:
             flash(f"Error sending reply: {str(e)}")
@@ -632,9 +900,13 @@ def register_routes(app):
     @app.route("/get_user_id/<username>")
     def get_user_id(username):
         try:
-            with sqlite3.connect("database.db") as conn:
+            with get_db() as conn:
                 cursor = conn.cursor()
-                cursor.execute("SELECT id FROM users WHERE full_name = ?", (username,))
+                # Case-insensitive via idx_users_full_name; an exact-case match wins a tie.
+                cursor.execute(
+                    "SELECT id FROM users WHERE full_name = ? COLLATE NOCASE ORDER BY full_name = ? DESC, id LIMIT 1",
+                    (username, username)
+                )
                 user = cursor.fetchone()
                 if user:
                     return {"user_id": user[0]}
@@ -643,6 +915,54 @@ def register_routes(app):
         except Exception as e:
             return {"error": str(e)}, 500
 
+    @app.route("/users/autocomplete")
+    def autocomplete_users():
+        # Recipients whose name starts with ?q=, in name order: one range seek on
+        # idx_users_full_name, which folds ASCII case like the comparison below.
+        if not UserSession.get_instance().is_authenticated():
+            return {"error": "Not logged in"}, 401
+
+        prefix = request.args.get("q", "").strip()
+        limit = max(1, min(request.args.get("limit", AUTOCOMPLETE_LIMIT, type=int), AUTOCOMPLETE_MAX_LIMIT))
+        if not prefix:
+            return jsonify(items=[])
+        with get_db() as conn:
+            rows = conn.execute('''
+                SELECT id, full_name FROM users
+                WHERE full_name >= ? COLLATE NOCASE AND full_name < ? COLLATE NOCASE AND id != ?
+                ORDER BY full_name COLLATE NOCASE, id LIMIT ?
+            ''', (prefix, prefix + "\U0010ffff", UserSession.get_instance().user_id, limit)).fetchall()
+        return jsonify(items=[dict(row) for row in rows])
+
+    @app.route("/mark_read/<int:message_id>", methods=["POST"])
+    def mark_read(message_id):
+        if not UserSession.get_instance().is_authenticated():
+            return {"error": "Not logged in"}, 401
+
+        with get_db() as conn:
+            conn.execute(
+                "UPDATE messages SET is_read = 1 WHERE id = ? AND receiver_id = ?",
+                (message_id, UserSession.get_instance().user_id)
+            )
+            conn.commit()
+        return "", 204
+
+    @app.route("/mark_conversation_read/<int:user_id>", methods=["POST"])
+    def mark_conversation_read(user_id):
+        if not UserSession.get_instance().is_authenticated():
+            return {"error": "Not logged in"}, 401
+
+        current_user_id = UserSession.get_instance().user_id
+        with get_db() as conn:
+            conversation = find_conversation(conn, current_user_id, user_id)
+            if conversation is not None:
+                conn.execute(
+                    "UPDATE messages SET is_read = 1 WHERE conversation_id = ? AND receiver_id = ? AND is_read = 0",
+                    (conversation["id"], current_user_id)
+                )
+                conn.commit()
+        return "", 204
+
     @app.route("/delete_message/<int:message_id>", methods=["POST"])
     def delete_message(message_id):
         if not UserSession.get_instance().is_authenticated():
@@ -650,7 +970,7 @@ def register_routes(app):
             return redirect(url_for("login"))
 
         try:
-            with sqlite3.connect("database.db") as conn:
+            with get_db() as conn:
                 cursor = conn.cursor()
                 cursor.execute("DELETE FROM messages WHERE id = ?", (message_id,))
                 conn.commit()
@@ -672,16 +992,15 @@ def register_routes(app):
             return redirect(url_for("dashboard"))
 
         try:
-            with sqlite3.connect("database.db") as conn:
-                conn.row_factory = sqlite3.Row
+            with get_db() as conn:
                 cursor = conn.cursor()
-                cursor.execute("SELECT balance FROM users WHERE id = ?", (pending["renter_id"],))
+                cursor.execute("SELECT balance_cents FROM users WHERE id = ?", (pending["renter_id"],))
                 row = cursor.fetchone()
                 if not row:
                     flash("User not found.")
                     return redirect(url_for("dashboard"))
 
-                balance = row["balance"]
+                balance = from_cents(row["balance_cents"])
                 amount_due = pending["total_cost"]
 
                 if request.method == "POST":
@@ -689,33 +1008,24 @@ def register_routes(app):
                         flash("Insufficient balance. Please add funds in your profile.")
                         return redirect(url_for("profile"))
 
-                    # Deduct funds
-                    cursor.execute("UPDATE users SET balance = balance - ? WHERE id = ?", (amount_due, pending["renter_id"]))
-
-                    # Insert booking
-                    cursor.execute('''
-                        INSERT INTO bookings (car_id, renter_id, start_date, end_date, total_cost, status)
-                        VALUES (?, ?, ?, ?, ?, 'confirmed')
-                    ''', (
-                        pending["car_id"],
-                        pending["renter_id"],
-                        pending["start_date"],
-                        pending["end_date"],
-                        amount_due
-                    ))
+                    # Debit, credit, booking and ledger entries are written in one transaction
+                    proxy = PaymentProxy()
+                    try:
+                        proxy.pay(conn, pending)
+                    except InsufficientFundsError as e:
+                        flash(str(e))
+                        return redirect(url_for("profile"))
+                    except BookingConflictError as e:
+                        session.pop("pending_booking", None)
+                        flash(str(e))
+                        return redirect(url_for("booking", car_id=pending["car_id"]))
 
-                    conn.commit()
+                    availability_engine.add_booking(pending["car_id"], pending["start_date"], pending["end_date"])
+                    availability_bitmap.mark_busy(pending["car_id"], pending["start_date"], pending["end_date"])
+                    search_cache.clear()
 
                     booking_subject.notify("Your booking has been confirmed!", pending["renter_id"])
                     booking_subject.notify("Someone booked your car!", pending["owner_id"])
-
-                    # Execute payment via proxy (optional design pattern hook)
-                    proxy = PaymentProxy()
-                    proxy.pay(
-                        payer_id=pending["renter_id"],
-                        receiver_id=pending["owner_id"],
-                        amount=amount_due
-                    )
                     
                     session.pop("pending_booking", None)
                     flash(f"Payment of ${amount_due:.2f} successful! Remaining balance: ${balance - amount_due:.2f}")
@@ -738,10 +1048,8 @@ def register_routes(app):
             if amount <= 0:
                 raise ValueError("Amount must be positive.")
 
-            with sqlite3.connect("database.db") as conn:
-                cursor = conn.cursor()
-                cursor.execute("UPDATE users SET balance = balance + ? WHERE id = ?", (amount, user_id))
-                conn.commit()
+            with get_db() as conn:
+                PaymentProxy().deposit(conn, user_id, amount)
 
             flash(f"Successfully added ${amount:.2f} to your wallet.")
         except Exception as e:
@@ -760,7 +1068,7 @@ def register_routes(app):
         if request.method == "POST":
             full_name = request.form["full_name"]
             try:
-                with sqlite3.connect("database.db") as conn:
+                with get_db() as conn:
                     cursor = conn.cursor()
                     cursor.execute("UPDATE users SET full_name = ? WHERE id = ?", (full_name, user_id))
                     conn.commit()
@@ -770,10 +1078,9 @@ def register_routes(app):
             return redirect(url_for("profile"))
 
         try:
-            with sqlite3.connect("database.db") as conn:
-                conn.row_factory = sqlite3.Row
+            with get_db() as conn:
                 cursor = conn.cursor()
-                cursor.execute("SELECT full_name, email, balance FROM users WHERE id = ?", (user_id,))
+                cursor.execute("SELECT full_name, email, balance_cents / 100.0 AS balance FROM users WHERE id = ?", (user_id,))
                 user = cursor.fetchone()
                 if not user:
                     flash("User not found.")
@@ -795,9 +1102,9 @@ def register_routes(app):
             q3 = request.form.get("security_q3", "")
             
             try:
-                hashed_password = generate_password_hash(password)
+                hashed_password = password_hasher.hash(password)
                 
-                with sqlite3.connect("database.db") as conn:
+                with get_db() as conn:
                     cursor = conn.cursor()
                     cursor.execute('''
                         INSERT INTO users (email, password, security_q1, security_q2, security_q3, full_name, balance)
@@ -809,6 +1116,8 @@ def register_routes(app):
                 return redirect(url_for("login"))
             except sqlite3.IntegrityError:
                 flash("Email already registered.")
+            except HasherBusy:
+                return hasher_busy("register.html")
             except Exception as e:
                 flash(f"Registration error: {str(e)}")
                 
@@ -823,37 +1132,44 @@ def register_routes(app):
         user_id = UserSession.get_instance().user_id
         rented_cars = []
         your_listings = []
+        rented_cursor = listings_cursor = None
+        limit = page_size()
 
         try:
-            with sqlite3.connect("database.db") as conn:
-                conn.row_factory = sqlite3.Row
+            with get_db() as conn:
                 cursor = conn.cursor()
 
                 # Rentals made by this user (SOUAD ADDED booking_id!)
-                cursor.execute('''
+                query, params = keyset_query('''
                     SELECT b.id AS booking_id, b.start_date, b.end_date, c.make, c.model, c.location
                     FROM bookings b
                     JOIN cars c ON b.car_id = c.id
                     WHERE b.renter_id = ?
-                    ORDER BY b.start_date DESC
-                ''', (user_id,))
-                rented_cars = cursor.fetchall()
+                ''', [user_id], ("b.start_date", "b.id"), decode_cursor(request.args.get("rented_cursor")), limit)
+                cursor.execute(query, params)
+                rented_cars, rented_cursor = paginate(cursor.fetchall(), limit, lambda b: (b["start_date"], b["booking_id"]))
 
                 # Bookings on this user's listed cars
-                cursor.execute('''
+                query, params = keyset_query('''
                     SELECT b.id AS booking_id, b.start_date, b.end_date, u.full_name AS renter_name, c.make, c.model
                     FROM bookings b
                     JOIN cars c ON b.car_id = c.id
                     JOIN users u ON b.renter_id = u.id
                     WHERE c.owner_id = ?
-                ''', (user_id,))
-                your_listings = cursor.fetchall()
+                ''', [user_id], ("b.start_date", "b.id"), decode_cursor(request.args.get("listings_cursor")), limit)
+                cursor.execute(query, params)
+                your_listings, listings_cursor = paginate(cursor.fetchall(), limit, lambda b: (b["start_date"], b["booking_id"]))
 
 
         except Exception as e:
             flash(f"Could not retrieve rental history: {str(e)}")
 
-        return render_template("rental_history.html", rented_cars=rented_cars, your_listings=your_listings)
+        if wants_json():
+            if request.args.get("box") == "listings":
+                return page_json(your_listings, listings_cursor)
+            return page_json(rented_cars, rented_cursor)
+        return render_template("rental_history.html", rented_cars=rented_cars, your_listings=your_listings,
+                               rented_cursor=rented_cursor, listings_cursor=listings_cursor)
 
     @app.route("/review/<int:booking_id>", methods=["GET", "POST"])
     def review(booking_id):
@@ -862,17 +1178,21 @@ def register_routes(app):
             return redirect(url_for("login"))
 
         if request.method == "POST":
-            rating = request.form["rating"]
+            try:
+                rating = parse_rating(request.form.get("rating"))
+            except ValueError as e:
+                flash(str(e))
+                return redirect(url_for("review", booking_id=booking_id))
             comment = request.form["comment"]
             reviewer_id = UserSession.get_instance().user_id
 
             try:
-                with sqlite3.connect("database.db") as conn:
+                with get_db() as conn:
                     cursor = conn.cursor()
 
                     # Validate that user made this booking
                     cursor.execute('''
-                        SELECT c.owner_id
+                        SELECT c.owner_id, c.id
                         FROM bookings b
                         JOIN cars c ON b.car_id = c.id
                         WHERE b.id = ? AND b.renter_id = ?
@@ -883,13 +1203,18 @@ def register_routes(app):
                         flash("Invalid booking or you are not allowed to review this.")
                         return redirect(url_for("dashboard"))
 
-                    reviewee_id = row[0]
+                    reviewee_id, car_id = row
 
                     cursor.execute('''
                         INSERT INTO reviews (booking_id, reviewer_id, reviewee_id, rating, comment)
                         VALUES (?, ?, ?, ?, ?)
                     ''', (booking_id, reviewer_id, reviewee_id, rating, comment))
+                    # Updates the owner's and the car's rating; the cached car row carries the car's.
+                    record_review(conn, cursor.lastrowid)
+                    car_cache.invalidate(conn, car_id)
                     conn.commit()
+                    car_cache.discard(car_id)
+                    search_index.refresh_car(conn, car_id)
                 
                     booking_subject.notify(f"You received a new review from {UserSession.get_instance().email}!", reviewee_id)
 
@@ -911,12 +1236,16 @@ def register_routes(app):
             return redirect(url_for("login"))
 
         if request.method == "POST":
-            rating = request.form["rating"]
+            try:
+                rating = parse_rating(request.form.get("rating"))
+            except ValueError as e:
+                flash(str(e))
+                return redirect(url_for("review_renter", booking_id=booking_id))
             comment = request.form["comment"]
             reviewer_id = UserSession.get_instance().user_id  # the owner
 
             try:
-                with sqlite3.connect("database.db") as conn:
+                with get_db() as conn:
                     cursor = conn.cursor()
 
                     # Validate booking belongs to a car owned by this user
@@ -938,6 +1267,7 @@ def register_routes(app):
                         INSERT INTO reviews (booking_id, reviewer_id, reviewee_id, rating, comment)
                         VALUES (?, ?, ?, ?, ?)
                     ''', (booking_id, reviewer_id, reviewee_id, rating, comment))
+                    record_review(conn, cursor.lastrowid)
                     conn.commit()
                 
                     booking_subject.notify(f"You received a new review from {UserSession.get_instance().email}!", reviewee_id)
@@ -961,23 +1291,28 @@ def register_routes(app):
 
         user_id = UserSession.get_instance().user_id
         reviews = []
+        next_cursor = None
+        stats = None
+        limit = page_size()
 
         try:
-            with sqlite3.connect("database.db") as conn:
-                conn.row_factory = sqlite3.Row
+            with get_db() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT r.rating, r.comment, r.timestamp, u.full_name AS reviewer_name
+                stats = conn.execute("SELECT * FROM user_rating_stats WHERE user_id = ?", (user_id,)).fetchone()
+                query, params = keyset_query('''
+                    SELECT r.id, r.rating, r.comment, r.timestamp, u.full_name AS reviewer_name
                     FROM reviews r
                     JOIN users u ON r.reviewer_id = u.id
                     WHERE r.reviewee_id = ?
-                    ORDER BY r.timestamp DESC
-                ''', (user_id,))
-                reviews = cursor.fetchall()
+                ''', [user_id], ("r.timestamp", "r.id"), decode_cursor(request.args.get("cursor")), limit)
+                cursor.execute(query, params)
+                reviews, next_cursor = paginate(cursor.fetchall(), limit, lambda r: (r["timestamp"], r["id"]))
 
         except Exception as e:
             flash(f"Error fetching reviews: {str(e)}")
-        return render_template("reviews_received.html", reviews=reviews)
+        if wants_json():
+            return page_json(reviews, next_cursor)
+        return render_template("reviews_received.html", reviews=reviews, next_cursor=next_cursor, stats=stats)
     
     @app.route("/notifications")
     def notifications():
@@ -986,72 +1321,428 @@ def register_routes(app):
             return redirect(url_for("login"))
         
         user_id = UserSession.get_instance().user_id
-        with sqlite3.connect("database.db") as conn:
-            conn.row_factory = sqlite3.Row
+        limit = page_size()
+        with get_db() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM notifications WHERE user_id = ? ORDER BY timestamp DESC", (user_id,))
-            notes = cursor.fetchall()
+            query, params = keyset_query(
+                "SELECT * FROM notifications WHERE user_id = ?",
+                [user_id], ("timestamp", "id"), decode_cursor(request.args.get("cursor")), limit
+            )
+            cursor.execute(query, params)
+            notes, next_cursor = paginate(cursor.fetchall(), limit, lambda n: (n["timestamp"], n["id"]))
+            if wants_json():
+                # Reading the JSON list has no side effects; clients mark
+                # what they have shown with POST /mark_notifications_read.
+                return page_json(notes, next_cursor)
+
+            # The page counts as having shown its notifications.
+            unread = [(note["id"],) for note in notes if not note["is_read"]]
+            if unread:
+                cursor.executemany("UPDATE notifications SET is_read = 1 WHERE id = ?", unread)
+                conn.commit()
 
-        return render_template("notifications.html", notifications=notes)
+        return render_template("notifications.html", notifications=notes, next_cursor=next_cursor)
 
-    @app.route("/search")
-    def search():
-        location = request.args.get("location", "").strip()
-        date = request.args.get("date", "").strip()
-        make = request.args.get("make", "").strip()
-        color = request.args.get("color", "").strip()
-        min_price = request.args.get("min_price", "").strip()
-        max_price = request.args.get("max_price", "").strip()
+    @app.route("/mark_notifications_read", methods=["POST"])
+    def mark_notifications_read():
+        if not UserSession.get_instance().is_authenticated():
+            return {"error": "Not logged in"}, 401
+
+        # Marks this user's notifications up to and including id `up_to`, or all of them.
+        query = "UPDATE notifications SET is_read = 1 WHERE user_id = ? AND is_read = 0"
+        params = [UserSession.get_instance().user_id]
+        up_to = request.form.get("up_to", type=int)
+        if up_to is not None:
+            query += " AND id <= ?"
+            params.append(up_to)
+        with get_db() as conn:
+            conn.execute(query, params)
+            conn.commit()
+        return "", 204
+
+    # Live updates: /events streams new notifications (and new messages in one
+    # thread with ?thread=<user_id>) as Server-Sent Events; /events/poll returns
+    # the same deltas as JSON for clients that cannot hold a stream open.
+    # Both take since_notification/since_message ids and only ever read rows
+    # with a larger id, so a client resumes exactly where it left off.
+    def parse_since(name):
+        value = request.args.get(name, "")
+        return int(value) if value.isdigit() else None
+
+    def live_cursors(conn, user_id, other_id, since_notification, since_message):
+        # Without a since id the client starts from what exists now.
+        if since_notification is None:
+            since_notification = conn.execute(
+                "SELECT COALESCE(MAX(id), 0) FROM notifications WHERE user_id = ?", (user_id,)
+            ).fetchone()[0]
+        if since_message is None:
+            since_message = 0
+            if other_id is not None:
+                conversation = find_conversation(conn, user_id, other_id)
+                if conversation is not None:
+                    since_message = conn.execute(
+                        "SELECT COALESCE(MAX(id), 0) FROM messages WHERE conversation_id = ?", (conversation["id"],)
+                    ).fetchone()[0]
+        return since_notification, since_message
+
+    def live_deltas(conn, user_id, other_id, since_notification, since_message, limit=LIVE_BATCH):
+        notes = conn.execute(
+            "SELECT id, message, timestamp FROM notifications WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?",
+            (user_id, since_notification, limit)
+        ).fetchall()
+        messages = []
+        if other_id is not None:
+            conversation = find_conversation(conn, user_id, other_id)
+            if conversation is not None:
+                messages = conn.execute('''
+                    SELECT m.id, m.sender_id, m.receiver_id, m.content, m.timestamp, u.full_name AS sender_name
+                    FROM messages m
+                    JOIN users u ON m.sender_id = u.id
+                    WHERE m.conversation_id = ? AND m.id > ?
+                    ORDER BY m.id LIMIT ?
+                ''', (conversation["id"], since_message, limit)).fetchall()
+        return [dict(note) for note in notes], [dict(message) for message in messages]
+
+    def live_channels(user_id, other_id):
+        channels = [("user", user_id)]
+        if other_id is not None:
+            channels.append(("conversation",) + conversation_pair(user_id, other_id))
+        return channels
+
+    @app.route("/events")
+    def events():
+        if not UserSession.get_instance().is_authenticated():
+            return {"error": "Not logged in"}, 401
 
-        cars = []
+        user_id = UserSession.get_instance().user_id
+        other_id = request.args.get("thread", type=int)
+        since_notification, since_message = parse_since("since_notification"), parse_since("since_message")
+        # EventSource sends the id of the last event it saw when it reconnects.
+        last_event_id = request.headers.get("Last-Event-ID", "")
+        if "-" in last_event_id:
+            notification_part, _, message_part = last_event_id.partition("-")
+            if notification_part.isdigit() and message_part.isdigit():
+                since_notification, since_message = int(notification_part), int(message_part)
+
+        subscription = event_hub.subscribe(*live_channels(user_id, other_id))
+        if subscription is None:
+            # Over this worker's stream limit; the client falls back to polling.
+            return {
+                "error": "Too many open streams; poll for updates instead.",
+                "poll": url_for("poll_events", **request.args.to_dict()),
+            }, 503, {"Retry-After": "30"}
         try:
-            query = '''
-                SELECT * FROM cars
+            with get_db() as conn:
+                since_notification, since_message = live_cursors(conn, user_id, other_id, since_notification, since_message)
+        except Exception:
+            subscription.close()
+            raise
+
+        heartbeat = app.config.get("SSE_HEARTBEAT_SECONDS", 15)
+        lifetime = app.config.get("SSE_MAX_SECONDS", 300)
+
+        def stream(since_notification, since_message):
+            # The stream holds no database connection while it waits; each
+            # wakeup borrows one for the delta query. Streams end after
+            # `lifetime` seconds and the browser reconnects with Last-Event-ID.
+            deadline = time.monotonic() + lifetime
+            try:
+                yield "retry: 3000\n\n"
+                while True:
+                    with pool.connection() as conn:
+                        notes, messages = live_deltas(conn, user_id, other_id, since_notification, since_message)
+                    for kind, rows in (("notification", notes), ("message", messages)):
+                        for row in rows:
+                            if kind == "notification":
+                                since_notification = row["id"]
+                            else:
+                                since_message = row["id"]
+                            yield f"id: {since_notification}-{since_message}\nevent: {kind}\ndata: {json.dumps(row)}\n\n"
+                    if len(notes) == LIVE_BATCH or len(messages) == LIVE_BATCH:
+                        continue
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+                    # A timeout still re-reads, which picks up writes made by other workers.
+                    if not subscription.wait(min(heartbeat, remaining)):
+                        yield ": ping\n\n"
+            finally:
+                subscription.close()
+
+        response = app.response_class(stream(since_notification, since_message), mimetype="text/event-stream")
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Accel-Buffering"] = "no"
+        # Also covers a client that disconnects before the generator starts.
+        response.call_on_close(subscription.close)
+        return response
+
+    @app.route("/events/poll")
+    def poll_events():
+        if not UserSession.get_instance().is_authenticated():
+            return {"error": "Not logged in"}, 401
+
+        user_id = UserSession.get_instance().user_id
+        other_id = request.args.get("thread", type=int)
+        with get_db() as conn:
+            since_notification, since_message = live_cursors(
+                conn, user_id, other_id, parse_since("since_notification"), parse_since("since_message")
+            )
+            notes, messages = live_deltas(conn, user_id, other_id, since_notification, since_message)
+        return jsonify(
+            notifications=notes,
+            messages=messages,
+            since_notification=notes[-1]["id"] if notes else since_notification,
+            since_message=messages[-1]["id"] if messages else since_message,
+            more=len(notes) == LIVE_BATCH or len(messages) == LIVE_BATCH,
+        )
+
+    def find_cars(conn, location, start, end, make, color, min_price_value, max_price_value, area, sort, after, limit):
+        # Results are in id order when sort is None, otherwise keyed on
+        # (value, id): the distance from the area's center for "distance" and
+        # SORT_SQL[sort] for the other orders. after is the key of the last car
+        # on the previous page, or None. Returns (cars, next_cursor, distances).
+        keys = {}
+        distances = {}
+        if search_index.supports(location, make, color) and is_iso_date(start) and is_iso_date(end):
+            search_index.ensure_loaded(conn)
+            wanted = 4 * (limit + 1) if start else limit + 1
+            if sort == "distance":
+                ranked = search_index.nearest(
+                    area, after, location, make, color, min_price_value, max_price_value, wanted=wanted,
+                )
+            else:
+                near = search_index.near(area) if area else None
+                if area and area.center:
+                    distances = near
+                within = set(near) if area else None
+                if sort is None:
+                    car_ids = search_index.search(location, make, color, min_price_value, max_price_value, within=within)
+                    position = bisect.bisect_right(car_ids, after[0]) if after else 0
+                    ranked = ((car_id,) for car_id in car_ids[position:])
+                else:
+                    matches = search_index.matches(location, make, color, min_price_value, max_price_value, within=within)
+                    ranked = search_index.ordered(matches, sort, after, wanted)
+
+            def keyed():
+                for key in ranked:
+                    keys[key[-1]] = key
+                    yield key[-1]
+            candidates = keyed()
+            is_free = None
+            if start:
+                availability_bitmap.ensure_current(conn)
+                if availability_bitmap.covers(start, end):
+                    is_free = lambda ids: availability_bitmap.free_cars(ids, start, end)
+                else:
+                    availability_engine.ensure_loaded(conn)
+                    is_free = lambda ids: [car_id for car_id in ids if availability_engine.is_free(car_id, start, end)]
+            # Only take candidates (and check availability) until the page is full.
+            car_ids = []
+            while len(car_ids) <= limit:
+                batch = list(itertools.islice(candidates, 4 * (limit + 1) if is_free else limit + 1 - len(car_ids)))
+                if not batch:
+                    break
+                car_ids.extend(is_free(batch) if is_free else batch)
+            car_ids = car_ids[:limit + 1]
+            by_id = {car["id"]: car for car in fetch_cars(conn, car_ids)}
+            cars = [by_id[car_id] for car_id in car_ids if car_id in by_id]
+            if sort == "distance":
+                distances = {car_id: keys[car_id][0] for car_id in car_ids}
+        else:
+            # LIKE wildcards in the input or a non-ISO date: keep the original SQL semantics
+            query = CAR_ROWS + '''
                 WHERE is_available = 1
                 AND LOWER(location) LIKE LOWER(?)
-                AND id NOT IN (
-                    SELECT car_id FROM bookings
-                    WHERE ? BETWEEN start_date AND end_date AND status = 'confirmed'
-                )
-                AND id NOT IN (
-                    SELECT car_id FROM availability
-                    WHERE date = ? AND is_available = 0
-                )
             '''
-            params = [f"%{location}%", date, date]
+            params = [f"%{location}%"]
 
+            if start:
+                query += '''
+                    AND id NOT IN (
+                        SELECT car_id FROM bookings
+                        WHERE start_date <= ? AND end_date >= ? AND status = 'confirmed'
+                    )
+                    AND id NOT IN (
+                        SELECT car_id FROM availability_blocks
+                        WHERE start_date <= ? AND end_date >= ?
+                    )
+                '''
+                params.extend([end, start, end, start])
             if make:
                 query += " AND LOWER(make) LIKE LOWER(?)"
                 params.append(f"%{make}%")
             if color:
                 query += " AND LOWER(color) LIKE LOWER(?)"
                 params.append(f"%{color}%")
-            if min_price:
+            if min_price_value is not None:
                 query += " AND price >= ?"
-                params.append(float(min_price))
-            if max_price:
+                params.append(min_price_value)
+            if max_price_value is not None:
                 query += " AND price <= ?"
-                params.append(float(max_price))
+                params.append(max_price_value)
+            if area:
+                boxes = area.boxes()
+                query += " AND (" + " OR ".join(["(latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?)"] * len(boxes)) + ")"
+                for min_lat, min_lng, max_lat, max_lng in boxes:
+                    params.extend([min_lat, max_lat, min_lng, max_lng])
+            if area and area.center:
+                # Distances cannot be computed in SQL here; the bounding boxes
+                # keep the candidate set to the neighbourhood.
+                order = []
+                for car in conn.execute(query, params):
+                    distance = area.contains(car["latitude"], car["longitude"])
+                    if distance is not False:
+                        distances[car["id"]] = distance
+                        if sort == "distance":
+                            key = (round(distance, 4), car["id"])
+                        elif sort is None:
+                            key = (car["id"],)
+                        else:
+                            key = (row_sort_value(sort, car), car["id"])
+                        keys[car["id"]] = key
+                        order.append((key, car))
+                order.sort(key=lambda item: item[0])
+                position = bisect.bisect_right([item[0] for item in order], tuple(after)) if after else 0
+                cars = [car for _, car in order[position:position + limit + 1]]
+            elif sort is None:
+                query += " AND id > ? ORDER BY id LIMIT ?"
+                params.extend([after[0] if after else 0, limit + 1])
+                cars = conn.execute(query, params).fetchall()
+                keys = {car["id"]: (car["id"],) for car in cars}
+            else:
+                # price, year and mileage are walked in index order; rating and
+                # newest go through SQLite's LIMIT sorter, which keeps only the top rows.
+                value = SORT_SQL[sort]
+                if after:
+                    query += f" AND ({value}, c.id) > (?, ?)"
+                    params.extend(after)
+                query += f" ORDER BY {value}, c.id LIMIT ?"
+                params.append(limit + 1)
+                cars = conn.execute(query, params).fetchall()
+                keys = {car["id"]: (row_sort_value(sort, car), car["id"]) for car in cars}
+        cars, next_cursor = paginate(cars, limit, lambda car: keys[car["id"]])
+        if area and area.center:
+            return cars, next_cursor, {car["id"]: distances[car["id"]] for car in cars}
+        return cars, next_cursor, {}
+
+    def parse_area():
+        # lat/lng with an optional radius_km, and/or bbox=min_lat,min_lng,max_lat,max_lng.
+        center = parse_point(request.args.get("lat"), request.args.get("lng"))
+        bbox = parse_bbox(request.args.get("bbox", "").strip())
+        radius = request.args.get("radius_km", "").strip()
+        if radius:
+            radius_km = float(radius)
+        else:
+            # A bare center searches the default radius; with a bbox it only sets the sort order.
+            radius_km = DEFAULT_RADIUS_KM if center and not bbox else None
+        if center is None and bbox is None and radius_km is None:
+            return None
+        return GeoArea(center, radius_km, bbox)
 
-            with sqlite3.connect("database.db") as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                cursor.execute(query, params)
-                cars = cursor.fetchall()
+    @app.route("/search")
+    def search():
+        location = request.args.get("location", "").strip()
+        # "date" is the original single-day filter; it is kept as a shorthand for start=end=date.
+        date = request.args.get("date", "").strip()
+        start = request.args.get("start", "").strip() or date
+        end = request.args.get("end", "").strip() or start
+        make = request.args.get("make", "").strip()
+        color = request.args.get("color", "").strip()
+        min_price = request.args.get("min_price", "").strip()
+        max_price = request.args.get("max_price", "").strip()
+        sort = request.args.get("sort", "").strip()
+
+        cars = []
+        next_cursor = None
+        distances = {}
+        etag = last_modified = None
+        limit = page_size()
+        try:
+            min_price_value = float(min_price) if min_price else None
+            max_price_value = float(max_price) if max_price else None
+            if start and end < start:
+                raise ValueError("End date must be on or after the start date.")
+            area = parse_area()
+            # Without a sort, results near a point come nearest first and the others in id order.
+            if not sort:
+                sort_by = "distance" if area and area.center else None
+            elif sort == "distance":
+                if not (area and area.center):
+                    raise ValueError("Sorting by distance needs a latitude and longitude.")
+                sort_by = sort
+            elif sort in SORTS:
+                sort_by = sort
+            else:
+                raise ValueError(f"Sort must be one of: distance, {', '.join(SORTS)}.")
+
+            # Sorted pages continue after (value, id), the others after id.
+            if sort_by:
+                after = decode_cursor(request.args.get("cursor"), size=2)
+                if not (after and isinstance(after[0], (int, float)) and isinstance(after[1], int)):
+                    after = None
+            else:
+                after = decode_cursor(request.args.get("cursor"), size=1)
+                if not (after and isinstance(after[0], int)):
+                    after = None
+            after = tuple(after) if after else None
+
+            with get_db() as conn:
+                generation, updated_at = read_search_version(conn)
+                # Matching is ASCII case-insensitive, so "Detroit" and "detroit" share an entry.
+                key = (
+                    fold(location), start, end, fold(make), fold(color), min_price_value, max_price_value,
+                    area.key() if area else None, sort_by, after, limit,
+                )
+                # The navbar badges are part of the page as well.
+                user_id = UserSession.get_instance().user_id
+                counters = read_counters(conn, user_id) if user_id else None
+                etag = search_cache.etag(generation, key, user_id, counters, wants_json())
+                # The counters carry no timestamp, so only the ETag can
+                # validate a signed-in page; it gets no Last-Modified.
+                last_modified = None if user_id else datetime.utcfromtimestamp(updated_at)
+                # A pending flash message changes the page, so it always gets a fresh render.
+                if "_flashes" not in session and not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                    return conditional_response(app.response_class(status=304), etag, last_modified)
+
+                result = search_cache.get(generation, key)
+                if result is None:
+                    result = find_cars(
+                        conn, location, start, end, make, color, min_price_value, max_price_value, area, sort_by,
+                        after, limit,
+                    )
+                    search_cache.put(generation, key, result)
+                cars, next_cursor, distances = result
 
         except Exception as e:
             flash(f"Search error: {str(e)}")
-
-        return render_template(
-            "search.html",
-            cars=cars,
-            location=location,
-            date=date,
-            make=make,
-            color=color,
-            min_price=min_price,
-            max_price=max_price
-        )
+            etag = None
+
+        if wants_json():
+            if distances:
+                cars = [dict(car, distance_km=round(distances[car["id"]], 3)) for car in cars]
+            response = page_json(cars, next_cursor)
+        else:
+            response = app.make_response(render_template(
+                "search.html",
+                cars=cars,
+                distances=distances,
+                location=location,
+                start=start,
+                end=end,
+                make=make,
+                color=color,
+                min_price=min_price,
+                max_price=max_price,
+                lat=request.args.get("lat", ""),
+                lng=request.args.get("lng", ""),
+                radius_km=request.args.get("radius_km", ""),
+                bbox=request.args.get("bbox", ""),
+                sort=sort,
+                next_cursor=next_cursor
+            ))
+        if etag is None:
+            return response
+        return conditional_response(response, etag, last_modified)
 
     @app.route("/logout")
     def logout():
@@ -22,7 +22,7 @@ async function sendMessage() {
         alert("Please enter both the username and message.");
         return false;
     }
-    const receiver_id = await getUserIdByUsername(username);
+    const receiver_id = recipientMatches[username.toLowerCase()] || await getUserIdByUsername(username);
     if (!receiver_id) {
         alert("Invalid username.");
         return false;
@@ -34,6 +34,78 @@ async function sendMessage() {
     return false;
 }
 
+// Recipient autocomplete for the send-message popup. Keystrokes are debounced,
+// at most one request is in flight (the newest prefix typed meanwhile goes
+// next), and a prefix whose results were complete (fewer than the limit) is
+// narrowed locally instead of asking the server again.
+const AUTOCOMPLETE_LIMIT = 8;
+const recipientMatches = {};
+const autocompleteCache = {};
+let autocompleteTimer = null;
+let autocompleteInFlight = false;
+let autocompletePending = null;
+
+function cachedRecipients(prefix) {
+    for (let i = prefix.length; i > 0; i--) {
+        const items = autocompleteCache[prefix.slice(0, i)];
+        if (items && (i === prefix.length || items.length < AUTOCOMPLETE_LIMIT)) {
+            return items.filter(item => item.full_name.toLowerCase().startsWith(prefix));
+        }
+    }
+    return null;
+}
+
+function showRecipients(items) {
+    const options = items.map(item => {
+        recipientMatches[item.full_name.toLowerCase()] = item.id;
+        const option = document.createElement('option');
+        option.value = item.full_name;
+        return option;
+    });
+    document.getElementById('recipient-options').replaceChildren(...options);
+}
+
+function requestRecipients(prefix) {
+    const cached = cachedRecipients(prefix);
+    if (cached) {
+        showRecipients(cached);
+        return;
+    }
+    if (autocompleteInFlight) {
+        autocompletePending = prefix;
+        return;
+    }
+    autocompleteInFlight = true;
+    fetch(`/users/autocomplete?q=${encodeURIComponent(prefix)}&limit=${AUTOCOMPLETE_LIMIT}`)
+    .then(response => response.ok ? response.json() : { items: [] })
+    .then(data => { autocompleteCache[prefix] = data.items; })
+    .catch(error => console.error("Error fetching recipients:", error))
+    .finally(() => {
+        autocompleteInFlight = false;
+        const next = autocompletePending || prefix;
+        autocompletePending = null;
+        if (next !== prefix || autocompleteCache[prefix]) requestRecipients(next);
+    });
+}
+
+function onRecipientInput(input) {
+    clearTimeout(autocompleteTimer);
+    const prefix = input.value.trim().toLowerCase();
+    if (!prefix) return;
+    autocompleteTimer = setTimeout(() => requestRecipients(prefix), 150);
+}
+
+function useMyLocation() {
+    if (!navigator.geolocation) {
+        alert("Your browser cannot share its location.");
+        return;
+    }
+    navigator.geolocation.getCurrentPosition(position => {
+        document.getElementById('lat').value = position.coords.latitude.toFixed(5);
+        document.getElementById('lng').value = position.coords.longitude.toFixed(5);
+    }, () => alert("Could not get your location."));
+}
+
 function openSendMessagePopup(){
     document.getElementById("sendMessagePopup").style.display = "block";
 }
@@ -55,3 +127,88 @@ function markAsRead(messageId, element) {
     })
     .catch(error => console.error("Error marking message as read:", error));
 }
+
+function markConversationRead(userId, element) {
+    fetch(`/mark_conversation_read/${userId}`, {
+        method: 'POST'
+    })
+    .then(response => {
+        if (response.ok) {
+            element.classList.remove('unread');
+            element.querySelectorAll('.badge, button.btn:not(.btn-danger)').forEach(el => el.remove());
+        } else {
+            console.error("Failed to mark conversation as read");
+        }
+    })
+    .catch(error => console.error("Error marking conversation as read:", error));
+}
+
+function markNotificationsRead(upTo) {
+    const body = new URLSearchParams({ up_to: upTo });
+    fetch('/mark_notifications_read', { method: 'POST', body: body })
+    .then(response => {
+        if (!response.ok) console.error("Failed to mark notifications as read");
+    })
+    .catch(error => console.error("Error marking notifications as read:", error));
+}
+
+// Live updates: streams /events with EventSource and falls back to polling
+// /events/poll when a stream cannot be kept open (no EventSource support,
+// buffering proxies, or the server answering 503 when it is at capacity).
+function startLiveUpdates(options) {
+    let sinceNotification = options.sinceNotification;
+    let sinceMessage = options.sinceMessage;
+    const pollInterval = options.pollInterval || 10000;
+
+    function query() {
+        const params = new URLSearchParams();
+        if (options.thread) params.set('thread', options.thread);
+        if (sinceNotification != null) params.set('since_notification', sinceNotification);
+        if (sinceMessage != null) params.set('since_message', sinceMessage);
+        return params.toString();
+    }
+
+    function deliver(kind, item) {
+        if (kind === 'notification') {
+            sinceNotification = item.id;
+            if (options.onNotification) options.onNotification(item);
+        } else {
+            sinceMessage = item.id;
+            if (options.onMessage) options.onMessage(item);
+        }
+    }
+
+    function poll() {
+        fetch(`/events/poll?${query()}`)
+        .then(response => response.ok ? response.json() : null)
+        .then(data => {
+            if (data) {
+                data.notifications.forEach(item => deliver('notification', item));
+                data.messages.forEach(item => deliver('message', item));
+                sinceNotification = data.since_notification;
+                sinceMessage = data.since_message;
+            }
+            setTimeout(poll, data && data.more ? 0 : pollInterval);
+        })
+        .catch(() => setTimeout(poll, pollInterval));
+    }
+
+    if (!window.EventSource) {
+        poll();
+        return;
+    }
+    const source = new EventSource(`/events?${query()}`);
+    let failures = 0;
+    source.onopen = () => { failures = 0; };
+    source.addEventListener('notification', event => deliver('notification', JSON.parse(event.data)));
+    source.addEventListener('message', event => deliver('message', JSON.parse(event.data)));
+    source.onerror = () => {
+        // The browser reconnects on its own (streams are recycled every few
+        // minutes); repeated failures mean streaming does not work here.
+        failures += 1;
+        if (failures >= 3 || source.readyState === EventSource.CLOSED) {
+            source.close();
+            poll();
+        }
+    };
+}
@@ -0,0 +1,244 @@
+import os
+import random
+import tempfile
+from datetime import timedelta
+
+# app.py reads these at import time.
+os.environ.setdefault("DRIVESHARE_DB", os.path.join(tempfile.mkdtemp(), "driveshare.db"))
+os.environ["DRIVESHARE_PASSWORD_WORKERS"] = "0"
+
+import pytest
+
+import app as driveshare
+from python_scripts import db_pool
+from python_scripts.availability_bitmap import availability_bitmap
+from python_scripts.availability_engine import engine
+from python_scripts.car_cache import car_cache
+from python_scripts.notification_queue import notification_writer
+from python_scripts.search_cache import search_cache
+from python_scripts.search_index import search_index
+
+PASSWORD = "pw"
+
+
+def reset_singletons():
+    # The in-process indexes outlive a test's database; start each test empty.
+    with search_index._lock:
+        search_index._reset()
+        search_index._loaded = False
+    with engine._lock:
+        engine._cars = {}
+        engine._loaded = False
+    with availability_bitmap._lock:
+        availability_bitmap._base = None
+        availability_bitmap._bits = {}
+    car_cache.configure()
+    search_cache.clear()
+
+
+@pytest.fixture
+def app(tmp_path):
+    flask_app = driveshare.app
+    flask_app.config.update(TESTING=True, NOTIFICATIONS_ASYNC=False, DATABASE=str(tmp_path / "driveshare.db"))
+    db_pool.pool.configure(flask_app.config["DATABASE"])
+    reset_singletons()
+    driveshare.init_db()
+    yield flask_app
+    db_pool.pool.close_all()
+
+
+@pytest.fixture
+def db(app):
+    with db_pool.pool.connection() as conn:
+        yield conn
+
+
+class Actor:
+    # A logged-in test client.
+    def __init__(self, client, user_id, email):
+        self.client = client
+        self.user_id = user_id
+        self.email = email
+
+    def get(self, *args, **kwargs):
+        return self.client.get(*args, **kwargs)
+
+    def post(self, *args, **kwargs):
+        return self.client.post(*args, **kwargs)
+
+    def flashes(self):
+        with self.client.session_transaction() as session:
+            return [message for _, message in session.get("_flashes", [])]
+
+
+@pytest.fixture
+def signup(app, db):
+    def signup(name):
+        email = f"{name.lower().replace(' ', '.')}@example.com"
+        client = app.test_client()
+        client.post("/register", data=dict(
+            email=email, password=PASSWORD, full_name=name, security_q1="a", security_q2="b", security_q3="c",
+        ))
+        response = client.post("/login", data=dict(email=email, password=PASSWORD))
+        assert "dashboard" in response.location
+        user_id = db.execute("SELECT id FROM users WHERE email = ?", (email,)).fetchone()[0]
+        return Actor(client, user_id, email)
+    return signup
+
+
+@pytest.fixture
+def list_car(db):
+    def list_car(owner, make="Honda", model="Civic", price="50", location="Detroit, MI", **fields):
+        owner.post("/list_car", data=dict(
+            make=make, model=model, year=fields.pop("year", "2020"), mileage=fields.pop("mileage", "1000"),
+            color=fields.pop("color", "Red"), price=price, location=location, precise_location="1 Main St",
+            **fields,
+        ))
+        return db.execute("SELECT MAX(id) FROM cars WHERE owner_id = ?", (owner.user_id,)).fetchone()[0]
+    return list_car
+
+
+@pytest.fixture
+def book(db):
+    def book(renter, car_id, start_date, end_date, funds="1000"):
+        if funds:
+            renter.post("/add_funds", data=dict(amount=funds))
+        renter.post(f"/booking/{car_id}", data=dict(start_date=start_date, end_date=end_date))
+        renter.post("/payment/pending")
+        return db.execute(
+            "SELECT MAX(id) FROM bookings WHERE car_id = ? AND renter_id = ?", (car_id, renter.user_id)
+        ).fetchone()[0]
+    return book
+
+
+@pytest.fixture
+def seed_bookings(db, signup):
+    # Random confirmed and cancelled bookings and owner blocks, written
+    # directly so they land at any date.
+    def seed_bookings(today, rng, cars=12):
+        owner, renter = signup("Olive Owner"), signup("Rita Renter")
+        car_ids = []
+        for _ in range(cars):
+            cursor = db.execute(
+                "INSERT INTO cars (owner_id, make, model, year, mileage, price, location) VALUES (?, 'Kia', 'Soul', 2020, 1, 10, 'Flint')",
+                (owner.user_id,),
+            )
+            car_ids.append(cursor.lastrowid)
+        for _ in range(60):
+            car_id = rng.choice(car_ids)
+            start = today + timedelta(days=rng.randint(-20, 200))
+            end = start + timedelta(days=rng.randint(0, 9))
+            table = rng.choice(("bookings", "availability_blocks", "cancelled"))
+            if table == "availability_blocks":
+                db.execute("INSERT INTO availability_blocks (car_id, start_date, end_date) VALUES (?, ?, ?)",
+                           (car_id, start.isoformat(), end.isoformat()))
+            else:
+                db.execute(
+                    "INSERT INTO bookings (car_id, renter_id, start_date, end_date, status) VALUES (?, ?, ?, ?, ?)",
+                    (car_id, renter.user_id, start.isoformat(), end.isoformat(),
+                     "confirmed" if table == "bookings" else "cancelled"),
+                )
+        db.commit()
+        return car_ids
+    return seed_bookings
+
+
+@pytest.fixture
+def busy_in_sql(db):
+    def busy_in_sql(car_id, start_date, end_date):
+        return db.execute('''
+            SELECT EXISTS (SELECT 1 FROM bookings WHERE car_id = ? AND status = 'confirmed' AND start_date <= ? AND end_date >= ?)
+                OR EXISTS (SELECT 1 FROM availability_blocks WHERE car_id = ? AND start_date <= ? AND end_date >= ?)
+        ''', (car_id, end_date, start_date, car_id, end_date, start_date)).fetchone()[0]
+    return busy_in_sql
+
+
+@pytest.fixture
+def search_cars(db, signup):
+    # 37 cars with mixed prices, years, ratings and availability, for paging /search.
+    owner = signup("Olive Owner")
+    rng = random.Random(11)
+    for i in range(37):
+        cursor = db.execute('''
+            INSERT INTO cars (owner_id, make, model, year, mileage, color, price, location, is_available)
+            VALUES (?, ?, 'Model', ?, ?, 'Red', ?, ?, ?)
+        ''', (
+            owner.user_id, rng.choice(("Honda", "Ford", "Kia")), rng.randint(2015, 2024), rng.randint(0, 5000),
+            rng.choice((25, 40, 40, 55.5, 80)), rng.choice(("Detroit, MI", "Flint, MI")), int(i % 9 != 0),
+        ))
+        if rng.random() < 0.6:
+            count = rng.randint(1, 4)
+            db.execute(
+                "INSERT INTO car_rating_stats (car_id, rating_count, rating_sum) VALUES (?, ?, ?)",
+                (cursor.lastrowid, count, rng.randint(count, 5 * count)),
+            )
+    db.commit()
+    return owner
+
+
+@pytest.fixture
+def search_pages():
+    # Car ids from following /search next_cursor links to the end.
+    def search_pages(actor, **args):
+        seen = []
+        cursor = None
+        while True:
+            query = dict(args, format="json", limit=5)
+            if cursor:
+                query["cursor"] = cursor
+            page = actor.get("/search", query_string=query).json
+            seen.extend(car["id"] for car in page["items"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                return seen
+    return search_pages
+
+
+def snapshot(db, queries):
+    return {table: sorted(tuple(row) for row in db.execute(sql)) for table, sql in queries.items()}
+
+
+@pytest.fixture
+def marketplace(signup, list_car, book):
+    owner, renter, other = signup("Olive Owner"), signup("Rita Renter"), signup("Omar Other")
+    civic = list_car(owner)
+    focus = list_car(owner, make="Ford", model="Focus", price="30.15")
+    jeep = list_car(other, make="Jeep", model="Wrangler", price="99.99")
+
+    first = book(renter, civic, "2030-01-01", "2030-01-03")
+    book(renter, focus, "2030-01-31", "2030-02-02")
+    book(owner, jeep, "2030-03-01", "2030-03-01")
+    renter.post(f"/review/{first}", data=dict(rating="5", comment="great"))
+    owner.post(f"/review_renter/{first}", data=dict(rating="4", comment="fine"))
+
+    for text in ("hi", "are you there?"):
+        renter.post(f"/send_message/{owner.user_id}", data=dict(message=text))
+    owner.post(f"/send_reply/{renter.user_id}", data=dict(message="yes"))
+    other.post(f"/send_message/{owner.user_id}", data=dict(message="hello"))
+    owner.post(f"/mark_conversation_read/{renter.user_id}")
+    notification_writer.flush()
+    return owner, renter, other, civic, focus, jeep
+
+
+@pytest.fixture
+def pruned_marketplace(db, marketplace):
+    # Deleting a booked car and a conversation's last message are the writes
+    # incremental upkeep most easily gets wrong.
+    owner, renter, other, civic, focus, jeep = marketplace
+    owner.post(f"/delete_car/{focus}")
+    message_id = db.execute("SELECT MAX(id) FROM messages WHERE sender_id = ?", (other.user_id,)).fetchone()[0]
+    owner.post(f"/delete_message/{message_id}")
+    return marketplace
+
+
+@pytest.fixture
+def rebuild_matches(app, db):
+    # A table kept up to date by triggers or in the writing transaction must
+    # match what its rebuild-* command recomputes from the source rows.
+    def rebuild_matches(command, queries):
+        before = snapshot(db, queries)
+        assert all(before.values())
+        result = app.test_cli_runner().invoke(args=[command])
+        assert result.exit_code == 0, result.output
+        assert snapshot(db, queries) == before
+    return rebuild_matches
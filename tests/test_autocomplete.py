@@ -0,0 +1,68 @@
+from python_scripts import metrics
+
+NAMES = ["ann Archer", "Anna Bell", "ANNE Cole", "Andy Dunn", "Bob Brown", "annette Ng", "Ann archer"]
+
+
+def add_users(db, names):
+    db.executemany(
+        "INSERT INTO users (email, password, full_name, security_q1, security_q2, security_q3) VALUES (?, 'x', ?, 'a', 'b', 'c')",
+        [(f"user{i}@example.com", name) for i, name in enumerate(names)],
+    )
+    db.commit()
+
+
+def names(actor, **query):
+    return [item["full_name"] for item in actor.get("/users/autocomplete", query_string=query).json["items"]]
+
+
+def test_prefix_matches_any_case_in_name_order(db, signup):
+    alice = signup("Annabel Self")
+    add_users(db, NAMES)
+    expected = sorted((name for name in NAMES if name.lower().startswith("ann")), key=str.lower)
+    assert names(alice, q="ANN", limit=20) == names(alice, q="ann", limit=20)
+    assert [name.lower() for name in names(alice, q="ann", limit=20)] == [name.lower() for name in expected]
+    # The signed-in user is never offered as a recipient.
+    assert "Annabel Self" not in names(alice, q="anna")
+    assert names(alice, q="ann", limit=2) == names(alice, q="ann", limit=20)[:2]
+    assert names(alice, q="  ") == [] and names(alice, q="zed") == []
+
+
+def test_limit_is_capped(db, signup):
+    alice = signup("Alice Adams")
+    add_users(db, [f"Zed {i:02}" for i in range(30)])
+    assert len(names(alice, q="zed")) == 8
+    assert len(names(alice, q="zed", limit=500)) == 20
+    assert len(names(alice, q="zed", limit=0)) == 1
+
+
+def test_autocomplete_seeks_the_name_index(db, signup, monkeypatch):
+    alice = signup("Alice Adams")
+    queries = []
+    record = metrics._record_query
+
+    def capture(sql, parameters, elapsed):
+        if "FROM users" in sql and "full_name >=" in sql:
+            queries.append((sql, parameters))
+        record(sql, parameters, elapsed)
+
+    monkeypatch.setattr(metrics, "_record_query", capture)
+    alice.get("/users/autocomplete", query_string=dict(q="an"))
+    monkeypatch.undo()
+    [(sql, parameters)] = queries
+    plan = " ".join(row[3] for row in db.execute("EXPLAIN QUERY PLAN " + sql, parameters))
+    assert "SEARCH users USING COVERING INDEX idx_users_full_name" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_get_user_id_prefers_the_exact_case(app, db):
+    add_users(db, NAMES)
+    client = app.test_client()
+    exact = db.execute("SELECT id FROM users WHERE full_name = 'Ann archer'").fetchone()[0]
+    assert client.get("/get_user_id/Ann archer").json == {"user_id": exact}
+    first = db.execute("SELECT id FROM users WHERE full_name = 'ann Archer'").fetchone()[0]
+    assert client.get("/get_user_id/ANN ARCHER").json == {"user_id": first}
+    assert client.get("/get_user_id/Nobody").status_code == 404
+
+
+def test_autocomplete_needs_a_login(app):
+    assert app.test_client().get("/users/autocomplete", query_string=dict(q="a")).status_code == 401
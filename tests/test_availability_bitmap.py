@@ -0,0 +1,33 @@
+import random
+from datetime import date, timedelta
+
+from python_scripts.availability_bitmap import AvailabilityBitmap
+
+
+def test_bitmap_agrees_with_sql(db, seed_bookings, busy_in_sql):
+    rng = random.Random(3)
+    today = date(2030, 1, 1)
+    car_ids = seed_bookings(today, rng)
+    bitmap = AvailabilityBitmap(horizon_days=120)
+    bitmap.load(db, today)
+
+    for _ in range(200):
+        start = today + timedelta(days=rng.randint(0, 110))
+        start_date, end_date = start.isoformat(), (start + timedelta(days=rng.randint(0, 9))).isoformat()
+        if bitmap.covers(start_date, end_date):
+            free = [car_id for car_id in car_ids if not busy_in_sql(car_id, start_date, end_date)]
+            assert bitmap.free_cars(car_ids, start_date, end_date) == free
+
+
+def test_bitmap_slides_forward_like_a_fresh_load(db, seed_bookings):
+    today = date(2030, 1, 1)
+    seed_bookings(today, random.Random(5))
+    slid = AvailabilityBitmap(horizon_days=60)
+    slid.load(db, today)
+    for step in (1, 7, 30):
+        today += timedelta(days=step)
+        slid.ensure_current(db, today)
+        fresh = AvailabilityBitmap(horizon_days=60)
+        fresh.load(db, today)
+        assert slid._base == fresh._base
+        assert {car: bits for car, bits in slid._bits.items() if bits} == {car: bits for car, bits in fresh._bits.items() if bits}
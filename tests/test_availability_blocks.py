@@ -0,0 +1,57 @@
+from datetime import date
+
+import pytest
+
+from python_scripts.availability_blocks import parse_blocks
+from python_scripts.availability_engine import from_day
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("2030-01-06, 2030-01-08 to 2030-01-09", [("2030-01-06", "2030-01-06"), ("2030-01-08", "2030-01-09")]),
+    ("every Mon, Wed through 2030-01-16", [
+        ("2030-01-02", "2030-01-02"), ("2030-01-07", "2030-01-07"), ("2030-01-09", "2030-01-09"),
+        ("2030-01-14", "2030-01-14"), ("2030-01-16", "2030-01-16"),
+    ]),
+    ("2030-01-02, every Sat, Sun from 2030-01-05 until 2030-01-13; 2030-02-01", [
+        ("2030-01-02", "2030-01-02"), ("2030-01-05", "2030-01-06"), ("2030-01-12", "2030-01-13"),
+        ("2030-02-01", "2030-02-01"),
+    ]),
+    ("every Tue, and Thu thru 2030-01-10, 2030-01-20", [
+        ("2030-01-01", "2030-01-01"), ("2030-01-03", "2030-01-03"), ("2030-01-08", "2030-01-08"),
+        ("2030-01-10", "2030-01-10"), ("2030-01-20", "2030-01-20"),
+    ]),
+])
+def test_parse_blocks(text, expected):
+    ranges = parse_blocks(text, today=date(2030, 1, 1))
+    assert [(from_day(start), from_day(end)) for start, end in ranges] == expected
+
+
+def test_availability_lists_days_and_blocks(db, signup, list_car):
+    owner = signup("Olive Owner")
+    car_id = list_car(owner)
+    db.execute("INSERT INTO availability (car_id, date, is_available) VALUES (?, '2030-01-01', 1)", (car_id,))
+    db.commit()
+    owner.post(f"/set_availability/{car_id}", data=dict(unavailable_dates="2030-01-02 to 2030-01-03, 2030-01-05"))
+    assert owner.get(f"/availability/{car_id}").json == [
+        {"date": "2030-01-01", "is_available": True},
+        {"date": "2030-01-02", "is_available": False},
+        {"date": "2030-01-03", "is_available": False},
+        {"date": "2030-01-05", "is_available": False},
+    ]
+    assert owner.get(f"/availability/{car_id}/blocks").json == [
+        {"start_date": "2030-01-02", "end_date": "2030-01-03", "is_available": False},
+        {"start_date": "2030-01-05", "end_date": "2030-01-05", "is_available": False},
+    ]
+
+
+def test_saved_blocks_merge_with_existing_ones(db, signup, list_car):
+    owner, renter = signup("Olive Owner"), signup("Rita Renter")
+    car_id = list_car(owner)
+    owner.post(f"/set_availability/{car_id}", data=dict(unavailable_dates="2030-01-02 to 2030-01-03, 2030-01-08"))
+    owner.post(f"/set_availability/{car_id}", data=dict(unavailable_dates="2030-01-04 to 2030-01-06, 2030-01-03"))
+    blocks = db.execute("SELECT start_date, end_date FROM availability_blocks WHERE car_id = ? ORDER BY start_date", (car_id,))
+    assert [tuple(row) for row in blocks] == [("2030-01-02", "2030-01-06"), ("2030-01-08", "2030-01-08")]
+    # Bookings see the merged blocks straight away.
+    renter.post("/add_funds", data=dict(amount="1000"))
+    response = renter.post(f"/booking/{car_id}", data=dict(start_date="2030-01-06", end_date="2030-01-07"))
+    assert b"Car is not available on these dates: 2030-01-06" in response.data
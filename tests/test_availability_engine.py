@@ -0,0 +1,62 @@
+import random
+from datetime import date, timedelta
+
+from python_scripts.availability_engine import BLOCKED, BOOKED, AvailabilityEngine, IntervalSet, from_day, to_day
+
+
+def test_interval_set_merges_and_matches_brute_force():
+    rng = random.Random(7)
+    ranges = IntervalSet()
+    days = set()
+    for _ in range(300):
+        start = rng.randint(0, 400)
+        end = start + rng.randint(0, 6)
+        ranges.add(start, end)
+        days.update(range(start, end + 1))
+        # Sorted, disjoint and never touching: touching ranges are merged.
+        assert all(ranges.ends[i] + 1 < ranges.starts[i + 1] for i in range(len(ranges) - 1))
+        assert all(s <= e for s, e in zip(ranges.starts, ranges.ends))
+    for _ in range(500):
+        start = rng.randint(-5, 410)
+        end = start + rng.randint(0, 10)
+        wanted = set(range(start, end + 1)) & days
+        assert ranges.overlaps(start, end) == bool(wanted)
+        found = ranges.conflicts(start, end)
+        assert {day for s, e in found for day in range(s, e + 1)} == wanted
+
+
+def test_engine_agrees_with_sql(db, seed_bookings, busy_in_sql):
+    rng = random.Random(3)
+    today = date(2030, 1, 1)
+    car_ids = seed_bookings(today, rng)
+    engine = AvailabilityEngine()
+    engine.load(db)
+
+    for _ in range(200):
+        start = today + timedelta(days=rng.randint(-30, 220))
+        start_date, end_date = start.isoformat(), (start + timedelta(days=rng.randint(0, 9))).isoformat()
+        free = [car_id for car_id in car_ids if not busy_in_sql(car_id, start_date, end_date)]
+        assert [car_id for car_id in car_ids if engine.is_free(car_id, start_date, end_date)] == free
+
+
+def test_engine_reports_conflicting_ranges():
+    engine = AvailabilityEngine()
+    engine.add_booking(1, "2030-01-01", "2030-01-03")
+    engine.add_block(1, "2030-01-05")
+    engine.add_block(1, "2030-01-06")
+    assert engine.conflicts(1, "2030-01-02", "2030-01-10", BOOKED) == [("2030-01-02", "2030-01-03")]
+    assert engine.conflicts(1, "2030-01-02", "2030-01-10", BLOCKED) == [("2030-01-05", "2030-01-06")]
+    assert engine.is_free(1, "2030-01-04", "2030-01-04")
+    assert not engine.is_free(1, "2030-01-04", "2030-01-05")
+    assert engine.is_free(2, "2030-01-01", "2030-12-31")
+    assert from_day(to_day("2030-02-28") + 1) == "2030-03-01"
+
+
+def test_booking_route_refuses_taken_dates(signup, list_car, book):
+    owner, renter, other = signup("Olive Owner"), signup("Rita Renter"), signup("Omar Other")
+    car_id = list_car(owner)
+    assert book(renter, car_id, "2030-01-01", "2030-01-03")
+    other.post("/add_funds", data=dict(amount="1000"))
+    response = other.post(f"/booking/{car_id}", data=dict(start_date="2030-01-03", end_date="2030-01-05"))
+    assert b"Car is already booked for the selected dates." in response.data
+    assert book(other, car_id, "2030-01-04", "2030-01-05", funds=None)
@@ -0,0 +1,60 @@
+import random
+from datetime import date
+
+from python_scripts.availability_calendar import run_length
+
+
+def test_calendar_runs_cover_the_window(app, db, signup, list_car, book):
+    owner, renter = signup("Olive Owner"), signup("Rita Renter")
+    car_id = list_car(owner)
+    book(renter, car_id, "2030-01-03", "2030-01-05")
+    owner.post(f"/set_availability/{car_id}", data=dict(unavailable_dates="2030-01-05 to 2030-01-08"))
+    response = app.test_client().get(f"/calendar/{car_id}", query_string=dict(start="2030-01-01", end="2030-01-10"))
+    # The booked day that is also blocked shows as booked.
+    assert response.json == {
+        "car_id": car_id, "start": "2030-01-01", "end": "2030-01-10",
+        "runs": [["free", 2], ["booked", 3], ["blocked", 3], ["free", 2]],
+    }
+
+
+def test_calendars_for_several_cars_revalidate(app, signup, list_car, book):
+    owner, renter = signup("Olive Owner"), signup("Rita Renter")
+    civic, focus = list_car(owner), list_car(owner, make="Ford", model="Focus")
+    client = app.test_client()
+    query = dict(car_ids=f"{focus},{civic},999", start="2030-01-01", end="2030-01-05")
+    first = client.get("/calendar", query_string=query)
+    assert first.json["cars"] == {str(civic): [["free", 5]], str(focus): [["free", 5]]}
+    assert first.json["missing"] == [999]
+    assert client.get("/calendar", query_string=query, headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+
+    book(renter, civic, "2030-01-02", "2030-01-02")
+    again = client.get("/calendar", query_string=query, headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 200
+    assert again.json["cars"][str(civic)] == [["free", 1], ["booked", 1], ["free", 3]]
+
+
+def test_calendar_rejects_bad_windows(app):
+    client = app.test_client()
+    assert client.get("/calendar").status_code == 400
+    assert client.get("/calendar/1", query_string=dict(start="2030-01-05", end="2030-01-01")).status_code == 400
+    assert client.get("/calendar/1", query_string=dict(start="2030-01-01", end="2031-06-01")).status_code == 400
+    assert client.get("/calendar", query_string=dict(car_ids=",".join(map(str, range(1, 102))))).status_code == 400
+    assert client.get("/calendar/1").status_code == 404
+
+
+def test_run_length_matches_a_day_by_day_walk():
+    rng = random.Random(9)
+    first = date(2030, 1, 1).toordinal()
+    for _ in range(50):
+        spans = []
+        for _ in range(rng.randint(0, 6)):
+            start = first + rng.randint(-5, 40)
+            spans.append((start, start + rng.randint(0, 6), rng.choice(("booked", "blocked"))))
+        last = first + rng.randint(0, 35)
+        expected = []
+        for day in range(first, last + 1):
+            kinds = {kind for start, end, kind in spans if start <= day <= end}
+            expected.append("booked" if "booked" in kinds else "blocked" if kinds else "free")
+        runs = run_length(spans, first, last)
+        assert [state for state, length in runs for _ in range(length)] == expected
+        assert all(runs[i][0] != runs[i + 1][0] for i in range(len(runs) - 1))
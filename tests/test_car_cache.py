@@ -0,0 +1,53 @@
+from python_scripts.car_cache import CarCache, car_cache
+
+
+def test_car_pages_read_through_the_cache(db, signup, list_car):
+    owner = signup("Olive Owner")
+    car_id = list_car(owner, price="50")
+    owner.get(f"/car/{car_id}")
+    hits = car_cache.stats()["hits"]
+    assert b"50" in owner.get(f"/car/{car_id}").data
+    assert car_cache.stats()["hits"] == hits + 1
+
+    owner.post(f"/edit_car/{car_id}", data=dict(
+        make="Honda", model="Civic", year="2020", mileage="1000", color="Red", price="61.5", location="Detroit, MI",
+    ))
+    assert car_cache.get(lambda: db, car_id).price == 61.5
+
+
+def test_reviews_refresh_the_cached_rating(db, signup, list_car, book):
+    owner, renter = signup("Olive Owner"), signup("Rita Renter")
+    car_id = list_car(owner)
+    booking_id = book(renter, car_id, "2030-01-01", "2030-01-03")
+    assert car_cache.get(lambda: db, car_id).rating_count is None
+    renter.post(f"/review/{booking_id}", data=dict(rating="4", comment="good"))
+    car = car_cache.get(lambda: db, car_id)
+    assert (car.rating_count, car.rating_sum) == (1, 4)
+
+
+def test_shared_cache_drops_rows_changed_by_another_worker(db, signup, list_car):
+    owner = signup("Olive Owner")
+    car_id = list_car(owner, price="50")
+    worker = CarCache(shared=True, stamp_interval=0)
+    assert worker.get(lambda: db, car_id).price == 50
+    # Another worker's edit: the row and the version stamp change, this worker's entry does not.
+    with db:
+        db.execute("UPDATE cars SET price = 70 WHERE id = ?", (car_id,))
+        CarCache().invalidate(db, car_id)
+    assert worker.get(lambda: db, car_id).price == 70
+
+
+def test_a_row_read_before_an_invalidation_is_not_cached(db, signup, list_car):
+    owner = signup("Olive Owner")
+    car_id = list_car(owner)
+    cache = CarCache()
+
+    def connect_while_writing():
+        # The car changes between the cache miss and the SELECT returning.
+        cache.discard(car_id)
+        return db
+
+    cache.get(connect_while_writing, car_id)
+    assert cache.stats()["size"] == 0
+    cache.get(lambda: db, car_id)
+    assert cache.stats()["size"] == 1
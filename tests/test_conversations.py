@@ -0,0 +1,76 @@
+import pytest
+
+from python_scripts import metrics
+from python_scripts.conversations import send_message
+from python_scripts.migrations import run_migrations
+from python_scripts.unread_counters import read_counters
+
+CONVERSATIONS = {
+    "conversations": "SELECT user_low, user_high, last_message_id, last_sender_id, last_message, "
+                     "last_timestamp, unread_low, unread_high FROM conversations",
+}
+
+
+@pytest.mark.parametrize("fixture", ["marketplace", "pruned_marketplace"])
+def test_rebuild_conversations_matches_the_triggers(request, rebuild_matches, fixture):
+    request.getfixturevalue(fixture)
+    rebuild_matches("rebuild-counters", CONVERSATIONS)
+
+
+def test_conversations_follow_reads(db, marketplace):
+    owner, renter, other, civic, focus, jeep = marketplace
+    low, high = sorted((owner.user_id, renter.user_id))
+    row = db.execute("SELECT * FROM conversations WHERE user_low = ? AND user_high = ?", (low, high)).fetchone()
+    assert row["last_message"] == "yes" and row["last_sender_id"] == owner.user_id
+    assert (row["unread_low"], row["unread_high"]) == ((0, 1) if renter.user_id == high else (1, 0))
+
+
+def test_inbox_reads_each_side_from_its_index(db, marketplace, monkeypatch):
+    owner, renter, other, civic, focus, jeep = marketplace
+    queries = []
+    record = metrics._record_query
+
+    def capture(sql, parameters, elapsed):
+        if "FROM conversations" in sql:
+            queries.append((sql, parameters))
+        record(sql, parameters, elapsed)
+
+    monkeypatch.setattr(metrics, "_record_query", capture)
+    first = owner.get("/inbox", query_string=dict(format="json", limit=1)).json
+    second = owner.get("/inbox", query_string=dict(format="json", limit=1, cursor=first["next_cursor"])).json
+    monkeypatch.undo()
+    assert {item["other_id"] for item in first["items"] + second["items"]} == {renter.user_id, other.user_id}
+
+    assert len(queries) == 2
+    for sql, parameters in queries:
+        plan = [row[3] for row in db.execute("EXPLAIN QUERY PLAN " + sql, parameters)]
+        # Each side is an index search on the user id (and the cursor); neither scans the table.
+        sides = sorted(line for line in plan if "conversations" in line)
+        assert [line.split(" (")[0] for line in sides] == [
+            "SEARCH conversations USING INDEX idx_conversations_high",
+            "SEARCH conversations USING INDEX idx_conversations_low",
+        ]
+
+
+def test_self_messages_are_refused(db, signup):
+    alice = signup("Alice Adams")
+    alice.post(f"/send_message/{alice.user_id}", data=dict(message="note to self"))
+    assert "You cannot send a message to yourself." in alice.flashes()
+    alice.post(f"/send_reply/{alice.user_id}", data=dict(message="note to self"))
+    assert "You cannot send a message to yourself." in alice.flashes()
+    assert db.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 0
+    assert db.execute("SELECT COUNT(*) FROM conversations").fetchone()[0] == 0
+
+
+def test_existing_self_messages_leave_the_unread_counts(db, signup):
+    alice, bob = signup("Alice Adams"), signup("Bob Brown")
+    send_message(db, alice.user_id, alice.user_id, "written before the routes refused it")
+    send_message(db, bob.user_id, alice.user_id, "hi")
+    assert read_counters(db, alice.user_id)[1] == 2
+    db.execute("PRAGMA user_version = 17")
+    db.commit()
+
+    run_migrations(db)
+    assert read_counters(db, alice.user_id)[1] == 1
+    unread = db.execute("SELECT unread_low + unread_high FROM conversations WHERE user_low = user_high").fetchone()[0]
+    assert unread == 0
@@ -0,0 +1,110 @@
+import random
+
+import pytest
+
+from python_scripts.geo import GeoArea, GeoGrid, _cell_reach_km, haversine_km
+
+DETROIT = (42.3314, -83.0458)
+# Either side of the antimeridian, for the box splitting.
+SUVA = (-18.1248, 178.4501)
+
+
+@pytest.fixture
+def placed_cars(db, signup):
+    owner = signup("Olive Owner")
+    rng = random.Random(22)
+    placed = {}
+    for i in range(60):
+        lat, lng = rng.choice((DETROIT, SUVA))
+        point = (lat + rng.uniform(-0.6, 0.6), (lng + rng.uniform(-3, 3) + 180) % 360 - 180) if i % 10 else (None, None)
+        cursor = db.execute('''
+            INSERT INTO cars (owner_id, make, model, year, mileage, color, price, location, is_available, latitude, longitude)
+            VALUES (?, 'Honda', 'Civic', 2020, 1000, 'Red', 40, 'Somewhere', ?, ?, ?)
+        ''', (owner.user_id, int(i % 7 != 0), *point))
+        if i % 7 and point[0] is not None:
+            placed[cursor.lastrowid] = point
+    db.commit()
+    return owner, placed
+
+
+def pages(actor, **args):
+    seen = []
+    cursor = None
+    while True:
+        query = dict(args, format="json", limit=4)
+        if cursor:
+            query["cursor"] = cursor
+        page = actor.get("/search", query_string=query).json
+        seen.extend((car["id"], car.get("distance_km")) for car in page["items"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            return seen
+
+
+@pytest.mark.parametrize("location", ("", "%"))
+@pytest.mark.parametrize("center, radius_km", [(DETROIT, 25), (DETROIT, 60), (SUVA, 150)])
+def test_radius_pages_come_nearest_first(placed_cars, location, center, radius_km):
+    owner, placed = placed_cars
+    distances = {car_id: haversine_km(*center, *point) for car_id, point in placed.items()}
+    expected = sorted((distance, car_id) for car_id, distance in distances.items() if distance <= radius_km)
+    assert expected
+    # '%' takes the SQL path, which must page the same way as the index.
+    seen = pages(owner, location=location, lat=center[0], lng=center[1], radius_km=radius_km)
+    assert [car_id for car_id, _ in seen] == [car_id for _, car_id in expected]
+    assert all(distance_km == pytest.approx(distances[car_id], abs=1e-3) for car_id, distance_km in seen)
+
+
+@pytest.mark.parametrize("location", ("", "%"))
+@pytest.mark.parametrize("bbox", ["42.0,-83.5,42.6,-82.8", "-18.5,178.0,-17.8,-178.5"])
+def test_bbox_pages_stay_in_id_order(placed_cars, location, bbox):
+    owner, placed = placed_cars
+    min_lat, min_lng, max_lat, max_lng = map(float, bbox.split(","))
+    crosses = min_lng > max_lng
+
+    def inside(lat, lng):
+        in_lng = (lng >= min_lng or lng <= max_lng) if crosses else min_lng <= lng <= max_lng
+        return min_lat <= lat <= max_lat and in_lng
+
+    expected = sorted(car_id for car_id, point in placed.items() if inside(*point))
+    assert expected
+    assert pages(owner, location=location, bbox=bbox) == [(car_id, None) for car_id in expected]
+
+
+@pytest.mark.parametrize("args, error", [
+    (dict(radius_km="10"), "A radius needs a latitude and longitude."),
+    (dict(lat="42", lng="-83", radius_km="900"), "Radius must be between 0 and 500 km."),
+    (dict(lat="95", lng="-83"), "Latitude must be within ±90 and longitude within ±180."),
+    (dict(bbox="1,2,3"), "bbox must be min_lat,min_lng,max_lat,max_lng."),
+    (dict(sort="distance"), "Sorting by distance needs a latitude and longitude."),
+])
+def test_bad_areas_are_reported(signup, args, error):
+    alice = signup("Alice Adams")
+    assert alice.get("/search", query_string=dict(args, format="json")).json["items"] == []
+    assert f"Search error: {error}" in alice.flashes()
+
+
+def test_grid_matches_a_brute_force_scan():
+    rng = random.Random(5)
+    grid = GeoGrid()
+    points = {}
+    for doc_id in range(400):
+        lat, lng = rng.choice((DETROIT, SUVA, (71.0, 25.0)))
+        points[doc_id] = (lat + rng.uniform(-2, 2), (lng + rng.uniform(-4, 4) + 180) % 360 - 180)
+        grid.add(doc_id, *points[doc_id])
+    for doc_id in range(0, 400, 3):
+        grid.remove(doc_id)
+        del points[doc_id]
+
+    for _ in range(30):
+        lat, lng = rng.choice((DETROIT, SUVA, (71.0, 25.0)))
+        area = GeoArea((lat + rng.uniform(-1, 1), lng), rng.choice((5, 40, 200)))
+        expected = {
+            doc_id for doc_id, point in points.items() if haversine_km(*area.center, *point) <= area.radius_km
+        }
+        assert set(grid.query(area)) == expected
+        # The cell bounds bracket every distance the nearest-first walk relies on.
+        for bound, cell in grid.cells_by_distance(area):
+            for doc_id in grid.cells[cell]:
+                distance = haversine_km(*area.center, *points[doc_id])
+                assert bound <= distance + 1e-9
+                assert distance <= _cell_reach_km(cell, *area.center)
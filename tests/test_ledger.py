@@ -0,0 +1,27 @@
+import pytest
+
+from python_scripts.payment_proxy import to_cents
+
+BALANCES = {"users": "SELECT id, balance_cents, balance FROM users"}
+
+
+def test_ledger_is_integer_cents_and_sums_to_balances(db, marketplace):
+    owner, renter, other, civic, focus, jeep = marketplace
+    assert db.execute("SELECT COUNT(*) FROM ledger WHERE typeof(amount_cents) != 'integer'").fetchone()[0] == 0
+    # Every payment moves money between two users; only deposits create it.
+    deposits = db.execute("SELECT SUM(amount_cents) FROM ledger WHERE entry_type = 'deposit'").fetchone()[0]
+    assert db.execute("SELECT SUM(amount_cents) FROM ledger").fetchone()[0] == deposits
+    for user_id, balance_cents, balance in db.execute("SELECT id, balance_cents, balance FROM users"):
+        total = db.execute("SELECT COALESCE(SUM(amount_cents), 0) FROM ledger WHERE user_id = ?", (user_id,)).fetchone()[0]
+        assert balance_cents == total
+        assert to_cents(balance) == total
+    # 3 days of the Focus at 30.15 a day, without floating-point drift.
+    assert db.execute(
+        "SELECT amount_cents FROM ledger WHERE user_id = ? AND entry_type != 'deposit' ORDER BY id", (renter.user_id,)
+    ).fetchall()[-1][0] == -9045
+
+
+@pytest.mark.parametrize("fixture", ["marketplace", "pruned_marketplace"])
+def test_rebuild_balances_matches_the_ledger(request, rebuild_matches, fixture):
+    request.getfixturevalue(fixture)
+    rebuild_matches("rebuild-balances", BALANCES)
@@ -0,0 +1,51 @@
+from python_scripts.migrations import run_migrations
+
+
+def test_booked_car_can_be_deleted(db, signup, list_car, book):
+    owner, renter = signup("Olive Owner"), signup("Rita Renter")
+    car_id = list_car(owner, price="30.15")
+    booking_id = book(renter, car_id, "2030-01-01", "2030-01-03")
+    assert db.execute("SELECT status FROM bookings WHERE id = ?", (booking_id,)).fetchone()[0] == "confirmed"
+    renter.post(f"/review/{booking_id}", data=dict(rating="5", comment="great"))
+    owner.post(f"/review_renter/{booking_id}", data=dict(rating="4", comment="fine"))
+    balances = db.execute("SELECT id, balance_cents FROM users ORDER BY id").fetchall()
+
+    owner.post(f"/delete_car/{car_id}")
+    assert "Car deleted successfully." in owner.flashes()
+    assert db.execute("SELECT COUNT(*) FROM cars").fetchone()[0] == 0
+    assert db.execute("SELECT COUNT(*) FROM bookings").fetchone()[0] == 0
+    # The money trail and the reviews outlive the booking.
+    assert db.execute("SELECT COUNT(*), COUNT(booking_id) FROM payments").fetchone()[:] == (1, 0)
+    assert db.execute("SELECT COUNT(*), COUNT(booking_id) FROM reviews").fetchone()[:] == (2, 0)
+    assert db.execute(
+        "SELECT COUNT(*), COUNT(booking_id) FROM ledger WHERE entry_type != 'deposit'"
+    ).fetchone()[:] == (2, 0)
+    assert db.execute("SELECT id, balance_cents FROM users ORDER BY id").fetchall() == balances
+    assert db.execute(
+        "SELECT rating_count FROM user_rating_stats WHERE user_id = ?", (owner.user_id,)
+    ).fetchone()[0] == 1
+    assert db.execute("SELECT COUNT(*) FROM car_rating_stats").fetchone()[0] == 0
+    assert db.execute("SELECT COUNT(*) FROM car_daily_stats").fetchone()[0] == 0
+    assert db.execute("SELECT SUM(bookings) FROM owner_daily_stats").fetchone()[0] == 0
+    assert b"Civic" not in renter.get("/search").data
+
+
+def test_rebuilding_tables_keeps_rows_indexes_and_ids(db, signup, list_car, book):
+    owner, renter = signup("Olive Owner"), signup("Rita Renter")
+    booking_id = book(renter, list_car(owner), "2030-01-01", "2030-01-03")
+    renter.post(f"/review/{booking_id}", data=dict(rating="5", comment="great"))
+    tables = ("payments", "reviews", "ledger")
+    rows = {table: db.execute(f"SELECT * FROM {table} ORDER BY id").fetchall() for table in tables}
+    schema = "SELECT type, name FROM sqlite_master WHERE tbl_name IN ('payments', 'reviews', 'ledger') ORDER BY name"
+    objects = db.execute(schema).fetchall()
+    db.execute("DELETE FROM ledger WHERE id = (SELECT MAX(id) FROM ledger)")
+    db.execute("PRAGMA user_version = 14")
+    db.commit()
+
+    run_migrations(db)
+    assert db.execute(schema).fetchall() == objects
+    for table in ("payments", "reviews"):
+        assert [tuple(row) for row in db.execute(f"SELECT * FROM {table} ORDER BY id")] == [tuple(row) for row in rows[table]]
+    # AUTOINCREMENT never hands out a deleted id again.
+    renter.post("/add_funds", data=dict(amount="5"))
+    assert db.execute("SELECT MAX(id) FROM ledger").fetchone()[0] == rows["ledger"][-1]["id"] + 1
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from python_scripts.event_hub import event_hub
+
+
+@pytest.fixture
+def short_streams(app, monkeypatch):
+    # A stream sends what is pending and ends instead of waiting for more.
+    monkeypatch.setitem(app.config, "SSE_MAX_SECONDS", 0)
+
+
+def events(response):
+    body = response.get_data(as_text=True)
+    parsed = []
+    for block in body.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line and not line.startswith(":"))
+        if "event" in fields:
+            parsed.append((fields["id"], fields["event"], json.loads(fields["data"])))
+    return parsed
+
+
+def test_stream_sends_new_notifications_and_thread_messages(db, signup, short_streams):
+    alice, bob = signup("Alice Adams"), signup("Bob Brown")
+    bob.post(f"/send_message/{alice.user_id}", data=dict(message="hi"))
+    db.execute("INSERT INTO notifications (user_id, message) VALUES (?, 'welcome')", (alice.user_id,))
+    db.commit()
+    response = alice.get("/events", query_string=dict(thread=bob.user_id, since_notification=0, since_message=0))
+    assert response.mimetype == "text/event-stream"
+    sent = events(response)
+    assert [(kind, row.get("message") or row.get("content")) for _, kind, row in sent] == [
+        ("notification", "New message from bob.brown@example.com."), ("notification", "welcome"), ("message", "hi"),
+    ]
+    # Reconnecting with the last id resends nothing.
+    again = alice.get("/events", query_string=dict(thread=bob.user_id), headers={"Last-Event-ID": sent[-1][0]})
+    assert events(again) == []
+    assert event_hub.stats()["subscribers"] == 0
+
+
+def test_poll_returns_the_same_deltas(db, signup):
+    alice, bob = signup("Alice Adams"), signup("Bob Brown")
+    start = alice.get("/events/poll", query_string=dict(thread=bob.user_id)).json
+    bob.post(f"/send_message/{alice.user_id}", data=dict(message="hi"))
+    page = alice.get("/events/poll", query_string=dict(
+        thread=bob.user_id, since_notification=start["since_notification"], since_message=start["since_message"],
+    )).json
+    assert [message["content"] for message in page["messages"]] == ["hi"]
+    assert page["since_message"] == page["messages"][-1]["id"] and not page["more"]
+
+
+def test_streams_over_the_limit_are_sent_to_polling(app, signup, monkeypatch):
+    alice = signup("Alice Adams")
+    monkeypatch.setattr(event_hub, "max_subscribers", 1)
+    held = event_hub.subscribe(("user", 0))
+    try:
+        response = alice.get("/events", query_string=dict(thread=7, since_message=3))
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "30"
+        assert response.json["poll"] == "/events/poll?thread=7&since_message=3"
+    finally:
+        held.close()
+    assert alice.get("/events/poll").status_code == 200
+
+
+def test_live_updates_need_a_login(app):
+    client = app.test_client()
+    assert client.get("/events").status_code == 401
+    assert client.get("/events/poll").status_code == 401
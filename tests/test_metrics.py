@@ -0,0 +1,57 @@
+import logging
+import re
+
+import pytest
+
+from python_scripts import metrics
+
+
+def sample(client, name, **labels):
+    text = client.get("/metrics").data.decode()
+    wanted = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    match = re.search(rf"^{name}\{{{wanted}\}} (\S+)$", text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_requests_are_counted_and_timed(app):
+    client = app.test_client()
+    labels = dict(route="search", method="GET", status="200")
+    before = sample(client, "driveshare_requests_total", **labels)
+    queries = sample(client, "driveshare_request_queries_count", route="search", method="GET")
+    response = client.get("/search")
+    client.get("/search", query_string=dict(location="detroit"))
+    assert sample(client, "driveshare_requests_total", **labels) == before + 2
+    assert sample(client, "driveshare_request_queries_count", route="search", method="GET") == queries + 2
+    assert re.fullmatch(r"db;dur=[\d.]+, render;dur=[\d.]+, total;dur=[\d.]+", response.headers["Server-Timing"])
+
+
+@pytest.fixture
+def log_every_query(monkeypatch, caplog):
+    monkeypatch.setattr(metrics.registry, "slow_query_seconds", 0)
+    caplog.set_level(logging.WARNING, logger="driveshare.slow_query")
+    return caplog
+
+
+def test_slow_query_log_leaves_out_parameter_values(app, log_every_query):
+    client = app.test_client()
+    client.post("/login", data=dict(email="secret.person@example.com", password="hunter2"))
+    logged = "\n".join(record.getMessage() for record in log_every_query.records)
+    assert "FROM users WHERE email = ? params=1 (str)" in logged
+    assert "secret.person" not in logged and "hunter2" not in logged
+
+
+def test_metrics_are_refused_to_other_addresses(app):
+    outside = app.test_client()
+    outside.environ_base["REMOTE_ADDR"] = "203.0.113.9"
+    assert outside.get("/metrics").status_code == 403
+    assert app.test_client().get("/metrics").status_code == 200
+
+
+def test_metrics_token_works_from_anywhere(app, monkeypatch):
+    monkeypatch.setitem(app.config, "METRICS_TOKEN", "s3cret")
+    outside = app.test_client()
+    outside.environ_base["REMOTE_ADDR"] = "203.0.113.9"
+    assert outside.get("/metrics", headers={"Authorization": "Bearer s3cret"}).status_code == 200
+    assert outside.get("/metrics", headers={"Authorization": "Bearer guess"}).status_code == 403
+    monkeypatch.setitem(app.config, "METRICS_ALLOWED_ADDRS", ("203.0.113.9",))
+    assert outside.get("/metrics").status_code == 200
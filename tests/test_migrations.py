@@ -0,0 +1,54 @@
+import pytest
+
+from python_scripts import migrations
+from python_scripts.migrations import Rebuild, current_version, run_migrations
+
+
+def test_rebuilds_run_once_after_the_last_migration(db, monkeypatch):
+    seen = []
+
+    def rebuild(conn):
+        # The rebuild sees the schema and version left by the last migration.
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(migration_probe)")]
+        seen.append((current_version(conn), columns))
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", [
+        (101, "probe table", ["CREATE TABLE migration_probe (id INTEGER PRIMARY KEY)", Rebuild(rebuild)]),
+        (102, "probe column", ["ALTER TABLE migration_probe ADD COLUMN note TEXT", Rebuild(rebuild)]),
+    ])
+    db.execute("PRAGMA user_version = 100")
+    db.commit()
+    assert run_migrations(db) == [(101, "probe table"), (102, "probe column")]
+    assert seen == [(102, ["id", "note"])]
+    assert run_migrations(db) == []
+
+
+def test_a_failing_migration_applies_nothing(db, monkeypatch):
+    monkeypatch.setattr(migrations, "MIGRATIONS", [
+        (101, "probe table", ["CREATE TABLE migration_probe (id INTEGER PRIMARY KEY)"]),
+        (102, "broken", ["ALTER TABLE no_such_table ADD COLUMN note TEXT"]),
+    ])
+    db.execute("PRAGMA user_version = 100")
+    db.commit()
+    with pytest.raises(Exception):
+        run_migrations(db)
+    assert current_version(db) == 100
+    assert db.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'migration_probe'").fetchone()[0] == 0
+
+
+def test_blocked_days_become_merged_blocks(db, signup, list_car, monkeypatch):
+    owner = signup("Olive Owner")
+    car_id = list_car(owner)
+    days = ["2030-01-01", "2030-01-02", "2030-01-03", "2030-01-05", "2030-01-31", "2030-02-01", "someday"]
+    db.executemany("INSERT INTO availability (car_id, date, is_available) VALUES (?, ?, 0)", [(car_id, day) for day in days])
+    db.execute("INSERT INTO availability (car_id, date, is_available) VALUES (?, '2030-01-04', 1)", (car_id,))
+    db.execute("PRAGMA user_version = 6")
+    db.commit()
+    monkeypatch.setattr(migrations, "MIGRATIONS", [m for m in migrations.MIGRATIONS if m[0] == 7])
+
+    run_migrations(db)
+    blocks = db.execute("SELECT start_date, end_date FROM availability_blocks ORDER BY start_date")
+    assert [tuple(row) for row in blocks] == [
+        ("2030-01-01", "2030-01-03"), ("2030-01-05", "2030-01-05"), ("2030-01-31", "2030-02-01"),
+    ]
+    assert [day for (day,) in db.execute("SELECT date FROM availability ORDER BY date")] == ["2030-01-04", "someday"]
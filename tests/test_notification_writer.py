@@ -0,0 +1,50 @@
+from python_scripts.notification_queue import NotificationWriter, notification_writer
+
+
+def notes(db, user_id):
+    return [message for (message,) in db.execute(
+        "SELECT message FROM notifications WHERE user_id = ? ORDER BY id", (user_id,)
+    )]
+
+
+def test_booking_notifications_are_written_in_the_background(app, db, signup, list_car, book):
+    owner, renter = signup("Olive Owner"), signup("Rita Renter")
+    car_id = list_car(owner)
+    app.config["NOTIFICATIONS_ASYNC"] = True
+    written = notification_writer.stats()["written"]
+    book(renter, car_id, "2030-01-01", "2030-01-03")
+    notification_writer.flush()
+    assert notes(db, renter.user_id) == ["Your booking has been confirmed!"]
+    assert notes(db, owner.user_id) == ["Someone booked your car!"]
+    assert notification_writer.stats()["written"] == written + 2
+
+
+def test_a_burst_is_written_as_one_batch(db, signup):
+    alice = signup("Alice Adams")
+    writer = NotificationWriter(batch_size=50, flush_interval=1)
+    try:
+        for i in range(30):
+            writer.enqueue(alice.user_id, f"note {i}")
+        writer.flush()
+        assert notes(db, alice.user_id) == [f"note {i}" for i in range(30)]
+        assert (writer.batches, writer.written) == (1, 30)
+    finally:
+        writer.stop()
+
+
+def test_a_bad_row_does_not_drop_the_batch(db, signup):
+    alice = signup("Alice Adams")
+    writer = NotificationWriter()
+    writer.write([(alice.user_id, "kept", "2030-01-01 00:00:00"), (alice.user_id + 1000, "lost", "2030-01-01 00:00:00")])
+    assert notes(db, alice.user_id) == ["kept"]
+    assert (writer.written, writer.dropped) == (1, 1)
+
+
+def test_stop_drains_the_queue(db, signup):
+    alice = signup("Alice Adams")
+    writer = NotificationWriter(batch_size=3, flush_interval=1)
+    for i in range(7):
+        writer.enqueue(alice.user_id, f"note {i}")
+    writer.stop()
+    assert len(notes(db, alice.user_id)) == 7
+    assert writer.stats()["queued"] == 0
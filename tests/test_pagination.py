@@ -0,0 +1,102 @@
+import random
+
+import pytest
+
+from python_scripts.conversations import send_message
+
+
+def walk(client, path, box=None, cursor_param="cursor", **args):
+    seen = []
+    cursor = None
+    while True:
+        query = dict(args, format="json", limit=3)
+        if box:
+            query["box"] = box
+        if cursor:
+            query[cursor_param] = cursor
+        page = client.get(path, query_string=query).json
+        assert len(page["items"]) <= 3
+        seen.extend(page["items"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            return seen
+
+
+def add_users(db, count, prefix):
+    return [
+        db.execute(
+            "INSERT INTO users (email, password, security_q1, security_q2, security_q3, full_name) "
+            "VALUES (?, 'x', 'a', 'b', 'c', ?)",
+            (f"{prefix}{i}@example.com", f"{prefix.title()} {i}"),
+        ).lastrowid
+        for i in range(count)
+    ]
+
+
+def newest_first(rows):
+    return [row[1] for row in sorted(rows, key=lambda row: (row[0], row[1]), reverse=True)]
+
+
+# Few distinct timestamps, so most of the order comes from the id tie-break.
+STAMPS = ["2030-01-01 10:00:00", "2030-01-02 10:00:00", "2030-01-03 10:00:00"]
+
+
+def test_notifications_pages(db, signup):
+    alice = signup("Alice Adams")
+    rng = random.Random(1)
+    for i in range(11):
+        db.execute("INSERT INTO notifications (user_id, message, timestamp) VALUES (?, ?, ?)",
+                   (alice.user_id, f"note {i}", rng.choice(STAMPS)))
+    db.commit()
+    rows = db.execute("SELECT timestamp, id FROM notifications WHERE user_id = ?", (alice.user_id,)).fetchall()
+    assert [note["id"] for note in walk(alice, "/notifications")] == newest_first(rows)
+
+
+def test_inbox_pages(db, signup):
+    # Correspondents with lower and higher ids, so Alice is on both sides of a pair.
+    before = add_users(db, 4, "early")
+    db.commit()
+    alice = signup("Alice Adams")
+    after = add_users(db, 4, "late")
+    db.commit()
+    for other in before + after:
+        send_message(db, other, alice.user_id, "hi")
+    rng = random.Random(2)
+    for (conversation_id,) in db.execute("SELECT id FROM conversations").fetchall():
+        db.execute("UPDATE conversations SET last_timestamp = ? WHERE id = ?", (rng.choice(STAMPS), conversation_id))
+    db.commit()
+    rows = db.execute("SELECT last_timestamp, id FROM conversations").fetchall()
+    items = walk(alice, "/inbox")
+    assert [item["id"] for item in items] == newest_first(rows)
+    assert sorted(item["other_id"] for item in items) == before + after
+    assert all(item["unread"] == 1 for item in items)
+
+
+def test_reviews_received_pages(db, signup):
+    alice = signup("Alice Adams")
+    reviewers = add_users(db, 7, "reviewer")
+    rng = random.Random(3)
+    for reviewer in reviewers:
+        db.execute("INSERT INTO reviews (reviewer_id, reviewee_id, rating, comment, timestamp) VALUES (?, ?, 5, '', ?)",
+                   (reviewer, alice.user_id, rng.choice(STAMPS)))
+    db.commit()
+    rows = db.execute("SELECT timestamp, id FROM reviews").fetchall()
+    assert [review["id"] for review in walk(alice, "/reviews_received")] == newest_first(rows)
+
+
+@pytest.mark.parametrize("box, cursor_param", [("rented", "rented_cursor"), ("listings", "listings_cursor")])
+def test_rental_history_pages(db, signup, list_car, box, cursor_param):
+    alice, bob = signup("Alice Adams"), signup("Bob Brown")
+    rng = random.Random(4)
+    cars = [(list_car(owner), renter) for owner, renter in ((alice, bob), (bob, alice))]
+    for car_id, renter in cars:
+        for _ in range(7):
+            day = f"2030-01-0{rng.randint(1, 3)}"
+            db.execute("INSERT INTO bookings (car_id, renter_id, start_date, end_date) VALUES (?, ?, ?, ?)",
+                       (car_id, renter.user_id, day, day))
+    db.commit()
+    mine = "b.renter_id = ?" if box == "rented" else "c.owner_id = ?"
+    rows = db.execute(f"SELECT b.start_date, b.id FROM bookings b JOIN cars c ON c.id = b.car_id WHERE {mine}",
+                      (alice.user_id,)).fetchall()
+    items = walk(alice, "/rental_history", box=box, cursor_param=cursor_param)
+    assert [item["booking_id"] for item in items] == newest_first(rows)
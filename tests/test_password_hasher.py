@@ -0,0 +1,62 @@
+import threading
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from python_scripts.password_hasher import HasherBusy, PasswordHasher, password_hasher
+
+
+def test_a_full_pool_refuses_at_once():
+    hasher = PasswordHasher(workers=1, max_pending=1)
+    assert hasher._slots.acquire(blocking=False)
+    try:
+        hasher.hash("pw")
+    except HasherBusy:
+        pass
+    else:
+        raise AssertionError("expected HasherBusy")
+    assert hasher.stats()["rejected"] == 1
+
+
+def test_login_and_register_answer_503_when_busy(app, signup, monkeypatch):
+    alice = signup("Alice Adams")
+
+    def busy(*args):
+        raise HasherBusy("Too many password checks in progress.")
+
+    monkeypatch.setattr(password_hasher, "_run", busy)
+    client = app.test_client()
+    login = client.post("/login", data=dict(email=alice.email, password="pw"))
+    register = client.post("/register", data=dict(
+        email="bob@example.com", password="pw", full_name="Bob", security_q1="a", security_q2="b", security_q3="c",
+    ))
+    for response in (login, register):
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "2"
+        assert b"Please try again in a moment." in response.data
+
+
+def test_login_upgrades_an_outdated_hash(app, db, signup):
+    alice = signup("Alice Adams")
+    db.execute("UPDATE users SET password = ? WHERE id = ?", (generate_password_hash("pw", "pbkdf2:sha256:1000"), alice.user_id))
+    db.commit()
+    rehashed = password_hasher.stats()["rehashed"]
+    response = app.test_client().post("/login", data=dict(email=alice.email, password="pw"))
+    assert "dashboard" in response.location
+    stored = db.execute("SELECT password FROM users WHERE id = ?", (alice.user_id,)).fetchone()[0]
+    assert not password_hasher.needs_rehash(stored) and check_password_hash(stored, "pw")
+    assert password_hasher.stats()["rehashed"] == rehashed + 1
+
+
+def test_counters_are_exact_under_concurrency():
+    hasher = PasswordHasher(workers=0)
+
+    def rehash_many():
+        for _ in range(2000):
+            hasher.record_rehash()
+
+    threads = [threading.Thread(target=rehash_many) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert hasher.stats()["rehashed"] == 16000
@@ -0,0 +1,59 @@
+import pytest
+
+from python_scripts.ratings import STARS, rebuild_ratings, record_review
+
+
+@pytest.fixture
+def booking(signup, list_car, book):
+    owner, renter = signup("Olive Owner"), signup("Rita Renter")
+    car_id = list_car(owner)
+    return owner, renter, car_id, book(renter, car_id, "2030-01-01", "2030-01-03")
+
+
+def histogram(db, table, key, value):
+    row = db.execute(f"SELECT * FROM {table} WHERE {key} = ?", (value,)).fetchone()
+    return row and (row["rating_count"], row["rating_sum"], [row[f"stars_{star}"] for star in STARS])
+
+
+@pytest.mark.parametrize("rating", ["4.5", "0", "6", "", "four"])
+def test_review_routes_reject_ratings_that_are_not_whole_stars(db, booking, rating):
+    owner, renter, car_id, booking_id = booking
+    renter.post(f"/review/{booking_id}", data=dict(rating=rating, comment="hm"))
+    owner.post(f"/review_renter/{booking_id}", data=dict(rating=rating, comment="hm"))
+    assert "Rating must be a whole number from 1 to 5." in renter.flashes()
+    assert db.execute("SELECT COUNT(*) FROM reviews").fetchone()[0] == 0
+
+
+def test_ratings_fill_the_histogram(db, booking):
+    owner, renter, car_id, booking_id = booking
+    renter.post(f"/review/{booking_id}", data=dict(rating=" 4 ", comment="good"))
+    renter.post(f"/review/{booking_id}", data=dict(rating="2", comment="meh"))
+    owner.post(f"/review_renter/{booking_id}", data=dict(rating="5", comment="great"))
+    assert histogram(db, "car_rating_stats", "car_id", car_id) == (2, 6, [0, 1, 0, 1, 0])
+    assert histogram(db, "user_rating_stats", "user_id", owner.user_id) == (2, 6, [0, 1, 0, 1, 0])
+    assert histogram(db, "user_rating_stats", "user_id", renter.user_id) == (1, 5, [0, 0, 0, 0, 1])
+
+
+def test_aggregates_skip_ratings_written_around_the_routes(db, booking):
+    owner, renter, car_id, booking_id = booking
+    renter.post(f"/review/{booking_id}", data=dict(rating="3", comment="ok"))
+    # The CHECK constraint lets 4.5 through; it must not count anywhere.
+    review_id = db.execute('''
+        INSERT INTO reviews (booking_id, reviewer_id, reviewee_id, rating, comment) VALUES (?, ?, ?, 4.5, 'x')
+    ''', (booking_id, renter.user_id, owner.user_id)).lastrowid
+    record_review(db, review_id)
+    db.commit()
+    assert histogram(db, "car_rating_stats", "car_id", car_id) == (1, 3, [0, 0, 1, 0, 0])
+    with db:
+        rebuild_ratings(db)
+    assert histogram(db, "car_rating_stats", "car_id", car_id) == (1, 3, [0, 0, 1, 0, 0])
+    assert histogram(db, "user_rating_stats", "user_id", owner.user_id) == (1, 3, [0, 0, 1, 0, 0])
+
+
+@pytest.mark.parametrize("fixture", ["marketplace", "pruned_marketplace"])
+def test_rebuild_matches_incremental(request, rebuild_matches, fixture):
+    request.getfixturevalue(fixture)
+    rebuild_matches("rebuild-ratings", {
+        "user_rating_stats": "SELECT * FROM user_rating_stats WHERE rating_count",
+        "car_rating_stats": "SELECT * FROM car_rating_stats WHERE rating_count",
+    })
@@ -0,0 +1,45 @@
+import pytest
+
+from python_scripts import rollups
+from python_scripts.rollups import booking_days, rebuild_rollups
+
+ROLLUPS = {
+    "car_daily_stats": "SELECT * FROM car_daily_stats WHERE booked_days OR revenue_cents OR bookings",
+    "owner_daily_stats": "SELECT * FROM owner_daily_stats WHERE booked_days OR revenue_cents OR bookings",
+}
+
+
+@pytest.mark.parametrize("fixture", ["marketplace", "pruned_marketplace"])
+def test_rebuild_matches_incremental(request, rebuild_matches, fixture):
+    request.getfixturevalue(fixture)
+    rebuild_matches("rebuild-rollups", ROLLUPS)
+
+
+def test_leftover_cents_go_to_the_first_days():
+    assert booking_days("2030-01-30", "2030-02-01", 1001) == [
+        ("2030-01-30", 334, 1), ("2030-01-31", 334, 0), ("2030-02-01", 333, 0),
+    ]
+
+
+def test_numpy_and_sql_expansions_agree(db, marketplace, monkeypatch):
+    def expand():
+        rebuild_rollups(db)
+        return {table: sorted(tuple(row) for row in db.execute(sql)) for table, sql in ROLLUPS.items()}
+
+    expanded = expand()
+    monkeypatch.setattr(rollups, "numpy", None)
+    assert expand() == expanded
+
+
+@pytest.mark.parametrize("fixture, rows", [
+    ("marketplace", ["<td>2030-01</td><td>2</td><td>4</td><td>6%</td><td>$180.15</td>",
+                     "<td>2030-02</td><td>0</td><td>2</td><td>4%</td><td>$60.30</td>"]),
+    # The deleted Focus takes its days and revenue out of the owner's months.
+    ("pruned_marketplace", ["<td>2030-01</td><td>1</td><td>3</td><td>10%</td><td>$150.00</td>"]),
+])
+def test_dashboard_shows_monthly_earnings(request, fixture, rows):
+    owner = request.getfixturevalue(fixture)[0]
+    page = "".join(owner.get("/dashboard").get_data(as_text=True).split())
+    for row in rows:
+        assert "".join(row.split()) in page
+    assert page.count("<td>2030-") == len(rows)
@@ -0,0 +1,12 @@
+import pytest
+
+from python_scripts.search_index import CAR_ROWS
+
+
+@pytest.mark.parametrize("location", ("", "detroit"))
+def test_keyset_pages_match_id_order(db, search_cars, search_pages, location):
+    rows = db.execute(CAR_ROWS + " WHERE c.is_available = 1 AND LOWER(c.location) LIKE ?", (f"%{location}%",)).fetchall()
+    expected = sorted(car["id"] for car in rows)
+    # The in-process index and the SQL path ('%' is a LIKE wildcard) page the same way.
+    assert search_pages(search_cars, location=location) == expected
+    assert search_pages(search_cars, location=f"%{location}") == expected
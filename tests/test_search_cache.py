@@ -0,0 +1,46 @@
+from python_scripts.search_cache import search_cache
+
+
+def test_anonymous_search_revalidates_until_a_car_changes(app, signup, list_car):
+    owner = signup("Olive Owner")
+    list_car(owner)
+    client = app.test_client()
+    first = client.get("/search", query_string=dict(location="detroit"))
+    assert first.status_code == 200 and first.headers["ETag"] and first.headers["Last-Modified"]
+
+    etag = client.get("/search", query_string=dict(location="detroit"), headers={"If-None-Match": first.headers["ETag"]})
+    since = client.get("/search", query_string=dict(location="detroit"),
+                       headers={"If-Modified-Since": first.headers["Last-Modified"]})
+    assert (etag.status_code, since.status_code) == (304, 304)
+
+    list_car(owner, make="Ford", model="Focus")
+    again = client.get("/search", query_string=dict(location="detroit"), headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 200
+    assert again.headers["ETag"] != first.headers["ETag"]
+    assert b"Focus" in again.data
+
+
+def test_results_are_served_from_the_cache(app, signup, list_car):
+    owner = signup("Olive Owner")
+    list_car(owner)
+    client = app.test_client()
+    client.get("/search", query_string=dict(location="Detroit", format="json"))
+    hits = search_cache.stats()["hits"]
+    # The key is case-folded, so this is the same entry.
+    assert len(client.get("/search", query_string=dict(location="DETROIT", format="json")).json["items"]) == 1
+    assert search_cache.stats()["hits"] == hits + 1
+
+
+def test_signed_in_search_changes_with_the_navbar_counters(db, signup, list_car):
+    owner = signup("Olive Owner")
+    list_car(owner)
+    first = owner.get("/search")
+    # Nothing but the ETag can tell that the badges changed.
+    assert "Last-Modified" not in first.headers
+    assert owner.get("/search", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+
+    db.execute("INSERT INTO notifications (user_id, message) VALUES (?, 'hello')", (owner.user_id,))
+    db.commit()
+    again = owner.get("/search", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 200
+    assert again.headers["ETag"] != first.headers["ETag"]
@@ -0,0 +1,35 @@
+import pytest
+
+from python_scripts.search_index import SORTS, CAR_ROWS, row_sort_value
+
+
+@pytest.mark.parametrize("sort", SORTS)
+@pytest.mark.parametrize("location", ("", "detroit"))
+def test_sorted_pages_match_a_full_sort(db, search_cars, search_pages, sort, location):
+    rows = db.execute(CAR_ROWS + " WHERE c.is_available = 1 AND LOWER(c.location) LIKE ?", (f"%{location}%",)).fetchall()
+    expected = [car["id"] for car in sorted(rows, key=lambda car: (row_sort_value(sort, car), car["id"]))]
+    # The top-k index path and the SQL ORDER BY path page the same way.
+    assert search_pages(search_cars, location=location, sort=sort) == expected
+    assert search_pages(search_cars, location=f"%{location}", sort=sort) == expected
+
+
+@pytest.mark.parametrize("sort", SORTS)
+def test_sorted_pages_skip_booked_cars(db, search_cars, search_pages, sort):
+    booked = [car_id for (car_id,) in db.execute("SELECT id FROM cars WHERE is_available = 1 ORDER BY id")][::3]
+    db.executemany(
+        "INSERT INTO bookings (car_id, renter_id, start_date, end_date, status) VALUES (?, ?, '2030-01-02', '2030-01-04', 'confirmed')",
+        [(car_id, search_cars.user_id) for car_id in booked],
+    )
+    db.commit()
+    rows = db.execute(CAR_ROWS + " WHERE c.is_available = 1").fetchall()
+    expected = [
+        car["id"] for car in sorted(rows, key=lambda car: (row_sort_value(sort, car), car["id"])) if car["id"] not in booked
+    ]
+    dates = dict(start="2030-01-03", end="2030-01-05", sort=sort)
+    assert search_pages(search_cars, **dates) == expected
+    assert search_pages(search_cars, location="%", **dates) == expected
+
+
+def test_unknown_sorts_are_reported(search_cars):
+    assert search_cars.get("/search", query_string=dict(sort="colour", format="json")).json["items"] == []
+    assert f"Search error: Sort must be one of: distance, {', '.join(SORTS)}." in search_cars.flashes()
@@ -0,0 +1,56 @@
+import time
+
+from python_scripts.session_store import SessionStore
+
+
+def test_logout_ends_the_session(db, signup):
+    alice = signup("Alice Adams")
+    assert db.execute("SELECT COUNT(*) FROM sessions WHERE user_id = ?", (alice.user_id,)).fetchone()[0] == 1
+    assert alice.get("/dashboard").status_code == 200
+
+    alice.get("/logout")
+    assert db.execute("SELECT COUNT(*) FROM sessions WHERE user_id = ?", (alice.user_id,)).fetchone()[0] == 0
+    assert "login" in alice.get("/dashboard").location
+
+
+def test_any_worker_resolves_a_session_and_sees_its_logout(db, signup):
+    alice = signup("Alice Adams")
+    worker, other_worker = SessionStore(), SessionStore(ttl=0)
+    sid = worker.create(db, alice.user_id, alice.email, "user")
+    reads = []
+
+    def connect():
+        reads.append(1)
+        return db
+
+    record = other_worker.get(sid, connect)
+    assert (record.user_id, record.email) == (alice.user_id, alice.email)
+    # The creating worker answers from its cache.
+    assert worker.get(sid, connect).user_id == alice.user_id
+    assert len(reads) == 1
+
+    worker.delete(db, sid)
+    assert worker.get(sid, connect) is None
+    assert other_worker.get(sid, connect) is None
+
+
+def test_expired_sessions_are_refused_and_purged(db, signup):
+    alice = signup("Alice Adams")
+    store = SessionStore(lifetime=-1)
+    sid = store.create(db, alice.user_id, alice.email, "user")
+    assert store.get(sid, lambda: db) is None
+    # The next login clears expired rows.
+    SessionStore().create(db, alice.user_id, alice.email, "user")
+    assert db.execute("SELECT COUNT(*) FROM sessions WHERE sid = ?", (sid,)).fetchone()[0] == 0
+    assert db.execute("SELECT COUNT(*) FROM sessions WHERE expires_at < ?", (int(time.time()),)).fetchone()[0] == 0
+
+
+def test_cache_keeps_the_most_recent_sessions(db, signup):
+    alice = signup("Alice Adams")
+    store = SessionStore(capacity=2)
+    sids = [store.create(db, alice.user_id, alice.email, "user") for _ in range(3)]
+    assert store.stats()["size"] == 2
+    store.get(sids[0], lambda: db)
+    assert store.stats()["misses"] == 1
+    store.get(sids[2], lambda: db)
+    assert store.stats()["hits"] == 1
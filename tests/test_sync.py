@@ -0,0 +1,111 @@
+# Writes made through another connection stand in for another worker: each
+# worker's in-process structures must see them on its next request.
+import sqlite3
+from datetime import date, timedelta
+
+import pytest
+
+from python_scripts.search_changes import MAX_REPLAY, ChangeCursor
+
+
+@pytest.fixture
+def other_worker(app):
+    conn = sqlite3.connect(app.config["DATABASE"])
+    conn.execute("PRAGMA foreign_keys = ON")
+    yield conn
+    conn.close()
+
+
+def found(actor, **args):
+    return [car["model"] for car in actor.get("/search", query_string=dict(args, format="json")).json["items"]]
+
+
+def test_search_sees_cars_written_by_another_worker(signup, list_car, other_worker):
+    owner = signup("Olive Owner")
+    list_car(owner, model="Civic")
+    assert found(owner, location="detroit") == ["Civic"]
+
+    with other_worker:
+        other_worker.execute('''
+            INSERT INTO cars (owner_id, make, model, year, mileage, price, location)
+            VALUES (?, 'Ford', 'Focus', 2019, 10, 20, 'Detroit, MI')
+        ''', (owner.user_id,))
+        other_worker.execute("UPDATE cars SET location = 'Flint, MI' WHERE model = 'Civic'")
+    assert found(owner, location="detroit") == ["Focus"]
+    assert found(owner, location="flint") == ["Civic"]
+
+    with other_worker:
+        other_worker.execute("INSERT INTO car_rating_stats (car_id, rating_count, rating_sum) SELECT id, 1, 5 FROM cars WHERE model = 'Civic'")
+    assert found(owner, sort="rating") == ["Civic", "Focus"]
+
+    with other_worker:
+        other_worker.execute("DELETE FROM cars WHERE model = 'Civic'")
+    assert found(owner) == ["Focus"]
+
+
+def test_search_reloads_after_a_long_backlog_or_bulk_load(db, signup, list_car, other_worker):
+    owner = signup("Olive Owner")
+    list_car(owner, model="Civic")
+    assert found(owner) == ["Civic"]
+    with other_worker:
+        other_worker.executemany('''
+            INSERT INTO cars (owner_id, make, model, year, mileage, price, location)
+            VALUES (?, 'Kia', ?, 2020, 1, 10, 'Flint')
+        ''', [(owner.user_id, f"Soul{i}") for i in range(MAX_REPLAY + 1)])
+    assert found(owner, location="flint", sort="newest", limit=2) == [f"Soul{MAX_REPLAY}", f"Soul{MAX_REPLAY - 1}"]
+
+    # A bulk load logs NULL: reload everything, including rows written without triggers.
+    with other_worker:
+        other_worker.execute("DROP TRIGGER trg_cars_insert_search_change")
+        other_worker.execute('''
+            INSERT INTO cars (owner_id, make, model, year, mileage, price, location)
+            VALUES (?, 'Jeep', 'Wrangler', 2020, 1, 10, 'Detroit')
+        ''', (owner.user_id,))
+        other_worker.execute("UPDATE cache_versions SET version = version + 1 WHERE name = 'search'")
+        other_worker.execute("INSERT INTO search_changes (car_id) VALUES (NULL)")
+    assert found(owner, location="detroit") == ["Civic", "Wrangler"]
+
+
+def test_change_cursor(db, signup, list_car):
+    owner = signup("Olive Owner")
+    cursor = ChangeCursor()
+    cursor.start(db)
+    assert cursor.pending(db) == set()
+    first, second = list_car(owner), list_car(owner)
+    assert cursor.pending(db) == {first, second}
+    assert cursor.pending(db) == set()
+    # Pruned past the cursor's position: reload.
+    list_car(owner), list_car(owner)
+    db.execute("DELETE FROM search_changes WHERE id = ?", (cursor.position + 1,))
+    db.commit()
+    assert cursor.pending(db) is None
+
+
+def test_availability_sees_bookings_and_blocks_written_by_another_worker(signup, list_car, other_worker):
+    owner, renter = signup("Olive Owner"), signup("Rita Renter")
+    car_id = list_car(owner, model="Civic")
+    soon = (date.today() + timedelta(days=10)).isoformat()
+    # Past the bitmap's horizon, so the engine answers.
+    later = (date.today() + timedelta(days=400)).isoformat()
+    for day in (soon, later):
+        assert found(renter, start=day, end=day) == ["Civic"]
+
+    with other_worker:
+        other_worker.execute('''
+            INSERT INTO bookings (car_id, renter_id, start_date, end_date, status) VALUES (?, ?, ?, ?, 'confirmed')
+        ''', (car_id, renter.user_id, soon, soon))
+        other_worker.execute(
+            "INSERT INTO availability_blocks (car_id, start_date, end_date) VALUES (?, ?, ?)", (car_id, later, later)
+        )
+    for day in (soon, later):
+        assert found(renter, start=day, end=day) == []
+    response = renter.post(f"/booking/{car_id}", data=dict(start_date=soon, end_date=soon))
+    assert b"already booked" in response.data
+    response = renter.post(f"/booking/{car_id}", data=dict(start_date=later, end_date=later))
+    assert b"not available" in response.data
+
+    with other_worker:
+        other_worker.execute("DELETE FROM bookings WHERE car_id = ?", (car_id,))
+        other_worker.execute("DELETE FROM availability_blocks WHERE car_id = ?", (car_id,))
+    for day in (soon, later):
+        assert found(renter, start=day, end=day) == ["Civic"]
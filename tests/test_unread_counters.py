@@ -0,0 +1,50 @@
+import pytest
+
+from python_scripts.unread_counters import read_counters
+
+COUNTERS = {
+    "user_counters": "SELECT user_id, unread_notifications, unread_messages FROM user_counters "
+                     "WHERE unread_notifications OR unread_messages",
+}
+
+
+@pytest.mark.parametrize("fixture", ["marketplace", "pruned_marketplace"])
+def test_rebuild_counters_matches_the_triggers(request, rebuild_matches, fixture):
+    request.getfixturevalue(fixture)
+    rebuild_matches("rebuild-counters", COUNTERS)
+
+
+def test_message_counters_follow_reads(db, marketplace):
+    owner, renter, other, civic, focus, jeep = marketplace
+    # Renter's two messages were read; Other's one is still unread.
+    assert read_counters(db, owner.user_id)[1] == 1
+    assert b'Messages <span class="badge">1</span>' in owner.get("/dashboard").data
+
+
+def notify(db, user_id, count):
+    db.executemany("INSERT INTO notifications (user_id, message) VALUES (?, 'hello')", [(user_id,)] * count)
+    db.commit()
+    return db.execute("SELECT id FROM notifications WHERE user_id = ? ORDER BY id", (user_id,)).fetchall()
+
+
+def test_only_the_notifications_page_marks_notifications_read(db, signup):
+    alice = signup("Alice Adams")
+    notify(db, alice.user_id, 3)
+    assert len(alice.get("/notifications", query_string=dict(format="json")).json["items"]) == 3
+    assert read_counters(db, alice.user_id)[0] == 3
+
+    alice.get("/notifications", query_string=dict(limit=2))
+    assert read_counters(db, alice.user_id)[0] == 1
+    alice.get("/notifications")
+    assert read_counters(db, alice.user_id)[0] == 0
+
+
+def test_notifications_are_marked_read_up_to_an_id(db, signup):
+    alice, bob = signup("Alice Adams"), signup("Bob Brown")
+    ids = [row[0] for row in notify(db, alice.user_id, 3)]
+    notify(db, bob.user_id, 1)
+    assert alice.post("/mark_notifications_read", data=dict(up_to=ids[1])).status_code == 204
+    assert read_counters(db, alice.user_id)[0] == 1
+    alice.post("/mark_notifications_read")
+    assert read_counters(db, alice.user_id)[0] == 0
+    assert read_counters(db, bob.user_id)[0] == 1